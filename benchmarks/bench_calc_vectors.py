@@ -0,0 +1,86 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import KB_python.coordinate_manipulation.periodic as periodic
+
+'''
+    Benchmark for periodic.calc_vectors - frames/s and peak memory above the input arrays, against the previous
+    allocating implementation (reproduced below). Each variant runs in its own process so peak RSS isn't shared.
+
+    usage: python3 bench_calc_vectors.py --frames 200 --particles 100000
+'''
+
+VARIANTS = ('legacy', 'calc_vectors', 'calc_vectors float32', 'calc_vectors out=p_destination')
+
+
+def legacy_calc_vectors(p_origin, p_destination, boxdims):
+    ''' The implementation calc_vectors replaced, with its full size temporaries '''
+    boxdims_reshaped = boxdims[:, np.newaxis, :]
+    vecs = p_destination - p_origin
+    veclengths = np.abs(vecs)
+    vecs_gt_boxdims = veclengths > (boxdims_reshaped / 2)
+    negative_vecs = vecs < 0
+    positive_vecs = vecs > 0
+    vecs[vecs_gt_boxdims & positive_vecs] = -(boxdims_reshaped - veclengths)[vecs_gt_boxdims & positive_vecs]
+    vecs[vecs_gt_boxdims & negative_vecs] = (boxdims_reshaped - veclengths)[vecs_gt_boxdims & negative_vecs]
+    return vecs
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # linux reports kB
+
+
+def run_variant(variant, n_frames, n_particles, chunk_frames):
+    ''' Runs one variant in this process, returns a dictionary of results '''
+    rng = np.random.default_rng(0)
+    dtype = np.float32 if 'float32' in variant else np.float64
+    boxdims = np.full((n_frames, 3), 10.0)
+    # filled a frame at a time so that no full size temporaries inflate the peak before the call
+    p_origin = np.empty((n_frames, n_particles, 3), dtype=dtype)
+    p_destination = np.empty((n_frames, n_particles, 3), dtype=dtype)
+    for frame in range(n_frames):
+        p_origin[frame] = rng.uniform(0, 10, (n_particles, 3))
+        p_destination[frame] = rng.uniform(0, 10, (n_particles, 3))
+    input_mb = peak_rss_mb()
+
+    start = time.perf_counter()
+    if variant == 'legacy':
+        legacy_calc_vectors(p_origin, p_destination, boxdims)
+    elif variant == 'calc_vectors out=p_destination':
+        periodic.calc_vectors(p_origin, p_destination, boxdims, out=p_destination, chunk_frames=chunk_frames)
+    else:
+        periodic.calc_vectors(p_origin, p_destination, boxdims, chunk_frames=chunk_frames)
+    elapsed = time.perf_counter() - start
+    return {'variant': variant, 'frames_per_s': n_frames / elapsed, 'seconds': elapsed,
+            'peak_extra_mb': peak_rss_mb() - input_mb, 'output_mb': p_origin.nbytes / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--particles', type=int, default=100000)
+    parser.add_argument('--chunk-frames', type=int, default=10)
+    parser.add_argument('--variant', help=argparse.SUPPRESS)   # used for the per variant subprocesses
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.frames, args.particles, args.chunk_frames)))
+        return
+
+    print("{} frames * {} particles, chunk_frames = {}".format(args.frames, args.particles, args.chunk_frames))
+    print("{:<32s} {:>10s} {:>16s} {:>12s}".format('variant', 'frames/s', 'peak extra (MB)', 'output (MB)'))
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, __file__, '--frames', str(args.frames), '--particles',
+                                 str(args.particles), '--chunk-frames', str(args.chunk_frames), '--variant', variant],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        print("{variant:<32s} {frames_per_s:10.1f} {peak_extra_mb:16.1f} {output_mb:12.1f}".format(**result))
+
+
+if __name__ == '__main__':
+    main()
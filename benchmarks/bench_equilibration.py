@@ -0,0 +1,48 @@
+import argparse
+import time
+
+from pymbar.timeseries import detectEquilibration
+import KB_python.statistical_analysis.error_estimation as error_estimation
+
+from generators import ar1_series
+
+'''
+    Benchmark for error_estimation.detect_equilibration against pymbar.timeseries.detectEquilibration, on AR(1) series
+    with an initial relaxation. pymbar is only run up to --pymbar-max points, as its cost grows roughly quadratically.
+
+    usage: python3 bench_equilibration.py --lengths 1000 10000 100000 1000000
+'''
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--pymbar-max', type=int, default=10 ** 4, help="longest series to run pymbar on")
+    parser.add_argument('--nskip', type=int, default=100, help="grid spacing for the coarse + refine run")
+    args = parser.parse_args()
+
+    print("{:>9s} {:>12s} {:>10s} {:>9s} {:>16s} {:>22s}".format('N', 'pymbar (s)', 'fast (s)', 'speedup',
+                                                                  'coarse+refine (s)', 't0 pymbar/fast/coarse'))
+    for n_obs in args.lengths:
+        series = ar1_series(n_obs, phi=0.9, relaxation=n_obs / 20)
+        fast_time, (t0, g, _) = timed(error_estimation.detect_equilibration, series)
+        coarse_time, (coarse_t0, _, _) = timed(error_estimation.detect_equilibration, series, nskip=args.nskip)
+        if n_obs <= args.pymbar_max:
+            pymbar_time, (pymbar_t0, pymbar_g, _) = timed(detectEquilibration, series)
+            if not abs(g / pymbar_g - 1) < 1e-6:
+                raise Exception("g differs from pymbar for N = {}: {} and {}".format(n_obs, g, pymbar_g))
+            pymbar, speedup = "{:12.3f}".format(pymbar_time), "{:9.1f}".format(pymbar_time / fast_time)
+        else:
+            pymbar_t0, pymbar, speedup = '-', "{:>12s}".format('-'), "{:>9s}".format('-')
+        print("{:>9d} {} {:>10.3f} {} {:>16.3f} {:>22s}".format(n_obs, pymbar, fast_time, speedup, coarse_time,
+                                                               "{}/{}/{}".format(pymbar_t0, t0, coarse_t0)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import numpy as np
+import KB_python.statistical_analysis.error_estimation as error_estimation
+
+from generators import ar1_series
+
+'''
+    Benchmark for error_estimation.block_average_range over series lengths, with block sizes 1 to N / 10 as used by
+    check_decorrelation. Compared against the previous implementation - block_average once per block size, reproduced
+    below - for lengths up to --legacy-max, since it scales as O(N^2 / 10) Python iterations. Also times the
+    Flyvbjerg-Petersen blocking_standard_errors.
+
+    usage: python3 bench_error_estimation.py --lengths 10000 100000 1000000 10000000
+'''
+
+
+def legacy_block_average_range(data, block_range, partial_block_cutoff_size=0.5):
+    ''' The loop block_average_range replaced '''
+    bse = np.zeros(block_range.size)
+    for index, blocksize in enumerate(block_range):
+        bse[index] = error_estimation.block_average(data, blocksize,
+                                                    partial_block_cutoff_size=partial_block_cutoff_size)
+    return bse
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7])
+    parser.add_argument('--legacy-max', type=int, default=10 ** 5,
+                        help="longest series to run the legacy loop on")
+    args = parser.parse_args()
+
+    print("{:>10s} {:>12s} {:>14s} {:>14s} {:>10s} {:>14s}".format('N', 'block sizes', 'legacy (s)', 'vectorized (s)',
+                                                                  'speedup', 'blocking (s)'))
+    for n_obs in args.lengths:
+        data = ar1_series(n_obs)
+        block_range = np.arange(1, int(np.round(n_obs / 10)))
+        new_time, new_result = timed(error_estimation.block_average_range, data, block_range)
+        blocking_time, _ = timed(error_estimation.blocking_standard_errors, data)
+        if n_obs <= args.legacy_max:
+            legacy_time, legacy_result = timed(legacy_block_average_range, data, block_range)
+            if not np.allclose(new_result, legacy_result, rtol=1e-9, atol=1e-12):
+                raise Exception("vectorized and legacy results differ for N = {}".format(n_obs))
+            legacy, speedup = "{:14.3f}".format(legacy_time), "{:10.1f}".format(legacy_time / new_time)
+        else:
+            legacy, speedup = "{:>14s}".format('-'), "{:>10s}".format('-')
+        print("{:>10d} {:>12d} {} {:>14.3f} {} {:>14.4f}".format(n_obs, block_range.size, legacy, new_time, speedup,
+                                                                blocking_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import KB_python.file_io as file_io
+
+import generators
+
+'''
+    Throughput benchmark for file_io.load_large_text_file. Writes a synthetic gromacs style xvg file and reports MB/s
+    for the single pass loader, the previous two pass line by line loader (reproduced below for reference) and
+    np.loadtxt.
+
+    usage: python3 bench_load_large_text_file.py --size-mb 100 --particles 100
+'''
+
+
+def legacy_load_large_text_file(file, delimiter=' ', dtype=float, comments=('@', '#')):
+    ''' The two pass, one np.fromstring call per line implementation that load_large_text_file replaced '''
+    n_columns = 0
+    n_rows    = 0
+    with open(file, 'r') as fin:
+        for line in fin:
+            if not line[0] in comments and line.strip():
+                if not n_rows:
+                    n_columns = np.fromstring(line, sep=delimiter).size
+                n_rows += 1
+    output = np.zeros((n_rows, n_columns), dtype=dtype)
+    row = 0
+    with open(file, 'r') as fin:
+        for line in fin:
+            if not line[0] in comments and line.strip():
+                output[row] = np.fromstring(line, sep=delimiter, dtype=dtype)
+                row += 1
+    return output
+
+
+def time_call(func, *args, repeats=1, **kwargs):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=float, default=50)
+    parser.add_argument('--particles', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.xvg')
+        generators.write_xvg(path, generators.xvg_frames_for_size(args.size_mb, args.particles), args.particles)
+        size_mb = os.path.getsize(path) / 1e6
+        print("file size {:.1f} MB, {} columns".format(size_mb, 1 + 3 * args.particles))
+
+        candidates = [('load_large_text_file', lambda: file_io.load_large_text_file(path, verbose=False)),
+                      ('np.loadtxt', lambda: np.loadtxt(path, comments=('#', '@')))]
+        if not args.skip_legacy:
+            candidates.append(('legacy two pass loader', lambda: legacy_load_large_text_file(path)))
+
+        reference = None
+        for name, func in candidates:
+            elapsed, result = time_call(func, repeats=args.repeats)
+            if reference is None:
+                reference = result
+            elif not np.array_equal(reference, result):
+                print("WARNING - {} output differs from load_large_text_file".format(name))
+            print("{:<25s} {:8.2f} s {:8.1f} MB/s".format(name, elapsed, size_mb / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+
+'''
+    Deterministic synthetic data for the benchmarks - gromacs style xvg and ndx files and correlated time series. The
+    same arguments always give byte for byte the same output, so timings from different commits are measured on the
+    same inputs, and files are written a block of frames at a time so multi-GB inputs never have to fit in memory.
+
+    SCALES holds the problem sizes used by run_benchmarks.py, from seconds (small) to multi-GB files (huge).
+'''
+
+SCALES = {'small':  {'xvg_mb': 10,   'xvg_particles': 100, 'ndx_atoms': 10 ** 5, 'frames': 100,  'particles': 10000,
+                     'series_length': 10 ** 4},
+          'medium': {'xvg_mb': 100,  'xvg_particles': 100, 'ndx_atoms': 10 ** 6, 'frames': 200,  'particles': 50000,
+                     'series_length': 10 ** 5},
+          'large':  {'xvg_mb': 1000, 'xvg_particles': 300, 'ndx_atoms': 10 ** 7, 'frames': 500,  'particles': 100000,
+                     'series_length': 10 ** 6},
+          'huge':   {'xvg_mb': 4000, 'xvg_particles': 300, 'ndx_atoms': 10 ** 8, 'frames': 1000, 'particles': 200000,
+                     'series_length': 10 ** 7}}
+
+
+def ar1_series(n, phi=0.95, relaxation=None, seed=0):
+    ''' Correlated AR(1) series, x[i] = phi * x[i - 1] + noise, with an optional exponential initial relaxation.
+
+        Parameters
+            n          - length of the series
+            phi        - lag 1 autocorrelation, the integrated autocorrelation time is (1 + phi) / (1 - phi)
+            relaxation - optional decay time (in points) of an initial offset of 10, to give the series something to
+                         equilibrate from
+            seed       - random seed
+        Returns
+            series     - 1D float64 array
+    '''
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size=n)
+    try:
+        from scipy.signal import lfilter
+        series = lfilter([1.0], [1.0, -phi], noise)
+    except ImportError:
+        series = np.empty(n)
+        series[0] = noise[0]
+        for i in range(1, n):
+            series[i] = phi * series[i - 1] + noise[i]
+    if relaxation is not None:
+        series += 10 * np.exp(-np.arange(n) / relaxation)
+    return series
+
+
+def coordinates(n_frames, n_particles, box=10.0, step=0.05, seed=0, dtype=np.float64):
+    ''' Diffusing particles in a cubic periodic box - a random walk wrapped into the box, so coordinates of consecutive
+        frames are correlated like a trajectory's and vectors between particles cross the box boundaries.
+
+        Returns
+            coords  - n_frames * n_particles * 3 array, in [0, box)
+            boxdims - n_frames * 3 array of box dimensions
+    '''
+    rng = np.random.default_rng(seed)
+    coords = np.empty((n_frames, n_particles, 3), dtype=dtype)
+    position = rng.uniform(0, box, (n_particles, 3))
+    for frame in range(n_frames):
+        position += rng.normal(scale=step, size=position.shape)
+        np.mod(position, box, out=position)
+        coords[frame] = position
+    return coords, np.full((n_frames, 3), box, dtype=dtype)
+
+
+def xvg_frames_for_size(size_mb, n_particles, dims=3):
+    ''' Number of frames write_xvg needs to write to reach about size_mb megabytes '''
+    bytes_per_row = 10 + 6 * n_particles * dims   # "%.3f\t" of a coordinate in [0, 10) is 6 characters, plus the time
+    return max(1, int(size_mb * 1e6 / bytes_per_row))
+
+
+def write_xvg(path, n_frames, n_particles, dims=3, box=10.0, seed=0, block_frames=1000):
+    ''' Writes a gromacs style xvg - a header of comments and legends, then a time column and dims coordinates per
+        particle on every row - of diffusing particles. Frames are generated and formatted block_frames at a time.
+        Written to a temporary name first, so an interrupted run never leaves a truncated file behind.
+    '''
+    rng = np.random.default_rng(seed)
+    position = rng.uniform(0, box, (n_particles * dims))
+    row_format = '%.1f\t' + '\t'.join(['%.3f'] * (n_particles * dims)) + '\n'
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fout:
+        fout.write('# synthetic benchmark data, seed {}\n@    title "Coordinate"\n@    xaxis  label "Time (ps)"\n'
+                   '@TYPE xy\n'.format(seed))
+        for column in range(n_particles * dims):
+            fout.write('@ s{} legend "column {}"\n'.format(column, column))
+        for start in range(0, n_frames, block_frames):
+            n_block = min(block_frames, n_frames - start)
+            block = np.empty((n_block, 1 + n_particles * dims))
+            block[:, 0] = np.arange(start, start + n_block) * 20.0
+            for row in range(n_block):
+                position += rng.normal(scale=0.05, size=position.shape)
+                np.mod(position, box, out=position)
+                block[row, 1:] = position
+            fout.write(''.join(row_format % tuple(row) for row in block))
+    os.replace(tmp_path, path)
+
+
+def write_ndx(path, n_atoms, n_groups=10, seed=0):
+    ''' Writes a gromacs style index file with a System group of all n_atoms atoms, then n_groups groups of random
+        sorted subsets of decreasing size. Atom numbers start at 1 and are written 15 to a line, as gromacs does.
+    '''
+    rng = np.random.default_rng(seed)
+    groups = [('System', np.arange(1, n_atoms + 1))]
+    for group in range(n_groups):
+        size = max(1, n_atoms // (2 ** (group + 1)))
+        groups.append(('group_{}'.format(group), np.sort(rng.choice(n_atoms, size, replace=False)) + 1))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fout:
+        for name, indices in groups:
+            fout.write('[ {} ]\n'.format(name))
+            for start in range(0, indices.size, 150000):
+                lines = indices[start:start + 150000]
+                n_full = lines.size - lines.size % 15
+                if n_full:
+                    np.savetxt(fout, lines[:n_full].reshape(-1, 15), fmt='%6d', delimiter=' ')
+                if lines.size > n_full:
+                    np.savetxt(fout, lines[n_full:][np.newaxis, :], fmt='%6d', delimiter=' ')
+    os.replace(tmp_path, path)
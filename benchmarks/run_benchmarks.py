@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import generators
+
+'''
+    Benchmark suite for the main entry points - wall time, throughput and peak memory of each, on deterministic data
+    from generators.py, saved as JSON so runs on different commits can be compared.
+
+    Each benchmark runs in its own process, so peak memory (the rise in peak RSS over the benchmark's inputs) isn't
+    hidden by an earlier benchmark's peak, and its wall time is the best of --repeats calls. Input files are written to
+    --data-dir and reused by later runs with the same scale, which matters at the multi-GB scales.
+
+    usage: python3 run_benchmarks.py --scale small --output before.json
+           python3 run_benchmarks.py --scale small --output after.json
+           python3 run_benchmarks.py --compare before.json after.json --threshold 0.1
+
+    The compare mode exits with status 1 when any benchmark got slower, or used more memory, by more than the
+    threshold, so it can gate a CI job. bench_*.py hold the more detailed comparisons against previous implementations.
+'''
+
+
+def xvg_input(paths):
+    return paths['xvg'], os.path.getsize(paths['xvg']) / 1e6, 'MB/s'
+
+
+def bench_load_xvg(params, paths):
+    import KB_python.file_io as file_io
+    path, size_mb, unit = xvg_input(paths)
+    return lambda: file_io.load_xvg(path), size_mb, unit
+
+
+def bench_load_large_text_file(params, paths):
+    import KB_python.file_io as file_io
+    path, size_mb, unit = xvg_input(paths)
+    return lambda: file_io.load_large_text_file(path, verbose=False), size_mb, unit
+
+
+def bench_load_gromacs_index(params, paths):
+    import KB_python.file_io as file_io
+    path = paths['ndx']
+    return lambda: file_io.load_gromacs_index(path), os.path.getsize(path) / 1e6, 'MB/s'
+
+
+def bench_calc_vectors(params, paths):
+    import KB_python.coordinate_manipulation.periodic as periodic
+    coords, boxdims = generators.coordinates(params['frames'], params['particles'])
+    destination = np.roll(coords, 1, axis=1)
+    out = np.empty_like(coords)
+    return lambda: periodic.calc_vectors(coords, destination, boxdims, out=out), params['frames'], 'frames/s'
+
+
+def bench_compute_angles(params, paths):
+    import KB_python.coordinate_manipulation.angles as angles
+    coords, boxdims = generators.coordinates(params['frames'], params['particles'])
+    # a chain through every particle
+    triples = np.column_stack([np.arange(params['particles'] - 2) + offset for offset in range(3)])
+    out = np.empty((params['frames'], triples.shape[0]))
+    return lambda: angles.compute_angles(coords, triples, boxdims=boxdims, out=out), params['frames'], 'frames/s'
+
+
+def bench_compute_dihedrals(params, paths):
+    import KB_python.coordinate_manipulation.angles as angles
+    coords, boxdims = generators.coordinates(params['frames'], params['particles'])
+    quads = np.column_stack([np.arange(params['particles'] - 3) + offset for offset in range(4)])
+    out = np.empty((params['frames'], quads.shape[0]))
+    return lambda: angles.compute_dihedrals(coords, quads, boxdims=boxdims, out=out), params['frames'], 'frames/s'
+
+
+def bench_block_average_range(params, paths):
+    import KB_python.statistical_analysis.error_estimation as error_estimation
+    series = generators.ar1_series(params['series_length'])
+    block_range = np.arange(1, int(np.round(series.size / 10)))
+    return lambda: error_estimation.block_average_range(series, block_range), series.size, 'points/s'
+
+
+def bench_detect_equilibration(params, paths):
+    import KB_python.statistical_analysis.error_estimation as error_estimation
+    series = generators.ar1_series(params['series_length'], phi=0.9, relaxation=params['series_length'] / 20)
+    return lambda: error_estimation.detect_equilibration(series), series.size, 'points/s'
+
+
+BENCHMARKS = {'load_xvg': bench_load_xvg,
+              'load_large_text_file': bench_load_large_text_file,
+              'load_gromacs_index': bench_load_gromacs_index,
+              'calc_vectors': bench_calc_vectors,
+              'compute_angles': bench_compute_angles,
+              'compute_dihedrals': bench_compute_dihedrals,
+              'block_average_range': bench_block_average_range,
+              'detect_equilibration': bench_detect_equilibration}
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # linux reports kB
+
+
+def prepare_files(scale, data_dir):
+    ''' Writes the input files of a scale to data_dir, unless an earlier run already has. Returns a dict of paths '''
+    params = generators.SCALES[scale]
+    os.makedirs(data_dir, exist_ok=True)
+    n_frames = generators.xvg_frames_for_size(params['xvg_mb'], params['xvg_particles'])
+    paths = {'xvg': os.path.join(data_dir, 'bench_{}f_{}p.xvg'.format(n_frames, params['xvg_particles'])),
+             'ndx': os.path.join(data_dir, 'bench_{}a.ndx'.format(params['ndx_atoms']))}
+    if not os.path.exists(paths['xvg']):
+        print("writing {}".format(paths['xvg']), file=sys.stderr)
+        generators.write_xvg(paths['xvg'], n_frames, params['xvg_particles'])
+    if not os.path.exists(paths['ndx']):
+        print("writing {}".format(paths['ndx']), file=sys.stderr)
+        generators.write_ndx(paths['ndx'], params['ndx_atoms'])
+    return paths
+
+
+def run_benchmark(name, scale, paths, repeats):
+    ''' Runs one benchmark in this process, returns a dictionary of results '''
+    func, amount, unit = BENCHMARKS[name](generators.SCALES[scale], paths)
+    input_mb = peak_rss_mb()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {'seconds': best, 'seconds_all': times, 'throughput': amount / best, 'unit': unit,
+            'peak_mb': peak_rss_mb() - input_mb}
+
+
+def metadata(scale, repeats):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'scale': scale, 'repeats': repeats, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def run_suite(scale, names, data_dir, repeats):
+    paths = prepare_files(scale, data_dir)
+    results = {}
+    print("{:<24s} {:>10s} {:>18s} {:>12s}".format('benchmark', 'time (s)', 'throughput', 'peak (MB)'))
+    for name in names:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--scale', scale, '--repeats',
+                                 str(repeats), '--single', name, '--paths', json.dumps(paths)],
+                                check=True, capture_output=True, text=True).stdout
+        results[name] = json.loads(output)
+        print("{:<24s} {seconds:10.3f} {throughput:11.1f} {unit:<6s} {peak_mb:12.1f}".format(name, **results[name]))
+    return {'metadata': metadata(scale, repeats), 'results': results}
+
+
+def compare(baseline_file, current_file, threshold):
+    ''' Prints the time and peak memory ratios of two result files. Returns the names of benchmarks that regressed '''
+    with open(baseline_file) as fin:
+        baseline = json.load(fin)
+    with open(current_file) as fin:
+        current = json.load(fin)
+    if not baseline['metadata']['scale'] == current['metadata']['scale']:
+        print("WARNING - comparing scale {} with scale {}".format(baseline['metadata']['scale'],
+                                                                 current['metadata']['scale']))
+
+    regressions = []
+    print("{:<24s} {:>10s} {:>10s} {:>8s} {:>12s} {:>12s}".format('benchmark', 'base (s)', 'new (s)', 'ratio',
+                                                                   'base (MB)', 'new (MB)'))
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        old, new = baseline['results'][name], current['results'][name]
+        ratio = new['seconds'] / old['seconds']
+        # peak memory below 10 MB is mostly noise from the allocator
+        memory_regressed = new['peak_mb'] > max(old['peak_mb'] * (1 + threshold), old['peak_mb'] + 10)
+        flag = ''
+        if ratio > 1 + threshold or memory_regressed:
+            regressions.append(name)
+            flag = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print("{:<24s} {:10.3f} {:10.3f} {:8.2f} {:12.1f} {:12.1f}  {}".format(name, old['seconds'], new['seconds'],
+                                                                              ratio, old['peak_mb'], new['peak_mb'],
+                                                                              flag))
+    for name in sorted(set(baseline['results']) ^ set(current['results'])):
+        print("{:<24s} only in {}".format(name, baseline_file if name in baseline['results'] else current_file))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(generators.SCALES), default='small')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--data-dir', help="where input files are written and reused. Defaults to a temporary directory")
+    parser.add_argument('--output', help="JSON file to save results to")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="compare two result files")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument('--single', help=argparse.SUPPRESS)   # used for the per benchmark subprocesses
+    parser.add_argument('--paths', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_benchmark(args.single, args.scale, json.loads(args.paths), args.repeats)))
+        return
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if args.data_dir:
+        report = run_suite(args.scale, args.benchmarks, args.data_dir, args.repeats)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            report = run_suite(args.scale, args.benchmarks, data_dir, args.repeats)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
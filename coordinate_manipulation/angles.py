@@ -1,4 +1,7 @@
 import numpy as np
+
+from .periodic import _minimum_image_inplace
+from ..instrumentation import instrument
 '''
     Functions for calculating angles, dihedrals planes
 '''
@@ -57,4 +60,104 @@ def dihedralFromPoints(p1, p2, p3, p4):
     return dihedralFromVectors(v1, v2, v3)
 
 
-print(__name__)
+@instrument(frames=lambda call: call['coords'].shape[0])
+def compute_angles(coords, triples, boxdims=None, out=None, chunk_frames=100):
+    ''' Calculates bond angles for a whole trajectory, directly from the coordinates and a list of particle index
+        triples, without building per-angle coordinate arrays first. The angle is the one at the middle particle, the
+        same as angleFromVectors(p1 - p2, p3 - p2). Uses atan2(|v1 x v2|, v1 . v2), which needs no normalization and
+        stays accurate near 0 and pi, where arccos does not.
+
+        Parameters
+            coords       - n_frames * n_particles * 3 coordinate array
+            triples      - n_angles * 3 integer array of particle indices
+            boxdims      - optional n_frames * 3 array of box dimensions. If given, bond vectors are minimum imaged
+            out          - optional n_frames * n_angles array to write into
+            chunk_frames - number of frames processed at once, which sets the size of the temporary arrays
+        Returns
+            angles       - n_frames * n_angles array of angles in radians, between 0 and pi
+    '''
+    triples = _check_topology_input(coords, triples, 3, boxdims)
+    out = _check_output(coords, triples, out)
+    for chunk, vectors in _iter_bond_vectors(coords, triples, boxdims, chunk_frames):
+        v1, v2 = vectors
+        cross = np.cross(v1, v2)
+        # the bond vectors are p2 - p1 and p3 - p2, the angle is between p1 - p2 and p3 - p2, so the dot product flips
+        np.arctan2(np.sqrt(_dot(cross, cross)), -_dot(v1, v2), out=out[chunk])
+    return out
+
+
+@instrument(frames=lambda call: call['coords'].shape[0])
+def compute_dihedrals(coords, quads, boxdims=None, out=None, chunk_frames=100):
+    ''' Calculates dihedral angles for a whole trajectory, directly from the coordinates and a list of particle index
+        quadruplets, with the same sign convention as dihedralFromPoints. With b1, b2, b3 the bond vectors and
+        n1 = b1 x b2, n2 = b2 x b3, the angle is atan2(-|b2| b1 . n2, n1 . n2) - only |b2| is needed, none of the
+        vectors are normalized.
+
+        Parameters
+            coords       - n_frames * n_particles * 3 coordinate array
+            quads        - n_dihedrals * 4 integer array of particle indices
+            boxdims      - optional n_frames * 3 array of box dimensions. If given, bond vectors are minimum imaged
+            out          - optional n_frames * n_dihedrals array to write into
+            chunk_frames - number of frames processed at once, which sets the size of the temporary arrays
+        Returns
+            dihedrals    - n_frames * n_dihedrals array of angles in radians, between -pi and pi
+    '''
+    quads = _check_topology_input(coords, quads, 4, boxdims)
+    out = _check_output(coords, quads, out)
+    for chunk, vectors in _iter_bond_vectors(coords, quads, boxdims, chunk_frames):
+        b1, b2, b3 = vectors
+        n2 = np.cross(b2, b3)
+        y = _dot(b1, n2)
+        y *= -np.sqrt(_dot(b2, b2))
+        np.arctan2(y, _dot(np.cross(b1, b2), n2), out=out[chunk])
+    return out
+
+
+def _check_topology_input(coords, indices, n_per_tuple, boxdims):
+    if not coords.ndim == 3 or not coords.shape[2] == 3:
+        raise ValueError("coordinates should be nframes * nparticles * 3, coords shape = {}".format(coords.shape))
+    indices = np.asarray(indices)
+    if not indices.ndim == 2 or not indices.shape[1] == n_per_tuple:
+        raise ValueError("expected n * {} particle indices, got shape {}".format(n_per_tuple, indices.shape))
+    if indices.size and (indices.min() < 0 or indices.max() >= coords.shape[1]):
+        raise ValueError("particle indices out of range for {} particles".format(coords.shape[1]))
+    if boxdims is not None and not boxdims.shape == (coords.shape[0], 3):
+        raise ValueError("boxdims shape {} does not match coordinates shape {}".format(boxdims.shape, coords.shape))
+    return indices
+
+
+def _check_output(coords, indices, out):
+    shape = (coords.shape[0], indices.shape[0])
+    if out is None:
+        return np.empty(shape, dtype=np.result_type(coords.dtype, np.float32))
+    if not out.shape == shape:
+        raise ValueError("output shape {} does not match expected shape {}".format(out.shape, shape))
+    return out
+
+
+def _iter_bond_vectors(coords, indices, boxdims, chunk_frames):
+    ''' Yields (frame slice, bond vectors) per chunk of frames, with bond vectors from each particle of a tuple to
+        the next. The vector buffers are reused between chunks.
+    '''
+    n_chunk = min(chunk_frames, coords.shape[0])
+    dtype = np.result_type(coords.dtype, np.float32)
+    buffers = np.empty((indices.shape[1], n_chunk, indices.shape[0], 3), dtype=dtype)
+    mask = np.empty(buffers.shape[1:], dtype=bool)
+    for start in range(0, coords.shape[0], chunk_frames):
+        chunk = slice(start, start + chunk_frames)
+        frames = coords[chunk]
+        n_frames = frames.shape[0]
+        # buffers[i] holds the positions of particle i of each tuple, then is turned into the vector to particle i + 1
+        for position in range(indices.shape[1]):
+            np.take(frames, indices[:, position], axis=1, out=buffers[position, :n_frames])
+        vectors = buffers[:-1, :n_frames]
+        for position in range(indices.shape[1] - 1):
+            np.subtract(buffers[position + 1, :n_frames], vectors[position], out=vectors[position])
+        if boxdims is not None:
+            for vecs in vectors:
+                _minimum_image_inplace(vecs, boxdims[chunk, np.newaxis, :], mask=mask[:n_frames])
+        yield chunk, vectors
+
+
+def _dot(a, b):
+    return np.einsum('...i,...i->...', a, b)
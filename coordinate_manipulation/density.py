@@ -0,0 +1,126 @@
+import numpy as np
+
+from .transformations import cart2pol, cart2spherical
+from ..instrumentation import instrument
+
+'''
+    Number density maps in cylindrical (theta, rho, z) and spherical (theta, rho, phi) coordinates, eg around a membrane
+    protein axis. Trajectories are added a chunk of frames at a time - each chunk is converted with cart2pol or
+    cart2spherical and binned straight away, so converted coordinates only ever exist for one chunk. Maps from chunks
+    processed separately (eg on different cores) are combined with merge.
+'''
+
+
+class _DensityGrid:
+    ''' Shared counting, merging and normalization for the density maps. Subclasses provide _convert and _bin_volumes '''
+
+    def __init__(self, edges, periodic_axes):
+        self.edges = tuple(np.asarray(axis_edges, dtype=float) for axis_edges in edges)
+        self.periodic_axes = periodic_axes
+        self.shape = tuple(axis_edges.size - 1 for axis_edges in self.edges)
+        self.counts = np.zeros(self.shape, dtype=np.int64)
+        self.n_frames = 0
+
+    @instrument(frames=lambda call: call['coords'].shape[0])
+    def update(self, coords, centers=None):
+        ''' Adds a chunk of frames to the map.
+
+            Parameters
+                coords  - n_frames * n_particles * 3 coordinate array
+                centers - optional n_frames * 3 array of per frame reference points (eg a protein center of mass) to
+                          subtract from the coordinates before conversion. Alternatively a single 3 vector
+        '''
+        if not coords.ndim == 3 or not coords.shape[2] == 3:
+            raise ValueError("coordinates should be nframes * nparticles * 3, coords shape = {}".format(coords.shape))
+        if centers is not None:
+            centers = np.asarray(centers)
+            if centers.ndim == 2:
+                if not centers.shape == (coords.shape[0], 3):
+                    raise ValueError("centers shape {} does not match coordinates shape {}".format(centers.shape,
+                                                                                                  coords.shape))
+                centers = centers[:, np.newaxis, :]
+            coords = coords - centers
+
+        in_range = np.ones(coords.shape[:2], dtype=bool)
+        flat_bins = np.zeros(coords.shape[:2], dtype=np.int64)
+        for axis, values in enumerate(self._convert(coords)):
+            axis_edges = self.edges[axis]
+            n_bins = axis_edges.size - 1
+            width = (axis_edges[-1] - axis_edges[0]) / n_bins
+            bins = np.floor((values - axis_edges[0]) / width).astype(np.int64)
+            if axis in self.periodic_axes:
+                np.mod(bins, n_bins, out=bins)
+            else:
+                in_range &= (bins >= 0) & (bins < n_bins)
+            flat_bins *= n_bins
+            flat_bins += bins
+        self.counts += np.bincount(flat_bins[in_range], minlength=self.counts.size).reshape(self.shape)
+        self.n_frames += coords.shape[0]
+
+    def merge(self, other):
+        ''' Adds the counts of another map with the same grid to this one. Returns self '''
+        if not type(self) is type(other) or not all(np.array_equal(mine, theirs) for mine, theirs in
+                                                    zip(self.edges, other.edges)):
+            raise ValueError("can't merge density maps with different grids")
+        self.counts += other.counts
+        self.n_frames += other.n_frames
+        return self
+
+    def density(self):
+        ''' Average number density in each bin - counts per frame divided by the bin volume '''
+        if not self.n_frames:
+            raise Exception("no frames have been added to the density map")
+        return self.counts / (self.n_frames * self._bin_volumes())
+
+    @property
+    def bin_centers(self):
+        return tuple((axis_edges[1:] + axis_edges[:-1]) / 2 for axis_edges in self.edges)
+
+
+class CylindricalDensity(_DensityGrid):
+    ''' Density map over (theta, rho, z), with the cylinder axis along z.
+
+        Parameters
+            r_max   - largest radial distance binned
+            z_range - (z_min, z_max) binned, relative to the center if one is given
+            n_theta - number of angular bins over -pi to pi
+            n_rho   - number of radial bins from 0 to r_max
+            n_z     - number of bins along z
+    '''
+
+    def __init__(self, r_max, z_range, n_theta=36, n_rho=50, n_z=50):
+        super().__init__((np.linspace(-np.pi, np.pi, n_theta + 1), np.linspace(0, r_max, n_rho + 1),
+                          np.linspace(z_range[0], z_range[1], n_z + 1)), periodic_axes=(0,))
+
+    def _convert(self, coords):
+        return cart2pol(coords)
+
+    def _bin_volumes(self):
+        theta_edges, rho_edges, z_edges = self.edges
+        return (np.diff(theta_edges)[:, np.newaxis, np.newaxis] * np.diff(rho_edges ** 2)[np.newaxis, :, np.newaxis] /
+                2 * np.diff(z_edges)[np.newaxis, np.newaxis, :])
+
+
+class SphericalDensity(_DensityGrid):
+    ''' Density map over (theta, rho, phi) - azimuth, distance from the origin and polar angle from the z axis.
+
+        Parameters
+            r_max   - largest radial distance binned
+            n_theta - number of azimuthal bins over -pi to pi
+            n_rho   - number of radial bins from 0 to r_max
+            n_phi   - number of polar bins over 0 to pi
+    '''
+
+    def __init__(self, r_max, n_theta=36, n_rho=50, n_phi=18):
+        super().__init__((np.linspace(-np.pi, np.pi, n_theta + 1), np.linspace(0, r_max, n_rho + 1),
+                          np.linspace(0, np.pi, n_phi + 1)), periodic_axes=(0,))
+
+    def _convert(self, coords):
+        theta, rho, phi = cart2spherical(coords)
+        # a particle exactly at the origin has no polar angle, put it in the first bin rather than dropping it
+        return theta, rho, np.nan_to_num(phi, nan=0.0)
+
+    def _bin_volumes(self):
+        theta_edges, rho_edges, phi_edges = self.edges
+        return (np.diff(theta_edges)[:, np.newaxis, np.newaxis] * np.diff(rho_edges ** 3)[np.newaxis, :, np.newaxis] /
+                3 * -np.diff(np.cos(phi_edges))[np.newaxis, np.newaxis, :])
@@ -0,0 +1,148 @@
+import concurrent.futures
+import itertools
+
+import numpy as np
+
+from .periodic import _minimum_image_inplace
+from ..instrumentation import instrument
+
+'''
+    Neighbor searching under periodic boundaries with a cell list. Particles are binned into cells at least one cutoff
+    wide, so only particles in the same or adjacent cells need to be compared, and the cost grows linearly with the
+    number of particles at constant density rather than with the number of pairs. Uses the same box convention as
+    periodic.calc_vectors - rectangular boxes given as n_frames * n_dimensions box lengths - and the same minimum image
+    vectors.
+'''
+
+
+@instrument(frames=lambda call: call['coords'].shape[0])
+def neighbor_pairs(coords, boxdims, cutoff, group_a=None, group_b=None, return_vectors=False, workers=1,
+                   chunk_frames=100):
+    ''' Finds all pairs of particles closer than cutoff, frame by frame.
+
+        Parameters
+            coords         - n_frames * n_particles * n_dimensions coordinate array
+            boxdims        - n_frames * n_dimensions array of box dimensions
+            cutoff         - pair distance cutoff. Must be at most half the smallest box dimension
+            group_a        - optional array of particle indices. Without group_b, pairs within this group are found
+            group_b        - optional array of particle indices. With group_a, pairs between the groups are found
+            return_vectors - also return the minimum image vectors from the first to the second particle of each pair
+            workers        - number of processes to split frames between
+            chunk_frames   - frames per job when running in parallel
+        Returns
+            pair_list      - list with one entry per frame, a tuple of
+                                pairs     - n_pairs * 2 array of particle indices. Within a single set of particles
+                                            each pair is listed once, with pairs[:, 0] < pairs[:, 1]
+                                distances - n_pairs array of distances
+                                vectors   - (if return_vectors) n_pairs * n_dimensions array
+    '''
+    if not coords.ndim == 3:
+        raise ValueError("coordinates should be nframes * nparticles * ndims, coords shape = {}".format(coords.shape))
+    if not boxdims.shape == (coords.shape[0], coords.shape[2]):
+        raise ValueError("boxdims shape {} does not match coordinates shape {}".format(boxdims.shape, coords.shape))
+    if cutoff > boxdims.min() / 2:
+        raise ValueError("cutoff {} is more than half the smallest box dimension {}".format(cutoff, boxdims.min()))
+    if group_b is not None and group_a is None:
+        raise ValueError("group_b needs a group_a to pair with")
+
+    jobs = [(coords[start:start + chunk_frames], boxdims[start:start + chunk_frames], cutoff, group_a, group_b,
+             return_vectors) for start in range(0, coords.shape[0], chunk_frames)]
+    if workers == 1 or len(jobs) == 1:
+        results = map(_neighbor_pairs_job, jobs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_neighbor_pairs_job, jobs))
+    return [frame_pairs for job_pairs in results for frame_pairs in job_pairs]
+
+
+def _neighbor_pairs_job(job):
+    coords, boxdims, cutoff, group_a, group_b, return_vectors = job
+    frame_results = []
+    for frame_coords, box in zip(coords, boxdims):
+        if group_a is None:
+            pairs, vectors = frame_neighbor_pairs(frame_coords, box, cutoff)
+        elif group_b is None:
+            group_a = np.asarray(group_a)
+            pairs, vectors = frame_neighbor_pairs(frame_coords[group_a], box, cutoff)
+            pairs = group_a[pairs]
+        else:
+            group_a, group_b = np.asarray(group_a), np.asarray(group_b)
+            pairs, vectors = frame_neighbor_pairs(frame_coords[group_a], box, cutoff, frame_coords[group_b])
+            pairs = np.column_stack((group_a[pairs[:, 0]], group_b[pairs[:, 1]]))
+            # a particle in both groups isn't its own neighbor
+            not_self = pairs[:, 0] != pairs[:, 1]
+            pairs, vectors = pairs[not_self], vectors[not_self]
+        distances = np.sqrt((vectors ** 2).sum(axis=1))
+        frame_results.append((pairs, distances, vectors) if return_vectors else (pairs, distances))
+    return frame_results
+
+
+def frame_neighbor_pairs(positions, box, cutoff, positions_b=None):
+    ''' Cell list search for a single frame.
+
+        Parameters
+            positions   - n_particles * n_dimensions array
+            box         - n_dimensions array of box dimensions
+            cutoff      - pair distance cutoff, at most half the smallest box dimension
+            positions_b - optional second set of positions. If given, pairs are between positions and positions_b,
+                          otherwise within positions
+        Returns
+            pairs       - n_pairs * 2 array of indices, into positions and positions_b (or positions) respectively.
+                          Sorted by the first then second index
+            vectors     - n_pairs * n_dimensions array of minimum image vectors from the first to the second particle
+    '''
+    box = np.asarray(box, dtype=float)
+    same_set = positions_b is None
+    if same_set:
+        positions_b = positions
+    n_dims = box.size
+
+    # at least 1 cell per dimension, each at least a cutoff wide
+    n_cells = np.maximum((box // cutoff).astype(int), 1)
+    cell_size = box / n_cells
+    cells_a = _cell_indices(positions, cell_size, n_cells)
+    cells_b = cells_a if same_set else _cell_indices(positions_b, cell_size, n_cells)
+
+    # particles of b sorted by cell, with the start and count of each cell
+    flat_b = np.ravel_multi_index(cells_b.T, n_cells)
+    order_b = np.argsort(flat_b, kind='stable')
+    counts = np.bincount(flat_b, minlength=np.prod(n_cells))
+    starts = np.cumsum(counts) - counts
+
+    # the 3 ** n_dims neighboring cell offsets, without repeats when there are fewer than 3 cells along a dimension
+    offsets = np.unique(np.mod(np.array(list(itertools.product((-1, 0, 1), repeat=n_dims))), n_cells), axis=0)
+
+    all_i, all_j, all_vectors = [], [], []
+    for offset in offsets:
+        neighbor_cells = np.ravel_multi_index(((cells_a + offset) % n_cells).T, n_cells)
+        n_candidates = counts[neighbor_cells]
+        total = n_candidates.sum()
+        if not total:
+            continue
+        i = np.repeat(np.arange(positions.shape[0]), n_candidates)
+        # position of each candidate within its cell's run of order_b
+        within_cell = np.arange(total) - np.repeat(np.cumsum(n_candidates) - n_candidates, n_candidates)
+        j = order_b[np.repeat(starts[neighbor_cells], n_candidates) + within_cell]
+        if same_set:
+            keep = i < j
+            i, j = i[keep], j[keep]
+        # filter each offset's candidates as they're made, so only one offset's worth is held at a time
+        vectors = positions_b[j] - positions[i]
+        _minimum_image_inplace(vectors, box)
+        within = np.einsum('ij,ij->i', vectors, vectors) <= cutoff ** 2
+        all_i.append(i[within])
+        all_j.append(j[within])
+        all_vectors.append(vectors[within])
+
+    if not all_i:
+        return np.zeros((0, 2), dtype=int), np.zeros((0, n_dims))
+    i = np.concatenate(all_i)
+    j = np.concatenate(all_j)
+    order = np.lexsort((j, i))
+    return np.column_stack((i[order], j[order])), np.concatenate(all_vectors)[order]
+
+
+def _cell_indices(positions, cell_size, n_cells):
+    ''' n_particles * n_dimensions integer cell coordinates, for positions wrapped into the box '''
+    cells = np.floor(positions / cell_size).astype(int) % n_cells
+    return cells
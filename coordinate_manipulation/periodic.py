@@ -1,5 +1,7 @@
 import numpy as np
 
+from ..instrumentation import instrument
+
 '''
     Contains scripts relating to calculating simulation observables while accounting for periodic boundaries. The most
     import one is calculating vectors, as most other things (distances, angles) etc can be derived from them.
@@ -7,7 +9,8 @@ import numpy as np
 '''
 
 
-def calc_vectors(p_origin, p_destination, boxdims):
+@instrument(frames=lambda call: call['p_origin'].shape[0])
+def calc_vectors(p_origin, p_destination, boxdims, out=None, chunk_frames=1000):
     """
         MDtraj has functionality for computing distances but it's not always applicable to every dataset, and distances
         contain no directonality. This function will calculate vectors for coordinates, taking into account the box
@@ -15,10 +18,16 @@ def calc_vectors(p_origin, p_destination, boxdims):
 
         Note that this will only calculate vectors within 1 periodic image!
 
+        Works in place on the output, chunk_frames frames at a time, so the only temporary memory is a boolean mask the
+        size of one chunk. float32 input gives float32 output.
+
         Parameters
             p_origin      - n_frames * n_particles * n_dimensions coordinate array
             p_destination - n_frames * n_particles * n_dimensions coordinate array - same size as p_origin
             boxdims       - n_frames * n_dimensions array of box dimensions
+            out           - optional n_frames * n_particles * n_dimensions array to write the vectors into. May be
+                            p_destination or p_origin itself
+            chunk_frames  - number of frames processed at once
 
         Returns
             vecs -n_frames * n_particles * n_dimensions array
@@ -36,24 +45,34 @@ def calc_vectors(p_origin, p_destination, boxdims):
     if not p_origin.shape[2] == boxdims.shape[1]:  # mismatch between dimensionality
         raise ValueError("Mismatch between number of dimensions in coordinates ({}) and boxdims ({})".format(
                          p_origin.shape[2], boxdims.shape[1]))
+    if out is None:
+        out = np.empty(p_origin.shape, dtype=np.result_type(p_origin, p_destination))
+    elif not out.shape == p_origin.shape:
+        raise ValueError("output shape {} does not match coordinate shape {}".format(out.shape, p_origin.shape))
 
-    boxdims_reshaped = boxdims[:, np.newaxis, :]  # allows broadcasting
-    boxdims_midpoint = boxdims_reshaped / 2
-    vecs = p_destination - p_origin
-    veclengths = np.abs(vecs)
-
-    # these are the vectors who's periodic image are closer than the original vecotor
-    vecs_gt_boxdims = veclengths >  (boxdims_midpoint)  # these positions will be changed
-
-    # boolean arrays for identifying closest periodic image - based on vector direction instead of
-    # place in box, which might not be centered on (0, 0, 0)
-    negative_vecs = vecs < 0
-    positive_vecs = vecs > 0
-
-    # for positive vectors greater than half the box, use previous periodic image
-    vecs[vecs_gt_boxdims & positive_vecs] = -(boxdims_reshaped - veclengths)[vecs_gt_boxdims & positive_vecs]
+    mask = np.empty((min(chunk_frames, p_origin.shape[0]),) + p_origin.shape[1:], dtype=bool)
+    for start in range(0, p_origin.shape[0], chunk_frames):
+        chunk = slice(start, start + chunk_frames)
+        vecs = out[chunk]
+        np.subtract(p_destination[chunk], p_origin[chunk], out=vecs)
+        _minimum_image_inplace(vecs, boxdims[chunk, np.newaxis, :], mask=mask[:vecs.shape[0]])
+    return out
 
-    # for negative vectors greater than half the box, use next periodic image.
-    vecs[vecs_gt_boxdims & negative_vecs] = (boxdims_reshaped - veclengths)[vecs_gt_boxdims & negative_vecs]
 
+def _minimum_image_inplace(vecs, box, mask=None):
+    '''
+        Moves vectors longer than half the box along any dimension into the neighbouring periodic image, in place. box
+        must broadcast against vecs. Positive vectors greater than half the box use the previous periodic image,
+        negative ones the next - based on vector direction instead of place in box, which might not be centered on
+        (0, 0, 0). v - box and v + box are the same floating point operations as -(box - |v|) and (box - |v|), so
+        results are identical to computing those explicitly.
+    '''
+    if mask is None:
+        mask = np.empty(vecs.shape, dtype=bool)
+    half_box = box / 2
+    np.greater(vecs, half_box, out=mask)
+    np.subtract(vecs, box, out=vecs, where=mask)
+    # a vector moved by the first step is now > -half_box, so is not moved back
+    np.less(vecs, -half_box, out=mask)
+    np.add(vecs, box, out=vecs, where=mask)
     return vecs
@@ -0,0 +1,141 @@
+import concurrent.futures
+
+import numpy as np
+
+from . import neighbors
+from ..instrumentation import instrument
+
+'''
+    Pair distance histograms and radial distribution functions, accumulated a chunk of frames at a time. Only the pairs
+    within the histogram range of a single frame are ever held, found with the cell list in neighbors.py and using the
+    same minimum image convention as periodic.calc_vectors, so memory does not grow with trajectory length or with the
+    total number of pairs. Histograms from different chunks, files or processes are combined with merge.
+'''
+
+
+class PairDistanceHistogram:
+    ''' Accumulates a histogram of pair distances from 0 to r_max, and the normalization needed to turn it into g(r).
+
+        Parameters
+            r_max   - largest distance binned. Must be at most half the smallest box dimension of every frame
+            n_bins  - number of equal width bins between 0 and r_max
+            group_a - optional array of particle indices. Without group_b, pairs within this group are counted
+            group_b - optional array of particle indices. With group_a, pairs between the two groups are counted
+    '''
+
+    def __init__(self, r_max, n_bins=100, group_a=None, group_b=None):
+        if group_b is not None and group_a is None:
+            raise ValueError("group_b needs a group_a to pair with")
+        self.r_max = r_max
+        self.n_bins = n_bins
+        self.edges = np.linspace(0, r_max, n_bins + 1)
+        self.group_a = None if group_a is None else np.asarray(group_a)
+        self.group_b = None if group_b is None else np.asarray(group_b)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.n_frames = 0
+        self.n_dims = None
+        # sum over frames of (number of distinct pairs / box volume), the ideal gas pair density
+        self.pair_density_sum = 0.0
+
+    @property
+    def bin_centers(self):
+        return (self.edges[1:] + self.edges[:-1]) / 2
+
+    @instrument(frames=lambda call: call['coords'].shape[0])
+    def update(self, coords, boxdims):
+        ''' Adds a chunk of frames to the histogram.
+
+            Parameters
+                coords  - n_frames * n_particles * n_dimensions coordinate array (2 or 3 dimensions)
+                boxdims - n_frames * n_dimensions array of box dimensions
+        '''
+        if not coords.ndim == 3:
+            raise ValueError("coordinates should be nframes * nparticles * ndims, coords shape = {}".format(
+                coords.shape))
+        if coords.shape[2] not in (2, 3):
+            raise ValueError("only 2D and 3D coordinates are supported, got {} dimensions".format(coords.shape[2]))
+        if not boxdims.shape == (coords.shape[0], coords.shape[2]):
+            raise ValueError("boxdims shape {} does not match coordinates shape {}".format(boxdims.shape, coords.shape))
+        if self.n_dims is not None and coords.shape[2] != self.n_dims:
+            raise ValueError("histogram holds {}D data, got {}D coordinates".format(self.n_dims, coords.shape[2]))
+        n_pairs = self._n_distinct_pairs(coords.shape[1])
+        bin_width = self.r_max / self.n_bins
+        for frame in range(coords.shape[0]):
+            # one frame at a time, so at most one frame's worth of pairs exists at once
+            _, distances = neighbors.neighbor_pairs(coords[frame:frame + 1], boxdims[frame:frame + 1], self.r_max,
+                                                    group_a=self.group_a, group_b=self.group_b)[0]
+            bins = (distances / bin_width).astype(np.int64)
+            self.counts += np.bincount(bins[bins < self.n_bins], minlength=self.n_bins)
+        self.n_frames += coords.shape[0]
+        self.pair_density_sum += (n_pairs / np.prod(boxdims, axis=1)).sum()
+        self.n_dims = coords.shape[2]
+
+    def merge(self, other):
+        ''' Adds the counts of another histogram with the same bins and groups to this one. Returns self '''
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("can't merge histograms with different bins")
+        for mine, theirs in ((self.group_a, other.group_a), (self.group_b, other.group_b)):
+            if (mine is None) != (theirs is None) or (mine is not None and not np.array_equal(mine, theirs)):
+                raise ValueError("can't merge histograms of different groups")
+        if self.n_dims is None:
+            self.n_dims = other.n_dims
+        elif other.n_dims is not None and self.n_dims != other.n_dims:
+            raise ValueError("can't merge histograms of {}D and {}D data".format(self.n_dims, other.n_dims))
+        self.counts += other.counts
+        self.n_frames += other.n_frames
+        self.pair_density_sum += other.pair_density_sum
+        return self
+
+    def rdf(self):
+        ''' Returns g(r) at the bin centers - the pair counts relative to an ideal gas at the same density. Frames with
+            different box sizes are weighted by their own density.
+        '''
+        if not self.n_frames:
+            raise Exception("no frames have been added to the histogram")
+        if self.n_dims == 3:
+            shell_volumes = 4 / 3 * np.pi * (self.edges[1:] ** 3 - self.edges[:-1] ** 3)
+        else:
+            shell_volumes = np.pi * (self.edges[1:] ** 2 - self.edges[:-1] ** 2)
+        return self.counts / (shell_volumes * self.pair_density_sum)
+
+    def _n_distinct_pairs(self, n_particles):
+        if self.group_a is None:
+            return n_particles * (n_particles - 1) / 2
+        if self.group_b is None:
+            return self.group_a.size * (self.group_a.size - 1) / 2
+        # a particle in both groups isn't paired with itself
+        n_shared = np.intersect1d(self.group_a, self.group_b).size
+        return self.group_a.size * self.group_b.size - n_shared
+
+
+@instrument(frames=lambda call: call['coords'].shape[0])
+def compute_rdf(coords, boxdims, r_max, n_bins=100, group_a=None, group_b=None, workers=1, chunk_frames=1000):
+    ''' Accumulates a PairDistanceHistogram over a trajectory, splitting frames between worker processes.
+
+        Parameters
+            coords       - n_frames * n_particles * n_dimensions coordinate array
+            boxdims      - n_frames * n_dimensions array of box dimensions
+            r_max, n_bins, group_a, group_b - see PairDistanceHistogram
+            workers      - number of processes
+            chunk_frames - frames per job
+        Returns
+            histogram    - PairDistanceHistogram, call .rdf() and .bin_centers for g(r)
+    '''
+    histogram = PairDistanceHistogram(r_max, n_bins=n_bins, group_a=group_a, group_b=group_b)
+    jobs = [(coords[start:start + chunk_frames], boxdims[start:start + chunk_frames], r_max, n_bins, group_a, group_b)
+            for start in range(0, coords.shape[0], chunk_frames)]
+    if workers == 1 or len(jobs) == 1:
+        results = map(_rdf_job, jobs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_rdf_job, jobs))
+    for partial in results:
+        histogram.merge(partial)
+    return histogram
+
+
+def _rdf_job(job):
+    coords, boxdims, r_max, n_bins, group_a, group_b = job
+    histogram = PairDistanceHistogram(r_max, n_bins=n_bins, group_a=group_a, group_b=group_b)
+    histogram.update(coords, boxdims)
+    return histogram
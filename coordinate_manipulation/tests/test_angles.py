@@ -59,5 +59,52 @@ class test_dihedralFromVectors(unittest.TestCase):
         self.assertAlmostEqual(angles.dihedralFromVectors(v1, v2, v3), - np.pi / 2)
 
 
+class test_compute_angles_and_dihedrals(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.boxdims = np.array([[4.0, 4.5, 5.0]] * 6)
+        # chains of small steps, so no bond is longer than half the box
+        steps = rng.uniform(-0.3, 0.3, size=(6, 40, 3))
+        self.coords = 2 + np.cumsum(steps, axis=1)
+        self.quads = np.array([np.arange(i, i + 4) for i in range(0, 36, 2)])
+        self.triples = np.array([np.arange(i, i + 3) for i in range(0, 37, 3)])
+
+    def test_dihedrals_match_dihedralFromPoints(self):
+        c = self.coords
+        q = self.quads
+        expected = angles.dihedralFromPoints(c[:, q[:, 0]], c[:, q[:, 1]], c[:, q[:, 2]], c[:, q[:, 3]])
+        np.testing.assert_allclose(angles.compute_dihedrals(c, q), expected, atol=1e-10)
+        np.testing.assert_allclose(angles.compute_dihedrals(c, q, chunk_frames=4), expected, atol=1e-10)
+
+    def test_angles_match_angleFromVectors(self):
+        c = self.coords
+        t = self.triples
+        expected = angles.angleFromVectors(c[:, t[:, 0]] - c[:, t[:, 1]], c[:, t[:, 2]] - c[:, t[:, 1]])
+        np.testing.assert_allclose(angles.compute_angles(c, t), expected, atol=1e-10)
+
+    def test_periodic_wrapping(self):
+        # wrapping particles into the box splits molecules, which the minimum image has to undo
+        wrapped = self.coords % self.boxdims[:, np.newaxis, :]
+        self.assertFalse(np.allclose(wrapped, self.coords))
+        np.testing.assert_allclose(angles.compute_dihedrals(wrapped, self.quads, self.boxdims),
+                                   angles.compute_dihedrals(self.coords, self.quads), atol=1e-10)
+        np.testing.assert_allclose(angles.compute_angles(wrapped, self.triples, self.boxdims),
+                                   angles.compute_angles(self.coords, self.triples), atol=1e-10)
+
+    def test_output_array(self):
+        out = np.zeros((6, self.quads.shape[0]), dtype=np.float32)
+        result = angles.compute_dihedrals(self.coords.astype(np.float32), self.quads, out=out, chunk_frames=5)
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, angles.compute_dihedrals(self.coords, self.quads), atol=1e-5)
+
+    def test_bad_input_exceptions(self):
+        self.assertRaises(ValueError, angles.compute_dihedrals, self.coords[0], self.quads)
+        self.assertRaises(ValueError, angles.compute_dihedrals, self.coords, self.triples)
+        self.assertRaises(ValueError, angles.compute_dihedrals, self.coords, self.quads + 10)
+        self.assertRaises(ValueError, angles.compute_dihedrals, self.coords, self.quads, self.boxdims[:2])
+        self.assertRaises(ValueError, angles.compute_angles, self.coords, self.triples, out=np.zeros((6, 2)))
+
+
 if __name__ == '__main__':
     unittest.main()
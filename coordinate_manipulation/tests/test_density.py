@@ -0,0 +1,66 @@
+import numpy as np
+import unittest
+import KB_python.coordinate_manipulation.density as density
+import KB_python.coordinate_manipulation.transformations as transformations
+
+
+class test_cylindrical_density(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(21)
+        self.coords = rng.uniform(-3, 3, size=(10, 500, 3))
+        self.centers = rng.uniform(-0.5, 0.5, size=(10, 3))
+
+    def test_matches_histogramdd(self):
+        grid = density.CylindricalDensity(2.5, (-2, 2), n_theta=12, n_rho=5, n_z=8)
+        grid.update(self.coords, self.centers)
+        theta, rho, z = transformations.cart2pol(self.coords - self.centers[:, np.newaxis, :])
+        expected = np.histogramdd(np.column_stack((theta.ravel(), rho.ravel(), z.ravel())), bins=grid.edges)[0]
+        np.testing.assert_array_equal(grid.counts, expected)
+        self.assertEqual(grid.n_frames, 10)
+
+    def test_uniform_density(self):
+        rng = np.random.default_rng(3)
+        coords = rng.uniform(-3, 3, size=(50, 2000, 3))
+        grid = density.CylindricalDensity(3, (-3, 3), n_theta=4, n_rho=3, n_z=3)
+        grid.update(coords)
+        np.testing.assert_allclose(grid.density(), 2000 / 6 ** 3, rtol=0.05)
+
+    def test_chunked_and_merged(self):
+        whole, first, second = [density.CylindricalDensity(2.5, (-2, 2), n_theta=12, n_rho=5, n_z=8)
+                                for _ in range(3)]
+        whole.update(self.coords, self.centers)
+        first.update(self.coords[:4], self.centers[:4])
+        second.update(self.coords[4:], self.centers[4:])
+        first.merge(second)
+        np.testing.assert_array_equal(first.counts, whole.counts)
+        np.testing.assert_allclose(first.density(), whole.density())
+        self.assertRaises(ValueError, whole.merge, density.CylindricalDensity(2.5, (-2, 2), n_theta=6))
+        self.assertRaises(ValueError, whole.merge, density.SphericalDensity(2.5))
+
+    def test_exceptions(self):
+        grid = density.CylindricalDensity(2.5, (-2, 2))
+        self.assertRaises(Exception, grid.density)
+        self.assertRaises(ValueError, grid.update, self.coords[0])
+        self.assertRaises(ValueError, grid.update, self.coords, self.centers[:3])
+
+
+class test_spherical_density(unittest.TestCase):
+
+    def test_matches_histogramdd(self):
+        rng = np.random.default_rng(8)
+        coords = rng.uniform(-3, 3, size=(6, 400, 3))
+        center = np.array([0.2, -0.1, 0.3])
+        grid = density.SphericalDensity(2.5, n_theta=8, n_rho=5, n_phi=6)
+        grid.update(coords, center)
+        theta, rho, phi = transformations.cart2spherical(coords - center)
+        expected = np.histogramdd(np.column_stack((theta.ravel(), rho.ravel(), phi.ravel())), bins=grid.edges)[0]
+        np.testing.assert_array_equal(grid.counts, expected)
+
+    def test_bin_volumes_fill_sphere(self):
+        grid = density.SphericalDensity(2.0, n_theta=8, n_rho=5, n_phi=6)
+        self.assertAlmostEqual(grid._bin_volumes().sum(), 4 / 3 * np.pi * 2.0 ** 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import numpy as np
+import unittest
+import KB_python.coordinate_manipulation.neighbors as neighbors
+import KB_python.coordinate_manipulation.periodic as periodic
+
+
+def brute_force_pairs(positions, box, cutoff, positions_b=None):
+    ''' All pairs within cutoff by comparing every pair, for checking the cell list '''
+    same_set = positions_b is None
+    if same_set:
+        positions_b = positions
+    i, j = np.meshgrid(np.arange(positions.shape[0]), np.arange(positions_b.shape[0]), indexing='ij')
+    i, j = i.ravel(), j.ravel()
+    if same_set:
+        keep = i < j
+        i, j = i[keep], j[keep]
+    vecs = periodic.calc_vectors(positions[np.newaxis, i], positions_b[np.newaxis, j], box[np.newaxis, :])[0]
+    within = np.sqrt((vecs ** 2).sum(axis=1)) <= cutoff
+    return np.column_stack((i[within], j[within])), vecs[within]
+
+
+class test_frame_neighbor_pairs(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.box = np.array([5.0, 6.0, 7.0])
+        # some particles outside the primary box, which should be wrapped
+        self.positions = rng.uniform(-2, 9, size=(300, 3))
+        self.positions_b = rng.uniform(0, 7, size=(150, 3))
+
+    def test_matches_brute_force(self):
+        for cutoff in (0.4, 1.1, 2.5):
+            pairs, vecs = neighbors.frame_neighbor_pairs(self.positions, self.box, cutoff)
+            ref_pairs, ref_vecs = brute_force_pairs(self.positions, self.box, cutoff)
+            np.testing.assert_array_equal(pairs, ref_pairs)
+            np.testing.assert_allclose(vecs, ref_vecs)
+
+    def test_two_sets_match_brute_force(self):
+        pairs, vecs = neighbors.frame_neighbor_pairs(self.positions, self.box, 1.2, self.positions_b)
+        ref_pairs, ref_vecs = brute_force_pairs(self.positions, self.box, 1.2, self.positions_b)
+        np.testing.assert_array_equal(pairs, ref_pairs)
+        np.testing.assert_allclose(vecs, ref_vecs)
+
+    def test_2D(self):
+        pairs, vecs = neighbors.frame_neighbor_pairs(self.positions[:, :2], self.box[:2], 0.7)
+        ref_pairs, ref_vecs = brute_force_pairs(self.positions[:, :2], self.box[:2], 0.7)
+        np.testing.assert_array_equal(pairs, ref_pairs)
+        np.testing.assert_allclose(vecs, ref_vecs)
+
+    def test_no_pairs(self):
+        pairs, vecs = neighbors.frame_neighbor_pairs(np.array([[0.0, 0, 0], [2.5, 2.5, 2.5]]), self.box, 1)
+        self.assertEqual(pairs.shape, (0, 2))
+        self.assertEqual(vecs.shape, (0, 3))
+
+
+class test_neighbor_pairs(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.boxdims = np.array([[5.0, 5.0, 5.0], [5.5, 5.0, 4.5], [4.0, 6.0, 5.0], [5.0, 5.0, 6.0]])
+        self.coords = rng.uniform(0, 4, size=(4, 200, 3))
+
+    def test_bad_input_exceptions(self):
+        self.assertRaises(ValueError, neighbors.neighbor_pairs, self.coords[0], self.boxdims, 1)
+        self.assertRaises(ValueError, neighbors.neighbor_pairs, self.coords, self.boxdims[:2], 1)
+        self.assertRaises(ValueError, neighbors.neighbor_pairs, self.coords, self.boxdims, 2.1)
+        self.assertRaises(ValueError, neighbors.neighbor_pairs, self.coords, self.boxdims, 1, None, np.arange(3))
+
+    def test_per_frame_results(self):
+        result = neighbors.neighbor_pairs(self.coords, self.boxdims, 1.0, return_vectors=True, chunk_frames=3)
+        self.assertEqual(len(result), 4)
+        for frame, (pairs, distances, vecs) in enumerate(result):
+            ref_pairs, ref_vecs = brute_force_pairs(self.coords[frame], self.boxdims[frame], 1.0)
+            np.testing.assert_array_equal(pairs, ref_pairs)
+            np.testing.assert_allclose(distances, np.sqrt((ref_vecs ** 2).sum(axis=1)))
+
+    def test_groups(self):
+        group_a = np.arange(0, 200, 2)
+        group_b = np.arange(50, 150)
+        within_a = neighbors.neighbor_pairs(self.coords, self.boxdims, 1.0, group_a=group_a)
+        between = neighbors.neighbor_pairs(self.coords, self.boxdims, 1.0, group_a=group_a, group_b=group_b)
+        for frame in range(4):
+            ref_pairs, _ = brute_force_pairs(self.coords[frame, group_a], self.boxdims[frame], 1.0)
+            np.testing.assert_array_equal(within_a[frame][0], group_a[ref_pairs])
+            ref_pairs, _ = brute_force_pairs(self.coords[frame, group_a], self.boxdims[frame], 1.0,
+                                             self.coords[frame, group_b])
+            ref_pairs = np.column_stack((group_a[ref_pairs[:, 0]], group_b[ref_pairs[:, 1]]))
+            ref_pairs = ref_pairs[ref_pairs[:, 0] != ref_pairs[:, 1]]
+            np.testing.assert_array_equal(between[frame][0], ref_pairs)
+
+    def test_parallel_matches_serial(self):
+        serial = neighbors.neighbor_pairs(self.coords, self.boxdims, 1.0)
+        parallel = neighbors.neighbor_pairs(self.coords, self.boxdims, 1.0, workers=2, chunk_frames=1)
+        for (pairs, distances), (p_pairs, p_distances) in zip(serial, parallel):
+            np.testing.assert_array_equal(pairs, p_pairs)
+            np.testing.assert_array_equal(distances, p_distances)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,19 @@ import unittest
 import KB_python.coordinate_manipulation.periodic as periodic
 
 
+def reference_calc_vectors(p_origin, p_destination, boxdims):
+    ''' The original, allocating implementation of calc_vectors, that the in place version has to match exactly '''
+    boxdims_reshaped = boxdims[:, np.newaxis, :]
+    vecs = p_destination - p_origin
+    veclengths = np.abs(vecs)
+    vecs_gt_boxdims = veclengths > (boxdims_reshaped / 2)
+    negative_vecs = vecs < 0
+    positive_vecs = vecs > 0
+    vecs[vecs_gt_boxdims & positive_vecs] = -(boxdims_reshaped - veclengths)[vecs_gt_boxdims & positive_vecs]
+    vecs[vecs_gt_boxdims & negative_vecs] = (boxdims_reshaped - veclengths)[vecs_gt_boxdims & negative_vecs]
+    return vecs
+
+
 class test_calc_vectors(unittest.TestCase):
     def test_coordinate_mismatch_exceptions(self):
         cp = np.ones((10, 20, 3))
@@ -47,6 +60,38 @@ class test_calc_vectors(unittest.TestCase):
         self.assertAlmostEqual(vecs_prev_pi[0, 0, 0], -1.6)
         self.assertAlmostEqual(vecs_next_pi[1, 1, 1], 1.1)   # 2nd frame, 9.5 size
 
+    def test_matches_reference_exactly(self):
+        rng = np.random.default_rng(0)
+        boxdims = rng.uniform(5, 10, (25, 3))
+        p_origin = rng.uniform(-3, 13, (25, 40, 3))
+        p_destination = rng.uniform(-3, 13, (25, 40, 3))
+        expected = reference_calc_vectors(p_origin, p_destination, boxdims)
+        for chunk_frames in (1, 7, 1000):
+            vecs = periodic.calc_vectors(p_origin, p_destination, boxdims, chunk_frames=chunk_frames)
+            np.testing.assert_array_equal(vecs, expected)
+
+    def test_float32_matches_reference_exactly(self):
+        rng = np.random.default_rng(1)
+        boxdims = rng.uniform(5, 10, (10, 3))
+        p_origin = rng.uniform(0, 10, (10, 30, 3)).astype(np.float32)
+        p_destination = rng.uniform(0, 10, (10, 30, 3)).astype(np.float32)
+        vecs = periodic.calc_vectors(p_origin, p_destination, boxdims, chunk_frames=3)
+        self.assertEqual(vecs.dtype, np.float32)
+        np.testing.assert_array_equal(vecs, reference_calc_vectors(p_origin, p_destination, boxdims))
+
+    def test_out_buffer(self):
+        rng = np.random.default_rng(2)
+        boxdims = np.full((6, 3), 4.0)
+        p_origin = rng.uniform(0, 4, (6, 5, 3))
+        p_destination = rng.uniform(0, 4, (6, 5, 3))
+        expected = reference_calc_vectors(p_origin, p_destination, boxdims)
+        out = np.empty_like(p_origin)
+        self.assertIs(periodic.calc_vectors(p_origin, p_destination, boxdims, out=out, chunk_frames=4), out)
+        np.testing.assert_array_equal(out, expected)
+        periodic.calc_vectors(p_origin, p_destination, boxdims, out=p_destination)   # in place over the input
+        np.testing.assert_array_equal(p_destination, expected)
+        self.assertRaises(ValueError, periodic.calc_vectors, p_origin, p_origin, boxdims, out=np.empty((6, 5, 2)))
+
 
 if __name__ == '__main__':
     unittest.main()
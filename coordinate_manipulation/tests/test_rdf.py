@@ -0,0 +1,80 @@
+import numpy as np
+import unittest
+import KB_python.coordinate_manipulation.rdf as rdf
+import KB_python.coordinate_manipulation.periodic as periodic
+
+
+def brute_force_histogram(coords, boxdims, edges, group_a=None, group_b=None):
+    ''' Histogram of all pair distances, building the full frames * pairs distance matrix '''
+    n_particles = coords.shape[1]
+    if group_a is None:
+        group_a = np.arange(n_particles)
+    if group_b is None:
+        i, j = np.triu_indices(group_a.size, k=1)
+        i, j = group_a[i], group_a[j]
+    else:
+        i, j = np.meshgrid(group_a, group_b, indexing='ij')
+        i, j = i.ravel(), j.ravel()
+        i, j = i[i != j], j[i != j]
+    vecs = periodic.calc_vectors(coords[:, i], coords[:, j], boxdims)
+    return np.histogram(np.sqrt((vecs ** 2).sum(axis=2)), bins=edges)[0]
+
+
+class test_pair_distance_histogram(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.boxdims = np.array([[4.0, 4.0, 4.0], [4.2, 4.0, 3.8], [4.0, 4.4, 4.1]])
+        self.coords = rng.uniform(0, 4, size=(3, 150, 3))
+
+    def test_matches_brute_force(self):
+        histogram = rdf.PairDistanceHistogram(1.5, n_bins=30)
+        histogram.update(self.coords, self.boxdims)
+        np.testing.assert_array_equal(histogram.counts, brute_force_histogram(self.coords, self.boxdims,
+                                                                              histogram.edges))
+
+    def test_groups_match_brute_force(self):
+        group_a, group_b = np.arange(0, 150, 3), np.arange(60, 120)
+        histogram = rdf.PairDistanceHistogram(1.5, n_bins=30, group_a=group_a, group_b=group_b)
+        histogram.update(self.coords, self.boxdims)
+        np.testing.assert_array_equal(histogram.counts, brute_force_histogram(self.coords, self.boxdims,
+                                                                              histogram.edges, group_a, group_b))
+
+    def test_chunked_and_merged_match_single_update(self):
+        whole = rdf.PairDistanceHistogram(1.5, n_bins=30)
+        whole.update(self.coords, self.boxdims)
+        chunked = rdf.PairDistanceHistogram(1.5, n_bins=30)
+        chunked.update(self.coords[:1], self.boxdims[:1])
+        chunked.update(self.coords[1:], self.boxdims[1:])
+        merged = rdf.PairDistanceHistogram(1.5, n_bins=30)
+        other = rdf.PairDistanceHistogram(1.5, n_bins=30)
+        merged.update(self.coords[:2], self.boxdims[:2])
+        other.update(self.coords[2:], self.boxdims[2:])
+        merged.merge(other)
+        for histogram in (chunked, merged):
+            np.testing.assert_array_equal(histogram.counts, whole.counts)
+            self.assertEqual(histogram.n_frames, 3)
+            np.testing.assert_allclose(histogram.rdf(), whole.rdf())
+
+    def test_merge_mismatch_exceptions(self):
+        histogram = rdf.PairDistanceHistogram(1.5, n_bins=30)
+        self.assertRaises(ValueError, histogram.merge, rdf.PairDistanceHistogram(1.5, n_bins=20))
+        self.assertRaises(ValueError, histogram.merge, rdf.PairDistanceHistogram(1.5, n_bins=30, group_a=[1, 2]))
+
+    def test_ideal_gas_rdf_is_one(self):
+        rng = np.random.default_rng(2)
+        boxdims = np.full((20, 3), 5.0)
+        coords = rng.uniform(0, 5, size=(20, 400, 3))
+        histogram = rdf.PairDistanceHistogram(2.0, n_bins=10)
+        histogram.update(coords, boxdims)
+        np.testing.assert_allclose(histogram.rdf(), 1, atol=0.05)
+
+    def test_compute_rdf_parallel(self):
+        serial = rdf.compute_rdf(self.coords, self.boxdims, 1.5, n_bins=30)
+        parallel = rdf.compute_rdf(self.coords, self.boxdims, 1.5, n_bins=30, workers=2, chunk_frames=1)
+        np.testing.assert_array_equal(serial.counts, parallel.counts)
+        np.testing.assert_allclose(serial.rdf(), parallel.rdf())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,5 +34,88 @@ class test_cart2pol(unittest.TestCase):
         self.assertAlmostEqual(theta[3], - np.pi / 2)  # goes negative after pi
 
 
+def random_rotations(rng, n):
+    q = rng.normal(size=(n, 3, 3))
+    rotations = np.linalg.qr(q)[0]
+    # proper rotations only
+    rotations[np.linalg.det(rotations) < 0, :, 0] *= -1
+    return rotations
+
+
+def reference_superpose_frame(frame, reference):
+    ''' Single frame Kabsch fit, the textbook way '''
+    p = frame - frame.mean(axis=0)
+    q = reference - reference.mean(axis=0)
+    u, _, vt = np.linalg.svd(p.T @ q)
+    d = np.sign(np.linalg.det(u @ vt))
+    rotation = u @ np.diag([1, 1, d]) @ vt
+    return p @ rotation + reference.mean(axis=0)
+
+
+class test_cart2spherical(unittest.TestCase):
+
+    def test_trajectory_input(self):
+        coords = np.random.default_rng(0).normal(size=(4, 10, 3))
+        theta, rho, phi = transformations.cart2spherical(coords)
+        self.assertEqual(theta.shape, (4, 10))
+        for frame in range(4):
+            frame_values = transformations.cart2spherical(coords[frame])
+            for values, expected in zip((theta, rho, phi), frame_values):
+                np.testing.assert_array_equal(values[frame], expected)
+
+    def test_dimension_exceptions(self):
+        self.assertRaises(ValueError, transformations.cart2spherical, np.zeros((3, 2)))
+        self.assertRaises(ValueError, transformations.cart2spherical, np.zeros(3))
+
+
+class test_superpose(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(12)
+        self.reference = rng.normal(scale=2, size=(30, 3))
+        noise = rng.normal(scale=0.1, size=(25, 30, 3))
+        rotations = random_rotations(rng, 25)
+        shifts = rng.uniform(-5, 5, size=(25, 1, 3))
+        self.coords = np.matmul(self.reference + noise, rotations) + shifts
+
+    def test_recovers_rigid_motion(self):
+        rng = np.random.default_rng(1)
+        moved = np.matmul(self.reference, random_rotations(rng, 4)) + 3
+        aligned, rmsd, rmsf = transformations.superpose(moved, self.reference)
+        np.testing.assert_allclose(aligned, np.broadcast_to(self.reference, moved.shape), atol=1e-10)
+        np.testing.assert_allclose(rmsd, 0, atol=1e-10)
+        np.testing.assert_allclose(rmsf, 0, atol=1e-10)
+
+    def test_matches_per_frame_fit(self):
+        aligned, rmsd, rmsf = transformations.superpose(self.coords, self.reference, chunk_frames=7)
+        expected = np.array([reference_superpose_frame(frame, self.reference) for frame in self.coords])
+        np.testing.assert_allclose(aligned, expected, atol=1e-10)
+        np.testing.assert_allclose(rmsd, np.sqrt(((expected - self.reference) ** 2).sum(axis=2).mean(axis=1)))
+        np.testing.assert_allclose(rmsf, np.sqrt(((expected - expected.mean(axis=0)) ** 2).sum(axis=2).mean(axis=0)))
+
+    def test_fit_indices(self):
+        fit = np.arange(0, 30, 2)
+        aligned, rmsd, _ = transformations.superpose(self.coords, self.reference, fit_indices=fit)
+        for frame, aligned_frame in zip(self.coords, aligned):
+            p = frame - frame[fit].mean(axis=0)
+            fit_only = reference_superpose_frame(frame[fit], self.reference[fit])
+            # the rotation found from the fit atoms is applied to every atom
+            rotation = np.linalg.lstsq(p[fit], fit_only - self.reference[fit].mean(axis=0), rcond=None)[0]
+            np.testing.assert_allclose(aligned_frame, p @ rotation + self.reference[fit].mean(axis=0), atol=1e-8)
+
+    def test_in_place_and_default_reference(self):
+        expected, expected_rmsd, _ = transformations.superpose(self.coords, self.coords[0])
+        coords = self.coords.copy()
+        aligned, rmsd, _ = transformations.superpose(coords, out=coords, chunk_frames=4)
+        self.assertIs(aligned, coords)
+        np.testing.assert_allclose(coords, expected)
+        np.testing.assert_allclose(rmsd, expected_rmsd)
+
+    def test_shape_exceptions(self):
+        self.assertRaises(ValueError, transformations.superpose, self.coords[0])
+        self.assertRaises(ValueError, transformations.superpose, self.coords, self.reference[:5])
+        self.assertRaises(ValueError, transformations.superpose, self.coords, out=np.zeros((3, 30, 3)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,7 @@
 import numpy as np
 
+from ..instrumentation import instrument
+
 
 def cart2pol(cart_coords):
     ''' Converts cartesian to polar coordinates. Acts on first 2 columns (xy)
@@ -30,19 +32,99 @@ def cart2spherical(cart_coords):
     ''' Converts cartesian to spherical coordinates.
 
         Parameters -
-            cart_coords - n_parts * 3 array
+            cart_coords - n_parts * 3 or n_frames * n_parts * 3 array
         returns
-            theta - n_parts, - range is -pi to pi
-            rho   - n_parts, radial coordinates
-            phi   - n_parts  - range is 0 to pi
+            theta - n_parts (or n_frames * n_parts), - range is -pi to pi
+            rho   - n_parts (or n_frames * n_parts), radial coordinates
+            phi   - n_parts (or n_frames * n_parts) - range is 0 to pi
     '''
 
     # input validation
-    if len(cart_coords.shape) is not 2 or cart_coords.shape[1] is not 3:
-        raise ValueError("dimension mismatch, expected (n_particles * 3), got {}".format(cart_coords.shape))
+    if cart_coords.ndim not in (2, 3) or cart_coords.shape[-1] != 3:
+        raise ValueError("dimension mismatch, expected (n_particles * 3) or (n_frames * n_particles * 3), got {}".format(
+                         cart_coords.shape))
 
-    x, y, z = cart_coords[:, 0], cart_coords[:, 1], cart_coords[:, 2]
+    x, y, z = cart_coords[..., 0], cart_coords[..., 1], cart_coords[..., 2]
     theta    = np.arctan2(y, x)
     rho  = np.sqrt(x ** 2 + y ** 2 + z ** 2)
     phi = np.arccos(z / rho)
     return (theta, rho, phi)
+
+
+@instrument(frames=lambda call: call['coords'].shape[0])
+def superpose(coords, reference=None, fit_indices=None, out=None, chunk_frames=1000):
+    ''' Aligns every frame of a trajectory onto a reference structure with the Kabsch algorithm - minimizing RMSD by
+        translation and rotation. Frames are handled in chunks, with the covariance matrices of a chunk built with one
+        einsum and decomposed with one batched np.linalg.svd call, rather than one SVD per frame.
+
+        For trajectories larger than memory, coords and out can be np.memmap arrays, and out can be coords itself to
+        align in place. RMSD and RMSF are collected in the same pass.
+
+        Parameters
+            coords       - n_frames * n_atoms * 3 coordinate array
+            reference    - n_atoms * 3 reference structure. Defaults to the first frame
+            fit_indices  - optional array of atom indices (eg a gromacs index group) to fit on. All atoms are moved,
+                           but only these determine the fit and the RMSD
+            out          - optional n_frames * n_atoms * 3 array for the aligned coordinates. May be coords
+            chunk_frames - number of frames processed at once
+        Returns
+            aligned      - n_frames * n_atoms * 3 aligned coordinates
+            rmsd         - n_frames array, RMSD of the fit atoms to the reference after fitting
+            rmsf         - n_atoms array, root mean square fluctuation of each aligned atom about its average position
+    '''
+    if not coords.ndim == 3 or not coords.shape[2] == 3:
+        raise ValueError("coordinates should be nframes * natoms * 3, coords shape = {}".format(coords.shape))
+    reference = np.array(coords[0] if reference is None else reference, dtype=float)
+    if not reference.shape == coords.shape[1:]:
+        raise ValueError("reference shape {} does not match coordinate shape {}".format(reference.shape,
+                                                                                         coords.shape))
+    if out is None:
+        out = np.empty(coords.shape, dtype=np.result_type(coords.dtype, np.float32))
+    elif not out.shape == coords.shape:
+        raise ValueError("output shape {} does not match coordinate shape {}".format(out.shape, coords.shape))
+    fit = slice(None) if fit_indices is None else np.asarray(fit_indices)
+
+    ref_fit = reference[fit]
+    ref_centroid = ref_fit.mean(axis=0)
+    ref_fit = ref_fit - ref_centroid
+
+    rmsd = np.empty(coords.shape[0])
+    # running mean and sum of squared deviations of every atom, merged chunk by chunk (Chan et al.)
+    mean_positions = np.zeros(coords.shape[1:])
+    sq_deviations = np.zeros(coords.shape[1])
+    n_done = 0
+    for start in range(0, coords.shape[0], chunk_frames):
+        chunk = slice(start, start + chunk_frames)
+        centered = np.array(coords[chunk], dtype=float)
+        centered -= centered[:, fit].mean(axis=1)[:, np.newaxis, :]
+        rotations = _kabsch_rotations(centered[:, fit], ref_fit)
+        aligned = np.matmul(centered, rotations)
+        aligned += ref_centroid
+        out[chunk] = aligned
+
+        deviations = aligned[:, fit] - reference[fit]
+        rmsd[chunk] = np.sqrt(np.einsum('fai,fai->f', deviations, deviations) / deviations.shape[1])
+
+        n_chunk = aligned.shape[0]
+        chunk_mean = aligned.mean(axis=0)
+        aligned -= chunk_mean
+        delta = chunk_mean - mean_positions
+        n_total = n_done + n_chunk
+        sq_deviations += np.einsum('fai,fai->a', aligned, aligned)
+        sq_deviations += (delta ** 2).sum(axis=1) * n_done * n_chunk / n_total
+        mean_positions += delta * n_chunk / n_total
+        n_done = n_total
+    rmsf = np.sqrt(sq_deviations / n_done)
+    return out, rmsd, rmsf
+
+
+def _kabsch_rotations(mobile, reference):
+    ''' Rotation matrices, n_frames * 3 * 3, that best map each centered n_atoms * 3 mobile frame onto the centered
+        reference, to be applied to row vectors as mobile @ R
+    '''
+    covariance = np.einsum('fai,aj->fij', mobile, reference)
+    u, _, vt = np.linalg.svd(covariance)
+    # flip the last singular vector where the best orthogonal transform is a reflection
+    reflections = np.linalg.det(u) * np.linalg.det(vt) < 0
+    u[reflections, :, 2] *= -1
+    return np.matmul(u, vt)
@@ -1,5 +1,17 @@
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+
 import numpy as np
 
+from . import instrumentation
+
 
 def xvg_2_coords(xvg_input, dims, return_time_data=False):
     '''
@@ -14,7 +26,10 @@ def xvg_2_coords(xvg_input, dims, return_time_data=False):
         return reshaped_data
 
 
-def load_xvg(file, comments=('#', '@'), dims=3, return_time_data=False):
+@instrumentation.instrument(nbytes=lambda call: _file_size(call['file']),
+                            frames=lambda call: _n_frames(call['result']))
+def load_xvg(file, comments=('#', '@'), dims=3, return_time_data=False, cache=False, particles=None,
+             index_file=None):
     ''' Loads an xvg file, created from gromacs. For a typical gromacs-derived xvg giving information on
         n particles with m dimensions to the data, the format is c1=time, c2 to c2 + m = data on first particle, and
         so on. Each row is a time point. Will throw out time point unless specified
@@ -24,85 +39,652 @@ def load_xvg(file, comments=('#', '@'), dims=3, return_time_data=False):
             comments         - comments to ignore from header. "#" and "@" typically handle it
             dims             - dimensions of data. Ie for every particle, how many pieces of information
             return_time_data - boolean. If true, returns a tuple of (data, time)
+            cache            - False, True or a cache directory. When set, the parsed file is saved as a binary sidecar
+                               and memory mapped (read only) on later loads instead of being parsed. True puts the
+                               cache in a .xvg_cache directory next to the file. See clear_cache and evict_cache
+            particles        - optional particle selection, either a list of particle indices (starting at 0) or the
+                               name of a group in index_file. Only the columns of the selected particles are parsed
+                               and kept, in selection order
+            index_file       - path to a gromacs index file, or a dictionary from load_gromacs_index. Needed when
+                               particles is a group name
         Returns
             data             - nframes * nparticles * ndims
             times            - (optional) nframes array of times, same units as in xvg file
     '''
+    columns = None
+    if particles is not None:
+        columns = _particle_columns(particles, dims, _count_columns(file, comments), index_file=index_file)
 
-    data = np.loadtxt(file, dtype=float, comments=comments)
-    if (data.shape[1] - 1) % dims > 0:
-        raise ValueError("(dims * n_particles) + 1 does not equal number of columns in xvg")
+    def parse():
+        if columns is not None:
+            return load_large_text_file(file, verbose=False, comments=comments, columns=columns)
+        data = np.loadtxt(file, dtype=float, comments=comments)
+        if (data.shape[1] - 1) % dims > 0:
+            raise ValueError("(dims * n_particles) + 1 does not equal number of columns in xvg")
+        return data
+
+    options = ('load_xvg', tuple(comments), dims, None if columns is None else tuple(columns.tolist()))
+    data = _cached_load(file, cache, options, parse)
 
     return xvg_2_coords(data, dims, return_time_data=return_time_data)
 
 
-def load_large_text_file(file, delimiter=' ', verbose=True, dtype=float, comments=('@', '#')):
+def iter_xvg(file, dims=3, chunk_frames=10000, comments=('#', '@'), dtype=float, particles=None, index_file=None):
+    ''' Streaming version of load_xvg. Rather than loading the whole file, yields blocks of at most chunk_frames frames,
+        so memory use is set by the chunk size and not by the length of the file. Each block is shaped like the output
+        of xvg_2_coords, so analyses can consume a trajectory one block at a time in a single pass.
+
+        Parameters
+            file         - path to xvg file
+            dims         - dimensions of data. Ie for every particle, how many pieces of information
+            chunk_frames - maximum number of frames (rows) per yielded block. The last block may be smaller
+            comments     - lines starting with these characters are skipped
+            dtype        - numpy dtype of yielded arrays
+            particles    - optional particle selection, see load_xvg
+            index_file   - see load_xvg
+        Yields
+            coords       - chunk_frames * nparticles * ndims
+            times        - chunk_frames array of times, same units as in xvg file
     '''
-        Numpy.loadtxt has some memory problems on large files. This function will likely be slow but is more memory
-        efficient. Loops through file twice - once to get dimensions, another to load array
+    if chunk_frames < 1:
+        raise ValueError("chunk_frames must be at least 1, got {}".format(chunk_frames))
+    columns = None
+    if particles is not None:
+        columns = _particle_columns(particles, dims, _count_columns(file, comments), index_file=index_file)
+    pending = []
+    n_pending = 0
+    for block in _iter_text_blocks(file, dtype=dtype, comments=comments, columns=columns):
+        if not pending and (block.shape[1] - 1) % dims > 0:
+            raise ValueError("(dims * n_particles) + 1 does not equal number of columns in xvg")
+        pending.append(block)
+        n_pending += block.shape[0]
+        if n_pending < chunk_frames:
+            continue
+        data = np.concatenate(pending) if len(pending) > 1 else pending[0]
+        n_full = (n_pending // chunk_frames) * chunk_frames
+        for start in range(0, n_full, chunk_frames):
+            yield xvg_2_coords(data[start:start + chunk_frames], dims, return_time_data=True)
+        pending = [data[n_full:]] if n_full < n_pending else []
+        n_pending -= n_full
+    if n_pending:
+        data = np.concatenate(pending) if len(pending) > 1 else pending[0]
+        yield xvg_2_coords(data, dims, return_time_data=True)
+
+
+@instrumentation.instrument(nbytes=lambda call: sum(_file_size(path) for path in call['paths']))
+def load_xvg_many(paths, dims=3, workers=None, comments=('#', '@'), return_time_data=False, stack=False,
+                  pad_value=np.nan, cache=False, particles=None, index_file=None, verbose=True):
+    ''' Loads a group of xvg files (e.g. a set of umbrella sampling windows) with load_xvg, in parallel over a pool of
+        worker processes. A file that fails to load is reported in errors and doesn't stop the rest of the batch.
+
+        Parameters
+            paths            - list of paths to xvg files
+            dims             - dimensions of data, see load_xvg
+            workers          - number of processes. None uses all cores, 1 loads serially in this process
+            comments         - see load_xvg
+            return_time_data - if true, each entry is a tuple of (data, time)
+            stack            - if true, pads files to the longest one and stacks them, see pad_and_stack
+            pad_value        - fill value for padding when stacking
+            cache            - see load_xvg
+            particles        - optional particle selection applied to every file, see load_xvg
+            index_file       - see load_xvg
+            verbose          - print progress and errors as files finish
+        Returns
+            data             - list with one load_xvg result per path, None where loading failed. If stack, instead a
+                               tuple of (stacked, lengths), or (stacked, stacked_times, lengths) with return_time_data
+            errors           - dictionary of path : error message for files that failed
     '''
-    n_columns = 0
-    n_rows    = 0
-    with open(file, 'r') as fin:
+    if workers is None:
+        workers = os.cpu_count()
+    results = [None] * len(paths)
+    errors = {}
+    if isinstance(index_file, str):
+        index_file = load_gromacs_index(index_file)   # parse once here rather than in every worker
+    jobs = [(path, dims, comments, cache, particles, index_file) for path in paths]
+
+    def record(index, result, error):
+        if error is None:
+            results[index] = result
+        else:
+            errors[paths[index]] = error
         if verbose:
-            print("opening file for initial read")
-        for line in fin:
-            # skip comment line
-            if not line[0] in comments and line.strip():
-                # if first data row, get dimensions
-                if not n_rows:
-                    n_columns = np.fromstring(line, sep=delimiter).size
-                n_rows += 1
-
-    if not n_columns or not n_rows:
-        raise Exception("file error - file contained {} rows and {} columns".format(n_rows, n_columns))
+            n_done = sum(result is not None for result in results) + len(errors)
+            print("{}/{} {} {}".format(n_done, len(paths), paths[index], error if error else "loaded"))
+
+    if workers == 1 or len(paths) <= 1:
+        for index, job in enumerate(jobs):
+            record(index, *_load_xvg_job(job))
     else:
-        output = np.zeros((n_rows, n_columns), dtype=dtype)
-        row = 0
-        with open(file, 'r') as fin:
-            if verbose:
-                print("opening file for assignment read - nrows = {}, ncolumns = {}".format(n_rows, n_columns))
-            for line in fin:
-                if not line[0] in comments and line.strip():
-                    line_array = np.fromstring(line, sep=delimiter, dtype=dtype)
-                    if line_array.size == n_columns:
-                        output[row] = line_array
-                        row += 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_load_xvg_job, job): index for index, job in enumerate(jobs)}
+            for future in concurrent.futures.as_completed(futures):
+                record(futures[future], *future.result())
+
+    if not stack:
+        if not return_time_data:
+            results = [None if result is None else result[0] for result in results]
+        return results, errors
+
+    coords, lengths = pad_and_stack([None if result is None else result[0] for result in results], pad_value)
+    if not return_time_data:
+        return (coords, lengths), errors
+    times, _ = pad_and_stack([None if result is None else result[1] for result in results], pad_value)
+    return (coords, times, lengths), errors
+
+
+def _load_xvg_job(job):
+    ''' Worker for load_xvg_many. Returns ((data, times), None) on success, (None, message) on failure '''
+    path, dims, comments, cache, particles, index_file = job
+    try:
+        return load_xvg(path, comments=comments, dims=dims, return_time_data=True, cache=cache, particles=particles,
+                        index_file=index_file), None
+    except Exception as error:
+        return None, "{}: {}".format(type(error).__name__, error)
+
+
+def _n_frames(result):
+    ''' Frames in the result of load_xvg, with or without times '''
+    return (result[0] if isinstance(result, tuple) else result).shape[0]
+
+
+def _file_size(file):
+    ''' Size in bytes of a file given by path, 0 for open file objects and files that can't be found '''
+    if isinstance(file, (str, os.PathLike)) and os.path.isfile(file):
+        return os.path.getsize(file)
+    return 0
+
+
+def pad_and_stack(arrays, pad_value=np.nan):
+    ''' Stacks arrays of different lengths along a new first axis, padding each to the longest along its first axis
+
+        Parameters
+            arrays    - list of arrays with the same shape except along the first axis. None entries are all padding
+            pad_value - fill value for padding
+        Returns
+            stacked   - n_arrays * max_length * (remaining shape) array
+            lengths   - n_arrays integer array of original lengths, 0 for None entries
+    '''
+    present = [array for array in arrays if array is not None]
+    if not present:
+        return np.zeros((len(arrays), 0)), np.zeros(len(arrays), dtype=int)
+    trailing_shape = present[0].shape[1:]
+    if any(array.shape[1:] != trailing_shape for array in present):
+        raise ValueError("can't stack arrays with shapes {}".format(set(array.shape for array in present)))
+    lengths = np.array([0 if array is None else array.shape[0] for array in arrays])
+    stacked = np.full((len(arrays), lengths.max()) + trailing_shape, pad_value,
+                      dtype=np.result_type(*present, np.min_scalar_type(pad_value)))
+    for index, array in enumerate(arrays):
+        if array is not None:
+            stacked[index, :array.shape[0]] = array
+    return stacked, lengths
+
+
+class XvgFollower:
+    ''' Follows an xvg file that is still being written, e.g. by a running mdrun. Remembers how far into the file it
+        has read, and each poll parses only the complete frames appended since the last one, so monitoring a long run
+        never re-reads the file. A partially written last line is left for the next poll.
+
+        Parameters
+            file        - path to xvg file
+            dims        - dimensions of data, see load_xvg
+            comments    - see load_xvg
+            particles   - optional particle selection, see load_xvg
+            index_file  - see load_xvg
+            block_bytes - maximum bytes read from disk at once
+
+        Attributes
+            offset      - byte offset up to which the file has been parsed
+            n_frames    - number of frames returned so far
+    '''
+
+    def __init__(self, file, dims=3, comments=('#', '@'), particles=None, index_file=None, block_bytes=2 ** 24):
+        self.file = file
+        self.dims = dims
+        self.comments = comments
+        self.particles = particles
+        self.index_file = index_file
+        self.block_bytes = block_bytes
+        self.offset = 0
+        self.n_frames = 0
+        self.n_columns = 0
+        self.columns = None
+
+    def poll(self, final=False):
+        ''' Parses frames appended since the last poll.
+
+            Parameters
+                final  - also parse a last line without a newline. Only use once the writer has finished
+            Returns
+                coords - n_new_frames * nparticles * ndims, n_new_frames may be 0
+                times  - n_new_frames array of times
+        '''
+        file_size = os.path.getsize(self.file) if os.path.exists(self.file) else 0   # may not be created yet
+        if file_size < self.offset:
+            raise Exception("{} shrank from {} to {} bytes - it was rewritten, start a new follower".format(
+                            self.file, self.offset, file_size))
+        blocks = []
+        if file_size > self.offset:
+            with open(self.file, 'rb') as fin:
+                fin.seek(self.offset)
+                while True:
+                    chunk = fin.read(self.block_bytes)
+                    if not chunk:
+                        break
+                    if not chunk.endswith(b'\n'):
+                        chunk += fin.readline()   # finish the last line, if it has been completely written yet
+                    cut = chunk.rfind(b'\n') + 1
+                    if final and cut < len(chunk):
+                        text, cut = chunk + b'\n', len(chunk)
+                    elif cut:
+                        text = chunk[:cut]
                     else:
-                        print(line[:80])
-                        raise Exception("Data inconsistency at row {}, expected {} columns, got {}".format(row,
-                                        n_columns, line_array.size ))
+                        break
+                    data = self._parse(text)
+                    if data.shape[0]:
+                        blocks.append(data)
+                        self.n_frames += data.shape[0]
+                    self.offset += cut
+                    if cut < len(chunk):
+                        break   # stop at the partial line
+
+        n_kept = len(self.columns) if self.columns is not None else self.n_columns
+        data = np.concatenate(blocks) if blocks else np.zeros((0, max(n_kept, 1)))
+        return xvg_2_coords(data, self.dims, return_time_data=True)
+
+    def _parse(self, text):
+        if self.particles is not None and self.columns is None:
+            comment_bytes = tuple(c.encode() for c in self.comments)
+            if not any(line.strip() and not line.startswith(comment_bytes) for line in text.splitlines()):
+                return np.zeros((0, 1))   # still in the header
+            self.columns = _particle_columns(self.particles, self.dims, _count_columns(self.file, self.comments),
+                                             index_file=self.index_file)
+        data, self.n_columns = _parse_text_block(text, self.n_columns, comments=self.comments, first_row=self.n_frames,
+                                                 columns=self.columns)
+        if data.shape[0] and self.columns is None and (self.n_columns - 1) % self.dims > 0:
+            raise ValueError("(dims * n_particles) + 1 does not equal number of columns in xvg")
+        return data
+
+    def follow(self, interval=60, timeout=None):
+        ''' Generator that polls every interval seconds and yields (coords, times) whenever new frames arrive. Stops
+            once the file hasn't grown for timeout seconds (never if None), after a final poll.
+        '''
+        last_growth = time.time()
+        while True:
+            coords, times = self.poll()
+            if times.size:
+                last_growth = time.time()
+                yield coords, times
+            elif timeout is not None and time.time() - last_growth > timeout:
+                coords, times = self.poll(final=True)
+                if times.size:
+                    yield coords, times
+                return
+            time.sleep(interval)
+
+
+def _count_columns(file, comments=('#', '@'), delimiter=' '):
+    ''' Number of columns in the first data row of a text file, reading no further than that row '''
+    with open(file, 'r') as fin:
+        for line in fin:
+            if line.strip() and line[0] not in comments:
+                return len(line.split(delimiter if delimiter.strip() else None))
+    raise Exception("file error - no data rows in {}".format(file))
+
+
+def _particle_columns(particles, dims, n_columns, index_file=None):
+    '''
+        Converts a particle selection (list of indices or index group name) into xvg column numbers - the time column,
+        then the dims columns of each selected particle.
+    '''
+    if (n_columns - 1) % dims > 0:
+        raise ValueError("(dims * n_particles) + 1 does not equal number of columns in xvg")
+    if isinstance(particles, str):
+        if index_file is None:
+            raise ValueError("selecting particles by group name ({}) requires an index_file".format(particles))
+        index_dict = load_gromacs_index(index_file) if isinstance(index_file, str) else index_file
+        particles = index_dict[particles]
+    particles = np.asarray(particles, dtype=int).ravel()
+    n_particles = (n_columns - 1) // dims
+    if particles.size and (particles.min() < 0 or particles.max() >= n_particles):
+        raise ValueError("particle selection out of range for an xvg with {} particles".format(n_particles))
+    return np.concatenate(([0], (1 + particles[:, np.newaxis] * dims + np.arange(dims)).ravel()))
+
+
+def _parse_text_rows(lines, n_columns, delimiter=' ', dtype=float, first_row=0):
+    '''
+        Parses a list of text rows into an n_rows * n_columns array with a single numpy call, after checking that every
+        row has n_columns entries. first_row is only used to report the row number with respect to the whole file.
+    '''
+    split_on = delimiter if delimiter.strip() else None
+    for index, line in enumerate(lines):
+        line_size = len(line.split(split_on))
+        if line_size != n_columns:
+            print(line[:80])
+            raise Exception("Data inconsistency at row {}, expected {} columns, got {}".format(first_row + index,
+                            n_columns, line_size))
+    return np.loadtxt(lines, delimiter=split_on, dtype=dtype, comments=None, ndmin=2)
+
+
+def _parse_text_block(text, n_columns, delimiter=' ', dtype=float, comments=('@', '#'), first_row=0, columns=None):
+    '''
+        Parses a block of complete lines (bytes) into an n_rows * n_columns array. A leading header is cut off, then the
+        rest of the block is handed to numpy's C parser in one go. Only blocks numpy rejects go through the line based
+        path, which finds and reports the first inconsistent row. If columns is given, only those columns are kept.
+
+        Returns
+            data      - n_rows * n_columns (or len(columns)) array. n_rows may be 0
+            n_columns - number of columns, taken from the first data row if n_columns was 0 on input
+    '''
+    comment_bytes = tuple(c.encode() for c in comments)
+
+    # drop a leading header without splitting the rest of the block into lines
+    start = 0
+    while start < len(text):
+        end = text.find(b'\n', start) + 1   # blocks always end with a newline
+        if text[start:end].strip() and not text.startswith(comment_bytes, start):
+            break
+        start = end
+    text = text[start:]
+    if not n_columns and text:
+        n_columns = len(text[:text.find(b'\n')].split(delimiter.encode() if delimiter.strip() else None))
+
+    if n_columns:
+        try:
+            data = np.loadtxt(io.BytesIO(text), delimiter=delimiter if delimiter.strip() else None, dtype=dtype,
+                              comments=comments, ndmin=2, usecols=columns)
+        except ValueError:
+            data = None
+        # np.loadtxt doesn't check the width of rows when picking columns with usecols, so count fields separately
+        if data is not None and data.shape[1] == (n_columns if columns is None else len(columns)) and (
+                columns is None or _rows_have_n_fields(text, n_columns, delimiter)):
+            return data, n_columns
+
+    lines = [line for line in text.decode().splitlines() if line.strip() and line[0] not in comments]
+    if not lines:
+        return np.zeros((0, n_columns if columns is None else len(columns)), dtype=dtype), n_columns
+    data = _parse_text_rows(lines, n_columns, delimiter=delimiter, dtype=dtype, first_row=first_row)
+    return (data if columns is None else data[:, columns]), n_columns
+
+
+_WHITESPACE_BYTES = np.zeros(256, dtype=bool)
+_WHITESPACE_BYTES[list(b' \t\r\n\x0b\x0c')] = True
+
+
+def _rows_have_n_fields(text, n_fields, delimiter=' '):
+    '''
+        True if every non blank line of text (bytes ending with a newline) has n_fields fields. Counted on the raw
+        bytes with numpy, so checking a block costs a few passes over it rather than splitting it into python objects.
+        Comment lines count as inconsistent, so a block containing them goes through the line based path.
+    '''
+    buffer = np.frombuffer(text, dtype=np.uint8)
+    if not buffer.size:
+        return True
+    line_ends = np.flatnonzero(buffer == ord('\n'))
+    n_lines = line_ends.size + 1
+    space = _WHITESPACE_BYTES[buffer]
+    # a field starts on a non space byte that follows a space byte, or starts the text
+    word_starts = ~space
+    word_starts[1:] &= space[:-1]
+    words_per_line = np.bincount(np.searchsorted(line_ends, np.flatnonzero(word_starts)), minlength=n_lines)
+    if delimiter.strip():
+        if not len(delimiter) == 1:
+            return False
+        fields_per_line = np.bincount(np.searchsorted(line_ends, np.flatnonzero(buffer == ord(delimiter))),
+                                      minlength=n_lines) + 1
+    else:
+        fields_per_line = words_per_line
+    return bool(np.all(fields_per_line[words_per_line > 0] == n_fields))
+
+
+def _iter_text_blocks(file, delimiter=' ', dtype=float, comments=('@', '#'), block_bytes=2 ** 24, columns=None):
+    '''
+        Reads a text file in one pass, block_bytes at a time, yielding the data rows of each block as a single
+        n_rows * n_columns array. Only complete lines are parsed, a partial last line is carried over to the next block.
+    '''
+    n_columns = 0
+    row = 0
+    remainder = b''
+    with open(file, 'rb') as fin:
+        while True:
+            chunk = fin.read(block_bytes)
+            if chunk:
+                chunk = remainder + chunk
+                cut = chunk.rfind(b'\n') + 1
+                text, remainder = chunk[:cut], chunk[cut:]
+                if not text:
+                    continue
+            elif remainder:
+                text, remainder = remainder + b'\n', b''   # last line of the file without a newline
+            else:
+                break
+            data, n_columns = _parse_text_block(text, n_columns, delimiter=delimiter, dtype=dtype, comments=comments,
+                                                first_row=row, columns=columns)
+            if data.shape[0]:
+                row += data.shape[0]
+                yield data
+
+
+def load_large_text_file(file, delimiter=' ', verbose=True, dtype=float, comments=('@', '#'), block_bytes=2 ** 24,
+                         cache=False, columns=None):
+    '''
+        Numpy.loadtxt has some memory problems on large files. This loader reads the file once, in blocks of
+        block_bytes, and parses each block of rows with a single numpy call into a preallocated output array that grows
+        as needed. Comment lines are only allowed at the start of a line.
+
+        Parameters
+            file        - path to text file
+            delimiter   - column delimiter. Any whitespace when left as ' '
+            verbose     - print progress
+            dtype       - dtype of the output array
+            comments    - lines starting with these characters are skipped
+            block_bytes - size of each read from disk. Peak memory is the output array plus a few times this
+            cache       - False, True or a cache directory, see load_xvg
+            columns     - optional sequence of column numbers to keep. Memory then scales with the selection
+        Returns
+            data        - n_rows * n_columns array
+    '''
+    if cache:
+        options = ('load_large_text_file', delimiter, np.dtype(dtype).str, tuple(comments),
+                   None if columns is None else tuple(np.asarray(columns).tolist()))
+        return _cached_load(file, cache, options, lambda: load_large_text_file(file, delimiter=delimiter,
+                            verbose=verbose, dtype=dtype, comments=comments, block_bytes=block_bytes, columns=columns))
+
+    file_size = os.path.getsize(file)
+    output = None
+    n_rows = 0
+    if verbose:
+        print("opening file for single pass read - {} bytes".format(file_size))
+    # recorded here rather than with instrument, so a parse on a cache miss isn't counted twice
+    with instrumentation.stage('file_io.load_large_text_file', nbytes=file_size) as current:
+        blocks = _iter_text_blocks(file, delimiter=delimiter, dtype=dtype, comments=comments, block_bytes=block_bytes,
+                                   columns=columns)
+        for block in blocks:
+            if output is None:
+                # guess total rows from the size of the first block, to avoid most regrowing
+                bytes_per_row = min(file_size, block_bytes) / block.shape[0]
+                output = np.empty((int(file_size / bytes_per_row) + 1, block.shape[1]), dtype=dtype)
+            if n_rows + block.shape[0] > output.shape[0]:
+                new_rows = max(int(output.shape[0] * 1.5), n_rows + block.shape[0])
+                output.resize((new_rows, output.shape[1]), refcheck=False)
+            output[n_rows:n_rows + block.shape[0]] = block
+            n_rows += block.shape[0]
+        current.add(frames=n_rows)
+
+    if output is None:
+        raise Exception("file error - file contained {} rows and {} columns".format(0, 0))
+    if verbose:
+        print("finished read - nrows = {}, ncolumns = {}".format(n_rows, output.shape[1]))
+    output.resize((n_rows, output.shape[1]), refcheck=False)
     return output
 
 
-def load_gromacs_index(index_file):
+@instrumentation.instrument(nbytes=lambda call: _file_size(call['index_file']))
+def load_gromacs_index(index_file, cache=False):
     ''' Loads a gromacs style index file. Decrements all read indices by 1, as numbering starts at 1 in the files, but
-        we'll be using these as array indices
+        we'll be using these as array indices. Each group is parsed in one go into a compact int32 array
 
         Parameters -
             index_file - path to a file
+            cache      - False, True or a cache directory. Keeps the parsed groups in a binary sidecar, see load_xvg
         Returns -
-            index_dict - dictionary of index string : list of integer values
+            index_dict - dictionary of index string : int32 array of indices
     '''
+    return _cached_load(index_file, cache, ('load_gromacs_index',), lambda: _parse_gromacs_index(index_file),
+                        archive=True)
+
+
+def _parse_gromacs_index(index_file):
     with open(index_file, 'r') as fin:
-        index_dict = {}
-        curr_group = []
-        curr_nums = []
-        for line in fin:
+        text = fin.read()
 
-            # check for opening and closing brackets
-            if "[" in line and "]" in line:
-
-                # add previous to dictionary only if one existed before - accounts for initial case
-                if curr_group:
-                    index_dict[curr_group] = curr_nums
-
-                # reset group and index count
-                curr_group = line.split("[", 1)[-1].split("]", 1)[0].strip()
-                curr_nums = []
-            elif curr_group:
-                curr_nums += [int(i) - 1 for i in line.split()]    # decrement each one
-        # one last time
-        if curr_nums:
-            index_dict[curr_group] = curr_nums
+    # split into [preamble, name 1, body 1, name 2, body 2, ...] on header lines
+    pieces = re.split(r'^[^\[\n]*\[([^\]\n]*)\][^\n]*$', text, flags=re.MULTILINE)
+    index_dict = {}
+    for position in range(1, len(pieces), 2):
+        body = pieces[position + 1]
+        # np.fromstring reads a whitespace only string as [0], so empty groups need checking first
+        indices = np.fromstring(body, dtype=np.int32, sep=' ') if body.strip() else np.zeros(0, dtype=np.int32)
+        indices -= 1   # decrement each one
+        # a trailing empty group is left out
+        if indices.size or position + 2 < len(pieces):
+            index_dict[pieces[position].strip()] = indices
     return index_dict
+
+
+def index_union(*groups):
+    ''' Sorted, unique int32 array of the indices in any of the groups (arrays or lists of indices) '''
+    return np.unique(np.concatenate([np.asarray(group, dtype=np.int32).ravel() for group in groups]))
+
+
+def index_intersection(*groups):
+    ''' Sorted, unique int32 array of the indices present in every group '''
+    result = np.unique(np.asarray(groups[0], dtype=np.int32))
+    for group in groups[1:]:
+        result = np.intersect1d(result, np.asarray(group, dtype=np.int32), assume_unique=False)
+    return result
+
+
+def index_difference(group, *others):
+    ''' Sorted, unique int32 array of the indices in group that are in none of the other groups '''
+    group = np.unique(np.asarray(group, dtype=np.int32))
+    if not others:
+        return group
+    return group[~np.isin(group, index_union(*others), assume_unique=True)]
+
+
+# ----------------------------------------------
+# binary sidecar cache for parsed text files
+# ----------------------------------------------
+CACHE_MAX_BYTES = 20 * 2 ** 30   # evict least recently used sidecars once a cache directory grows past this
+
+
+def _cache_directory(file, cache):
+    ''' cache=True means a .xvg_cache directory next to the file, otherwise cache is the directory itself '''
+    if cache is True:
+        return os.path.join(os.path.dirname(os.path.abspath(file)), '.xvg_cache')
+    return cache
+
+
+def _cache_names(file, options):
+    '''
+        Sidecar file names are <path hash>_<file state hash>_<options hash>.npy, so that every entry for a file can be
+        found from its path, and entries for an older version of the file can be told apart from the current one.
+    '''
+    path = os.path.abspath(file)
+    stat = os.stat(path)
+    path_hash = hashlib.sha1(path.encode()).hexdigest()[:16]
+    state_hash = hashlib.sha1(repr((stat.st_size, stat.st_mtime_ns)).encode()).hexdigest()[:12]
+    options_hash = hashlib.sha1(repr(options).encode()).hexdigest()[:12]
+    return path_hash, state_hash, options_hash
+
+
+def _cached_load(file, cache, options, parse, archive=False):
+    '''
+        Returns parse() for file, going through the sidecar cache if cache is set. A hit is memory mapped read only.
+        With archive, parse() returns a dictionary of arrays, stored as an .npz and read back fully on a hit. The arrays
+        are stored positionally after an array of their names, so any name (eg a group called "file") round trips.
+        A miss parses, writes the sidecar (atomically, so concurrent sessions sharing a cache don't see partial files),
+        removes sidecars of older versions of the file, then trims the directory to CACHE_MAX_BYTES. A sidecar that
+        another session evicts while it is being read counts as a miss.
+    '''
+    if not cache:
+        return parse()
+    cache_dir = _cache_directory(file, cache)
+    path_hash, state_hash, options_hash = _cache_names(file, options)
+    sidecar = os.path.join(cache_dir, '{}_{}_{}.{}'.format(path_hash, state_hash, options_hash,
+                                                          'npz' if archive else 'npy'))
+    try:
+        os.utime(sidecar)   # mtime tracks last use, for eviction
+        if archive:
+            with np.load(sidecar) as stored:
+                names = stored['arr_0']
+                return {str(name): stored['arr_{}'.format(i + 1)] for i, name in enumerate(names)}
+        return np.load(sidecar, mmap_mode='r')
+    except FileNotFoundError:
+        pass
+
+    data = parse()
+    os.makedirs(cache_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(cache_dir, path_hash + '_*.np[yz]')):
+        if not os.path.basename(stale).startswith(path_hash + '_' + state_hash):
+            with contextlib.suppress(FileNotFoundError):   # already removed by another session
+                os.remove(stale)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fout:
+        if archive:
+            np.savez(fout, np.array(list(data.keys()), dtype=str), *data.values())
+        else:
+            np.save(fout, data)
+    os.replace(tmp_path, sidecar)
+    evict_cache(cache_dir)
+    return data
+
+
+def clear_cache(file=None, cache_dir=None):
+    ''' Explicitly invalidates cached sidecars.
+
+        Parameters
+            file      - if given, only sidecars for this file are removed (all versions and parse options)
+            cache_dir - cache directory. Defaults to the .xvg_cache directory next to file. If file is not given,
+                        every sidecar in cache_dir is removed
+        Returns
+            n_removed - number of sidecar files deleted
+    '''
+    if file is None and cache_dir is None:
+        raise ValueError("need a file or a cache directory to clear")
+    if cache_dir is None:
+        cache_dir = _cache_directory(file, True)
+    pattern = hashlib.sha1(os.path.abspath(file).encode()).hexdigest()[:16] + '_*.np[yz]' if file else '*.np[yz]'
+    n_removed = 0
+    for sidecar in glob.glob(os.path.join(cache_dir, pattern)):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(sidecar)
+            n_removed += 1
+    return n_removed
+
+
+def evict_cache(cache_dir, max_bytes=None):
+    ''' Deletes least recently used sidecars until the cache directory is at most max_bytes (CACHE_MAX_BYTES if None).
+        Called automatically after every cache write. Other sessions sharing the directory may evict at the same time,
+        so sidecars that have already gone are skipped.
+
+        Returns
+            n_removed - number of sidecar files deleted
+    '''
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    entries = []
+    for sidecar in glob.glob(os.path.join(cache_dir, '*.np[yz]')):
+        with contextlib.suppress(FileNotFoundError):
+            stat = os.stat(sidecar)
+            entries.append((stat.st_mtime, stat.st_size, sidecar))
+    total = sum(entry[1] for entry in entries)
+    n_removed = 0
+    for _, size, sidecar in sorted(entries):
+        if total <= max_bytes:
+            break
+        total -= size
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(sidecar)
+            n_removed += 1
+    return n_removed
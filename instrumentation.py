@@ -0,0 +1,281 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+'''
+    Opt-in timing of the hot paths. The main entry points of file_io, trajectory_io, coordinate_manipulation and
+    statistical_analysis are wrapped with instrument, and slower internal steps (eg pymbar inside assess_equilibration)
+    are marked with stage. Nothing is recorded until enable() is called - until then a wrapped call costs one flag
+    check, and stage hands back a shared do-nothing context manager.
+
+    Once enabled, every call adds its wall time, and the bytes, frames and items (eg series points) it processed, to the
+    stage of the same name in registry, so throughputs such as MB/s parsed or frames/s come straight out of a run.
+    enable(track_memory=True) also records the peak memory allocated during each stage with tracemalloc, which slows
+    numpy allocation down noticeably - leave it off when only timing.
+
+        instrumentation.enable()
+        data = file_io.load_xvg('positions.xvg')
+        ...
+        print(instrumentation.registry.summary())
+        instrumentation.registry.to_json('timings.json')
+
+    Stages nest - time spent in calc_vectors called from another instrumented function counts towards both. Stages are
+    recorded per process, so work done in the worker processes of a process pool isn't included.
+'''
+
+
+class StageStats:
+    ''' Totals for one named stage. Throughputs are over the total wall time of every call '''
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.min_seconds = float('inf')
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.frames = 0
+        self.items = 0
+        self.peak_bytes = None
+
+    def add(self, seconds, nbytes=0, frames=0, items=0, peak_bytes=None):
+        self.calls += 1
+        self.seconds += seconds
+        self.min_seconds = min(self.min_seconds, seconds)
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += nbytes
+        self.frames += frames
+        self.items += items
+        if peak_bytes is not None:
+            self.peak_bytes = peak_bytes if self.peak_bytes is None else max(self.peak_bytes, peak_bytes)
+
+    @property
+    def mb_per_s(self):
+        return self.bytes / 1e6 / self.seconds if self.bytes and self.seconds else None
+
+    @property
+    def frames_per_s(self):
+        return self.frames / self.seconds if self.frames and self.seconds else None
+
+    @property
+    def items_per_s(self):
+        return self.items / self.seconds if self.items and self.seconds else None
+
+    def to_dict(self):
+        return {'calls': self.calls, 'seconds': self.seconds, 'min_seconds': self.min_seconds,
+                'max_seconds': self.max_seconds, 'bytes': self.bytes, 'frames': self.frames, 'items': self.items,
+                'peak_bytes': self.peak_bytes, 'mb_per_s': self.mb_per_s, 'frames_per_s': self.frames_per_s,
+                'items_per_s': self.items_per_s}
+
+
+class Registry:
+    ''' Collects StageStats by stage name. Safe to record into from several threads '''
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, nbytes=0, frames=0, items=0, peak_bytes=None):
+        with self._lock:
+            if name not in self._stages:
+                self._stages[name] = StageStats(name)
+            self._stages[name].add(seconds, nbytes=nbytes, frames=frames, items=items, peak_bytes=peak_bytes)
+
+    def get(self, name):
+        ''' StageStats of a stage, or None if it hasn't run '''
+        return self._stages.get(name)
+
+    def stages(self, prefix=''):
+        ''' StageStats of every stage whose name starts with prefix (eg "file_io."), most total time first '''
+        return sorted((stats for name, stats in self._stages.items() if name.startswith(prefix)),
+                      key=lambda stats: stats.seconds, reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def to_dict(self):
+        return {stats.name: stats.to_dict() for stats in self.stages()}
+
+    def to_json(self, path=None):
+        ''' JSON of every stage, written to path if given. Returns the JSON string '''
+        text = json.dumps({'pid': os.getpid(), 'stages': self.to_dict()}, indent=2)
+        if path is not None:
+            with open(path, 'w') as fout:
+                fout.write(text)
+        return text
+
+    def summary(self, prefix=''):
+        ''' Table of every stage, most total time first '''
+        def throughput(value):
+            return "{:.1f}".format(value) if value is not None else '-'
+
+        lines = ["{:<40s} {:>7s} {:>10s} {:>10s} {:>14s} {:>16s} {:>16s} {:>10s}".format(
+            'stage', 'calls', 'total (s)', 'mean (s)', 'MB/s', 'frames/s', 'items/s', 'peak (MB)')]
+        for stats in self.stages(prefix):
+            peak = "{:.1f}".format(stats.peak_bytes / 2 ** 20) if stats.peak_bytes is not None else '-'
+            lines.append("{:<40s} {:>7d} {:>10.4f} {:>10.4f} {:>14s} {:>16s} {:>16s} {:>10s}".format(
+                stats.name, stats.calls, stats.seconds, stats.seconds / stats.calls,
+                throughput(stats.mb_per_s), throughput(stats.frames_per_s),
+                throughput(stats.items_per_s), peak))
+        return '\n'.join(line.rstrip() for line in lines)
+
+
+registry = Registry()
+
+_enabled = False
+_track_memory = False
+_started_tracemalloc = False
+_local = threading.local()
+
+
+def enable(track_memory=False):
+    ''' Starts recording. With track_memory, peak allocations are traced too (starting tracemalloc if needed) '''
+    global _enabled, _track_memory, _started_tracemalloc
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _track_memory = track_memory
+    _enabled = True
+
+
+def disable():
+    ''' Stops recording, and stops tracemalloc if enable started it. Recorded stages are kept '''
+    global _enabled, _track_memory, _started_tracemalloc
+    _enabled = False
+    _track_memory = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def is_enabled():
+    return _enabled
+
+
+class _Stage:
+    ''' Context manager timing one stage. Work done inside can be counted with add '''
+
+    def __init__(self, name, nbytes=0, frames=0, items=0):
+        self.name = name
+        self.nbytes = nbytes
+        self.frames = frames
+        self.items = items
+
+    def add(self, nbytes=0, frames=0, items=0):
+        self.nbytes += nbytes
+        self.frames += frames
+        self.items += items
+
+    def __enter__(self):
+        self.track_memory = _track_memory and tracemalloc.is_tracing()
+        if self.track_memory:
+            # the peak of an enclosing stage would be lost with reset_peak, so hand it up first
+            stack = _memory_stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+            self.child_peak = current
+            stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        peak_bytes = None
+        if self.track_memory:
+            stack = _memory_stack()
+            stack.pop()
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            peak_bytes = peak - self.start_memory
+        registry.record(self.name, seconds, nbytes=self.nbytes, frames=self.frames, items=self.items,
+                        peak_bytes=peak_bytes)
+        return False
+
+
+class _NullStage:
+
+    def add(self, nbytes=0, frames=0, items=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _memory_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def stage(name, nbytes=0, frames=0, items=0):
+    ''' Context manager recording the block inside it as stage name. The amounts of work can be given up front, or
+        added inside the block with the add method of the returned object:
+
+            with instrumentation.stage('my_analysis.parse', nbytes=os.path.getsize(path)) as current:
+                ...
+                current.add(frames=n_frames)
+    '''
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, nbytes=nbytes, frames=frames, items=items)
+
+
+def _count(metric, call):
+    ''' Amount of work a metric function gives for a call. A metric that fails counts as 0 - instrumenting a call
+        must never make it fail
+    '''
+    if metric is None:
+        return 0
+    try:
+        return int(metric(call))
+    except Exception:
+        return 0
+
+
+def instrument(name=None, nbytes=None, frames=None, items=None):
+    ''' Decorator recording every call of a function as a stage, by default named module.function (eg
+        "file_io.load_xvg").
+
+        Parameters
+            name   - stage name
+            nbytes - optional function giving the bytes processed by a call, from a dictionary of the call's arguments
+                     (defaults included) by parameter name, plus the return value under 'result'
+            frames - as nbytes, for frames processed
+            items  - as nbytes, for other units of work, eg points of a time series
+        A metric function that raises counts as 0 for that call.
+    '''
+    def decorator(func):
+        stage_name = name or "{}.{}".format(func.__module__.split('.')[-1], func.__qualname__)
+        signature = []
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(stage_name) as current:
+                result = func(*args, **kwargs)
+                if nbytes is not None or frames is not None or items is not None:
+                    if not signature:
+                        import inspect
+                        signature.append(inspect.signature(func))
+                    call = signature[0].bind(*args, **kwargs)
+                    call.apply_defaults()
+                    call = dict(call.arguments, result=result)
+                    current.add(nbytes=_count(nbytes, call), frames=_count(frames, call), items=_count(items, call))
+            return result
+        return wrapper
+    return decorator
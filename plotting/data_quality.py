@@ -0,0 +1,263 @@
+import concurrent.futures
+import os
+
+import numpy as np
+import matplotlib
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from .decimation import decimate
+from . import savefig_options
+
+'''
+    Plots for statistical_analysis.error_estimation. Kept out of the analysis module so that the numeric code can be
+    imported and run without matplotlib - Data_quality's plot methods, check_decorrelation(plot=True) and
+    assess_equilibration(plot=True) import this module when first called.
+
+    Plots of many long series decimate every series to max_points points first (see decimation.py) and draw all of
+    them as one LineCollection, rather than one full resolution plt.plot call per series. render_report writes a set of
+    pages to image files without a display, rendering pages in parallel.
+'''
+
+
+def plot_data_with_t0(data_quality, max_points=2000, method='minmax', ax=None, show=True):
+    ''' Every series, normalized and stacked, red before its t0 and blue after. Returns the axes '''
+    ax = _axes(ax)
+    segments, colors = _series_segments(data_quality, range(len(data_quality.data)), max_points, method,
+                                        equilibrated_only=False)
+    _draw_segments(ax, segments, colors)
+    ax.set_xlabel("time points")
+    ax.set_ylabel("normalized series")
+    return _finish(ax, show)
+
+
+def plot_only_equilibrated_data(data_quality, max_points=2000, method='minmax', ax=None, show=True):
+    ''' Every series from its t0 on, normalized and stacked. Returns the axes '''
+    ax = _axes(ax)
+    segments, colors = _series_segments(data_quality, range(len(data_quality.data)), max_points, method,
+                                        equilibrated_only=True)
+    _draw_segments(ax, segments, colors)
+    ax.set_xlabel("time points")
+    ax.set_ylabel("normalized series")
+    return _finish(ax, show)
+
+
+def plot_t0(data_quality, ax=None, show=True):
+    ax = _axes(ax)
+    ax.plot(_values_or_nan(data_quality.t0))
+    return _finish(ax, show)
+
+
+def plot_neff(data_quality, ax=None, show=True):
+    ax = _axes(ax)
+    ax.plot(_values_or_nan(data_quality.n_samples_effective))
+    return _finish(ax, show)
+
+
+def plot_block_averages(data_quality, firstframe=0, max_points=2000, method='lttb', ax=None, show=True):
+    ''' Block standard error profiles of every series, from block size firstframe + 1 on. Returns the axes '''
+    ax = _axes(ax)
+    segments = _profile_segments(data_quality, range(len(data_quality.block_average_profiles)), firstframe,
+                                 max_points, method)
+    _draw_segments(ax, segments, None)
+    return _finish(ax, show)
+
+
+def plot_average_BA(data_quality, ax=None, show=False):
+    profiles = [profile for profile in data_quality.block_average_profiles if profile is not None]
+    max = 0
+    for i in profiles:
+        max = np.max((len(i), max))
+    average = np.zeros(max)
+    counts = np.zeros(max)
+    for i in profiles:
+        average[:len(i)] += np.array(i)
+        counts[:len(i)] += 1
+    average /= counts
+    ax = _axes(ax)
+    ax.plot(average)
+    return _finish(ax, show)
+
+
+def plot_decorrelation(ba_data, acf_data, decorr_frame, max_block_size, corr_thresh):
+    ''' Block standard errors above the autocorrelation function, as shown by check_decorrelation '''
+    import matplotlib.pyplot as plt
+    f, axarr = plt.subplots(2, sharex=True)
+
+    axarr[0].set_ylabel('BSE')
+    axarr[0].plot(np.arange(1, ba_data.size + 1), ba_data)
+    if decorr_frame is not None:
+        axarr[0].plot([decorr_frame, decorr_frame], [ba_data.min(), ba_data.max()], 'k--')
+
+    axarr[1].set_ylabel('ACF')
+    axarr[1].set_xlabel('Block size (top) / tau (bot)')
+    axarr[1].plot(np.arange(acf_data.size), acf_data)   # nlags + 1, with lag=0
+    axarr[1].plot([0, max_block_size], [corr_thresh, corr_thresh])
+    plt.show()
+
+
+def plot_equilibration(timeseries, t0, max_points=20000):
+    ''' The unequilibrated and equilibrated parts of a series, as shown by assess_equilibration '''
+    import matplotlib.pyplot as plt
+    plt.figure()
+    plt.xlabel("series data point")
+    plt.ylabel("series value")
+    plt.plot(*decimate(timeseries[:t0], max_points), "r", label="unequilibrated data")
+    plt.plot(*decimate(timeseries[t0:], max_points, x=np.arange(t0, timeseries.size)), "b", label="equilibrated data")
+    plt.show()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# batch rendering to files
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def render_report(data_quality, output_dir, file_format='png', series_per_page=20, max_points=2000, workers=1,
+                  preset='report'):
+    ''' Renders a Data_quality analysis to image files, without a display. The first page summarizes t0, effective
+        samples and the average block averaging profile of every series, following pages show series_per_page series
+        each - the stacked data with t0 marked, and their block averaging profiles.
+
+        Series are decimated before being sent to the page renderers, so only a few thousand points per series ever
+        reach matplotlib, and pages are rendered in a process pool when workers > 1. Series whose analysis failed (see
+        analyze_group_of_time_series) are left out.
+
+        Parameters
+            data_quality    - Data_quality instance, eg from analyze_group_of_time_series
+            output_dir      - directory to write pages to, created if needed
+            file_format     - 'png', 'pdf' or anything else matplotlib can write
+            series_per_page - number of series per page
+            max_points      - points per series (and profile) after decimation
+            workers         - number of processes rendering pages
+            preset          - savefig_options preset the pages are saved with
+        Returns
+            paths           - list of the files written, in page order
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    options = dict(savefig_options.presets[preset], format=file_format)
+    good = [i for i in range(len(data_quality.data)) if data_quality.t0[i] is not None]
+
+    jobs = [(os.path.join(output_dir, "report_000.{}".format(file_format)), 'summary',
+             _summary_page_data(data_quality, good), options)]
+    for page, start in enumerate(range(0, len(good), series_per_page), start=1):
+        indices = good[start:start + series_per_page]
+        page_data = {'title': "series {} - {}".format(indices[0], indices[-1]),
+                     'series': _series_segments(data_quality, indices, max_points, 'minmax', False),
+                     'profiles': _profile_segments(data_quality, indices, 0, max_points, 'lttb')}
+        jobs.append((os.path.join(output_dir, "report_{:03d}.{}".format(page, file_format)), 'series', page_data,
+                     options))
+
+    if workers == 1:
+        return [_render_page(job) for job in jobs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_page, jobs))
+
+
+def _summary_page_data(data_quality, indices):
+    profiles = [data_quality.block_average_profiles[i] for i in indices]
+    longest = max((len(profile) for profile in profiles), default=0)
+    average = np.zeros(longest)
+    counts = np.zeros(longest)
+    for profile in profiles:
+        average[:len(profile)] += profile
+        counts[:len(profile)] += 1
+    return {'indices': np.array(indices),
+            't0': np.array([data_quality.t0[i] for i in indices], dtype=float),
+            'neff': np.array([data_quality.n_samples_effective[i] for i in indices], dtype=float),
+            'fraction': np.array([data_quality.fract_of_series_used[i] for i in indices], dtype=float),
+            'average_profile': average / np.maximum(counts, 1)}
+
+
+def _render_page(job):
+    ''' Draws one report page on a Figure with no pyplot or GUI involved, so it works in any process '''
+    path, kind, page_data, options = job
+    figure = Figure(figsize=(11, 8.5))
+    if kind == 'summary':
+        axes = figure.subplots(2, 2)
+        for ax, key, label in ((axes[0, 0], 't0', 't0'), (axes[0, 1], 'neff', 'effective samples'),
+                               (axes[1, 0], 'fraction', 'fraction of series used')):
+            ax.plot(page_data['indices'], page_data[key], 'o-', markersize=3)
+            ax.set_xlabel("series")
+            ax.set_ylabel(label)
+        axes[1, 1].plot(np.arange(1, page_data['average_profile'].size + 1), page_data['average_profile'])
+        axes[1, 1].set_xlabel("block size")
+        axes[1, 1].set_ylabel("average BSE")
+    else:
+        series_ax, profile_ax = figure.subplots(1, 2)
+        _draw_segments(series_ax, *page_data['series'])
+        series_ax.set_xlabel("time points")
+        series_ax.set_ylabel("normalized series")
+        _draw_segments(profile_ax, page_data['profiles'], None)
+        profile_ax.set_xlabel("block size")
+        profile_ax.set_ylabel("BSE")
+        figure.suptitle(page_data['title'])
+    figure.savefig(path, **options)
+    return path
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# shared helpers
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def _series_segments(data_quality, indices, max_points, method, equilibrated_only):
+    ''' Decimated line segments of the normalized, stacked series, with a color per segment. Skips failed series '''
+    segments, colors = [], []
+    for i in indices:
+        t0 = data_quality.t0[i]
+        if t0 is None:
+            continue
+        series = np.asarray(data_quality.data[i], dtype=float)
+        series_copy = series - series.mean()
+        series_copy = 0.4 * series_copy / np.max(np.abs(series_copy))
+        series_copy += i
+        parts = [(t0, series.size, 'b')] if equilibrated_only else [(0, t0, 'r'), (t0, series.size, 'b')]
+        for start, end, color in parts:
+            if end - start < 1:
+                continue
+            # equilibrated only plots start at 0, as they used to
+            x = np.arange(end - start) if equilibrated_only else np.arange(start, end)
+            segments.append(np.column_stack(decimate(series_copy[start:end], max_points, x=x, method=method)))
+            colors.append(color)
+    return segments, colors
+
+
+def _profile_segments(data_quality, indices, firstframe, max_points, method):
+    segments = []
+    for i in indices:
+        profile = data_quality.block_average_profiles[i]
+        if profile is None or len(profile) <= firstframe:
+            continue
+        profile = np.asarray(profile)[firstframe:]
+        segments.append(np.column_stack(decimate(profile, max_points, method=method)))
+    return segments
+
+
+def _draw_segments(ax, segments, colors):
+    ''' Draws all segments as one LineCollection. Without colors, cycles through the axes' color cycle '''
+    if not segments:
+        return
+    if colors is None:
+        cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        colors = [cycle[i % len(cycle)] for i in range(len(segments))]
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=0.8))
+    ax.autoscale()
+
+
+def _values_or_nan(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def _axes(ax):
+    if ax is None:
+        import matplotlib.pyplot as plt
+        plt.figure()
+        ax = plt.gca()
+    return ax
+
+
+def _finish(ax, show):
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return ax
@@ -0,0 +1,76 @@
+import numpy as np
+
+'''
+    Reduces long series to a few thousand points before plotting. A screen can't show more points than it has pixels
+    across, and matplotlib slows to a crawl (and eventually runs out of memory) on millions of points per line, so
+    decimating first gives the same picture at a fraction of the cost. Numpy only - no matplotlib needed.
+
+    minmax_decimate keeps the smallest and largest value of each bucket of points, so spikes and the envelope of noisy
+    data are preserved exactly, in a single vectorized pass. lttb (largest triangle three buckets, Steinarsson 2013)
+    keeps the single most visually significant point per bucket, which looks better for smooth curves.
+'''
+
+
+def decimate(y, n_out, x=None, method='minmax'):
+    ''' Decimates y (and x, defaulting to the indices of y) to about n_out points with the given method.
+
+        Parameters
+            y      - 1D numpy array
+            n_out  - number of points to keep. Series with n_out points or fewer are returned as they are
+            x      - optional 1D array of x values, same size as y
+            method - 'minmax' or 'lttb'
+        Returns
+            x_out  - decimated x values
+            y_out  - decimated y values
+    '''
+    if method == 'minmax':
+        return minmax_decimate(y, n_out, x=x)
+    elif method == 'lttb':
+        return lttb(y, n_out, x=x)
+    raise ValueError("unknown decimation method {}, use 'minmax' or 'lttb'".format(method))
+
+
+def minmax_decimate(y, n_out, x=None):
+    ''' Keeps the minimum and maximum of each of n_out / 2 equal buckets of y, in their original order. See decimate
+        for parameters.
+    '''
+    y = np.asarray(y)
+    x = np.arange(y.size) if x is None else np.asarray(x)
+    if y.size <= n_out or n_out < 2:
+        return x, y
+    bucket_size = int(np.ceil(y.size / (n_out // 2)))
+    n_buckets = int(np.ceil(y.size / bucket_size))
+    # padding the last bucket with its own last value never moves its first minimum or maximum
+    buckets = np.pad(y, (0, n_buckets * bucket_size - y.size), mode='edge').reshape(n_buckets, bucket_size)
+    offsets = np.arange(n_buckets) * bucket_size
+    indices = np.sort(np.column_stack((buckets.argmin(axis=1) + offsets, buckets.argmax(axis=1) + offsets)), axis=1)
+    indices = indices.ravel()
+    return x[indices], y[indices]
+
+
+def lttb(y, n_out, x=None):
+    ''' Largest triangle three buckets. Keeps the first and last points, and from each of n_out - 2 buckets in between
+        the point forming the largest triangle with the point kept from the previous bucket and the average of the
+        next bucket. See decimate for parameters.
+    '''
+    y = np.asarray(y, dtype=float)
+    x = np.arange(y.size, dtype=float) if x is None else np.asarray(x, dtype=float)
+    if y.size <= n_out or n_out < 3:
+        return x, y
+    edges = np.linspace(1, y.size - 1, n_out - 1).astype(int)
+    bucket_sizes = np.diff(edges)
+    # the average point of every bucket, and the last point standing in for the bucket after the last one
+    average_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1) / bucket_sizes, x[-1])
+    average_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1) / bucket_sizes, y[-1])
+
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, y.size - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # twice the triangle areas, the factor doesn't change which is largest
+        areas = np.abs((x[previous] - average_x[bucket + 1]) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (average_y[bucket + 1] - y[previous]))
+        previous = start + np.argmax(areas)
+        kept[bucket + 1] = previous
+    return x[kept], y[kept]
@@ -1,9 +1,33 @@
-import matplotlib.pyplot as plt
+'''
+    The options figures are saved with, as named presets. Used to call plt.savefig when imported - now nothing happens
+    until savefig is called, and matplotlib is only imported then.
+
+    savefig_options is the default 'print' preset, kept under its old name. Presets are plain dicts of plt.savefig
+    keywords, so new ones can be added to presets or passed straight to Figure.savefig.
+'''
 
 filename = 'test.png'
 
-plt.savefig(filename,
-            dpi=600,
-            format='png'
-        
-)
+presets = {'print':  {'dpi': 600, 'format': 'png'},
+           'screen': {'dpi': 100, 'format': 'png'},
+           'report': {'dpi': 150, 'format': 'png', 'bbox_inches': 'tight'},
+           'pdf':    {'format': 'pdf', 'bbox_inches': 'tight'}}
+
+savefig_options = presets['print']
+
+
+def savefig(filename=filename, preset='print', fig=None, **kwargs):
+    ''' Saves a figure with the options of a preset, any of which can be overridden by keyword.
+
+        Parameters
+            filename - file to write
+            preset   - name of a preset in presets
+            fig      - matplotlib Figure to save. Defaults to the current pyplot figure
+    '''
+    if preset not in presets:
+        raise ValueError("unknown savefig preset {}, options are {}".format(preset, sorted(presets)))
+    options = dict(presets[preset], **kwargs)
+    if fig is None:
+        import matplotlib.pyplot as plt
+        fig = plt.gcf()
+    fig.savefig(filename, **options)
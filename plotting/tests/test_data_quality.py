@@ -0,0 +1,64 @@
+import os
+import tempfile
+import numpy as np
+import unittest
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import KB_python.statistical_analysis.error_estimation as error_estimation
+
+
+def fake_data_quality(n_series=5, n_points=50000):
+    rng = np.random.default_rng(0)
+    dq = error_estimation.Data_quality([rng.normal(size=n_points) for _ in range(n_series)])
+    for i in range(n_series):
+        dq.t0.append(None if i == 2 else 100 * i)
+        dq.n_samples_effective.append(None if i == 2 else 1000.0 + i)
+        dq.fract_of_series_used.append(None if i == 2 else 1 - 100 * i / n_points)
+        dq.block_average_profiles.append(None if i == 2 else np.linspace(0.1, 0.5, 5000))
+    return dq
+
+
+class test_plots(unittest.TestCase):
+
+    def setUp(self):
+        self.dq = fake_data_quality()
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_series_drawn_as_one_decimated_collection(self):
+        ax = self.dq.plot_data_with_t0(max_points=500, show=False)
+        self.assertEqual(len(ax.collections), 1)
+        self.assertEqual(len(ax.lines), 0)
+        segments = ax.collections[0].get_segments()
+        # the first series starts at t0 = 0, so has no red segment, and the failed series is skipped
+        self.assertEqual(len(segments), 7)
+        self.assertTrue(all(len(segment) <= 500 for segment in segments))
+
+    def test_block_averages(self):
+        ax = self.dq.plot_block_averages(firstframe=10, max_points=300, show=False)
+        segments = ax.collections[0].get_segments()
+        self.assertEqual(len(segments), 4)
+        self.assertTrue(all(len(segment) == 300 for segment in segments))
+
+
+class test_render_report(unittest.TestCase):
+
+    def test_writes_pages(self):
+        dq = fake_data_quality(n_series=7, n_points=20000)
+        with tempfile.TemporaryDirectory() as output_dir:
+            paths = dq.render_report(output_dir, series_per_page=4, max_points=200, workers=2)
+            # summary page and two pages for the six good series
+            self.assertEqual([os.path.basename(path) for path in paths],
+                             ['report_000.png', 'report_001.png', 'report_002.png'])
+            self.assertTrue(all(os.path.getsize(path) > 0 for path in paths))
+
+            pdf_paths = dq.render_report(output_dir, file_format='pdf', preset='pdf', series_per_page=10)
+            self.assertEqual(len(pdf_paths), 2)
+            with open(pdf_paths[1], 'rb') as pdf:
+                self.assertEqual(pdf.read(4), b'%PDF')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import numpy as np
+import unittest
+import KB_python.plotting.decimation as decimation
+
+
+class test_minmax_decimate(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.y = rng.normal(size=100003)
+        self.y[54321] = 50
+
+    def test_keeps_extremes_in_order(self):
+        x_out, y_out = decimation.minmax_decimate(self.y, 1000)
+        self.assertLessEqual(y_out.size, 1000)
+        self.assertEqual(y_out.max(), 50)
+        self.assertEqual(y_out.min(), self.y.min())
+        self.assertTrue(np.all(np.diff(x_out) >= 0))
+        np.testing.assert_array_equal(self.y[x_out], y_out)
+
+    def test_short_series_unchanged(self):
+        x_out, y_out = decimation.minmax_decimate(self.y[:10], 1000)
+        np.testing.assert_array_equal(y_out, self.y[:10])
+        np.testing.assert_array_equal(x_out, np.arange(10))
+
+
+class test_lttb(unittest.TestCase):
+
+    def test_keeps_endpoints_and_size(self):
+        x = np.linspace(0, 20, 50001)
+        y = np.sin(x)
+        x_out, y_out = decimation.lttb(y, 500, x=x)
+        self.assertEqual(y_out.size, 500)
+        self.assertEqual(x_out[0], x[0])
+        self.assertEqual(x_out[-1], x[-1])
+        self.assertTrue(np.all(np.diff(x_out) > 0))
+        np.testing.assert_allclose(np.sin(x_out), y_out)
+        # the peaks of a smooth curve survive
+        self.assertGreater(y_out.max(), 0.999)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            decimation.decimate(np.arange(10), 5, method='every_nth')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import numpy as np
+
+'''
+    Streaming statistics for periodic quantities such as dihedral angles. Each accumulator takes chunks of angles with
+    update, keeps only running sums or bin counts, and can be combined with another accumulator of the same setup with
+    merge - so a trajectory can be analyzed chunk by chunk, or split between processes, without ever holding every
+    angle of every frame. Angles are in radians.
+'''
+
+
+class CircularStats:
+    ''' Running circular mean, resultant length and variance, separately for every column of the input - eg for every
+        dihedral of a n_frames * n_dihedrals array from angles.compute_dihedrals.
+
+        Parameters
+            n_series - number of columns (angles per frame). Leave as None to take it from the first update
+    '''
+
+    def __init__(self, n_series=None):
+        self.n = 0
+        self.sum_cos = None if n_series is None else np.zeros(n_series)
+        self.sum_sin = None if n_series is None else np.zeros(n_series)
+
+    def update(self, angles):
+        ''' Adds a chunk of angles, n_frames * n_series (or n_frames for a single series) '''
+        angles = np.asarray(angles)
+        if angles.ndim == 1:
+            angles = angles[:, np.newaxis]
+        if self.sum_cos is None:
+            self.sum_cos = np.zeros(angles.shape[1])
+            self.sum_sin = np.zeros(angles.shape[1])
+        elif not angles.shape[1] == self.sum_cos.size:
+            raise ValueError("expected {} series, got angles of shape {}".format(self.sum_cos.size, angles.shape))
+        self.sum_cos += np.cos(angles).sum(axis=0)
+        self.sum_sin += np.sin(angles).sum(axis=0)
+        self.n += angles.shape[0]
+
+    def merge(self, other):
+        ''' Adds the sums of another CircularStats over the same series to this one. Returns self '''
+        if other.sum_cos is None:
+            return self
+        if self.sum_cos is None:
+            self.sum_cos = np.zeros_like(other.sum_cos)
+            self.sum_sin = np.zeros_like(other.sum_sin)
+        elif not self.sum_cos.size == other.sum_cos.size:
+            raise ValueError("can't merge stats of {} and {} series".format(self.sum_cos.size, other.sum_cos.size))
+        self.sum_cos += other.sum_cos
+        self.sum_sin += other.sum_sin
+        self.n += other.n
+        return self
+
+    @property
+    def mean(self):
+        ''' Circular mean of each series, between -pi and pi '''
+        self._check_not_empty()
+        return np.arctan2(self.sum_sin, self.sum_cos)
+
+    @property
+    def resultant_length(self):
+        ''' Mean resultant length R of each series, 1 for identical angles and near 0 for uniformly spread ones '''
+        self._check_not_empty()
+        return np.sqrt(self.sum_cos ** 2 + self.sum_sin ** 2) / self.n
+
+    @property
+    def variance(self):
+        ''' Circular variance, 1 - R '''
+        return 1 - self.resultant_length
+
+    @property
+    def std(self):
+        ''' Circular standard deviation, sqrt(-2 ln R) '''
+        with np.errstate(divide='ignore'):
+            return np.sqrt(-2 * np.log(self.resultant_length))
+
+    def _check_not_empty(self):
+        if not self.n:
+            raise Exception("no angles have been added")
+
+
+class PeriodicHistogram:
+    ''' Histogram of angles with periodic bins - angles outside of the bin range are wrapped back into it, so
+        (-pi, pi] and [0, 2pi) conventions can be mixed.
+
+        Parameters
+            n_bins - number of bins over one period
+            low    - lower edge of the first bin. The bins cover low to low + period
+            period - 2pi for angles in radians
+    '''
+
+    def __init__(self, n_bins=72, low=-np.pi, period=2 * np.pi):
+        self.n_bins = n_bins
+        self.low = low
+        self.period = period
+        self.edges = np.linspace(low, low + period, n_bins + 1)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+
+    @property
+    def bin_centers(self):
+        return (self.edges[1:] + self.edges[:-1]) / 2
+
+    def update(self, angles):
+        ''' Adds a chunk of angles of any shape '''
+        self.counts += np.bincount(_periodic_bins(angles, self.low, self.period, self.n_bins).ravel(),
+                                   minlength=self.n_bins)
+
+    def merge(self, other):
+        ''' Adds the counts of another histogram with the same bins to this one. Returns self '''
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("can't merge histograms with different bins")
+        self.counts += other.counts
+        return self
+
+    def density(self):
+        ''' Probability density, normalized so it integrates to 1 over one period '''
+        return self.counts / (self.counts.sum() * (self.period / self.n_bins))
+
+
+class PeriodicHistogram2D:
+    ''' Joint histogram of pairs of angles (eg phi/psi for a Ramachandran plot), periodic along both axes.
+
+        Parameters
+            n_bins - number of bins per axis, an int or a (n_bins_x, n_bins_y) tuple
+            low    - lower edge of the first bin along both axes
+            period - 2pi for angles in radians
+    '''
+
+    def __init__(self, n_bins=72, low=-np.pi, period=2 * np.pi):
+        self.n_bins = (n_bins, n_bins) if np.isscalar(n_bins) else tuple(n_bins)
+        self.low = low
+        self.period = period
+        self.edges_x = np.linspace(low, low + period, self.n_bins[0] + 1)
+        self.edges_y = np.linspace(low, low + period, self.n_bins[1] + 1)
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+
+    def update(self, angles_x, angles_y):
+        ''' Adds a chunk of angle pairs. angles_x and angles_y can be any shape, but must be the same shape '''
+        angles_x, angles_y = np.asarray(angles_x), np.asarray(angles_y)
+        if not angles_x.shape == angles_y.shape:
+            raise ValueError("angle arrays differ in shape, {} and {}".format(angles_x.shape, angles_y.shape))
+        bins_x = _periodic_bins(angles_x, self.low, self.period, self.n_bins[0])
+        bins_y = _periodic_bins(angles_y, self.low, self.period, self.n_bins[1])
+        flat_bins = (bins_x * self.n_bins[1] + bins_y).ravel()
+        self.counts += np.bincount(flat_bins, minlength=self.counts.size).reshape(self.n_bins)
+
+    def merge(self, other):
+        ''' Adds the counts of another histogram with the same bins to this one. Returns self '''
+        if not (np.array_equal(self.edges_x, other.edges_x) and np.array_equal(self.edges_y, other.edges_y)):
+            raise ValueError("can't merge histograms with different bins")
+        self.counts += other.counts
+        return self
+
+    def density(self):
+        ''' Probability density, normalized so it integrates to 1 over the period squared '''
+        bin_area = (self.period / self.n_bins[0]) * (self.period / self.n_bins[1])
+        return self.counts / (self.counts.sum() * bin_area)
+
+
+def _periodic_bins(angles, low, period, n_bins):
+    ''' Bin index of every angle, with angles outside low to low + period wrapped by the period '''
+    bins = np.floor((np.asarray(angles) - low) * (n_bins / period)).astype(np.int64)
+    # floating point can put an angle of exactly low + period into bin n_bins, which wraps to 0 like low does
+    return np.mod(bins, n_bins, out=bins)
@@ -0,0 +1,88 @@
+import numpy as np
+import unittest
+import KB_python.statistical_analysis.circular as circular
+
+
+class test_circular_stats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        # von mises series centered near the periodic boundary, where a plain mean fails
+        self.angles = np.angle(np.exp(1j * rng.vonmises([3.0, -2.5, 0.5], [8, 2, 50], size=(1000, 3))))
+
+    def test_matches_direct_calculation(self):
+        stats = circular.CircularStats()
+        stats.update(self.angles)
+        resultant = np.exp(1j * self.angles).mean(axis=0)
+        np.testing.assert_allclose(stats.mean, np.angle(resultant))
+        np.testing.assert_allclose(stats.resultant_length, np.abs(resultant))
+        np.testing.assert_allclose(stats.variance, 1 - np.abs(resultant))
+        np.testing.assert_allclose(stats.std, np.sqrt(-2 * np.log(np.abs(resultant))))
+
+    def test_chunked_and_merged(self):
+        whole = circular.CircularStats()
+        whole.update(self.angles)
+        chunked = circular.CircularStats(n_series=3)
+        for start in range(0, 1000, 300):
+            chunked.update(self.angles[start:start + 300])
+        first, second = circular.CircularStats(), circular.CircularStats()
+        first.update(self.angles[:400])
+        second.update(self.angles[400:])
+        merged = circular.CircularStats().merge(first).merge(second)
+        for stats in (chunked, merged):
+            self.assertEqual(stats.n, 1000)
+            np.testing.assert_allclose(stats.mean, whole.mean)
+            np.testing.assert_allclose(stats.resultant_length, whole.resultant_length)
+
+    def test_exceptions(self):
+        stats = circular.CircularStats()
+        with self.assertRaises(Exception):
+            stats.mean
+        stats.update(self.angles)
+        self.assertRaises(ValueError, stats.update, self.angles[:, :2])
+        other = circular.CircularStats()
+        other.update(self.angles[:, 0])
+        self.assertRaises(ValueError, stats.merge, other)
+
+
+class test_periodic_histograms(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(9)
+        self.phi = rng.uniform(-np.pi, np.pi, size=(500, 4))
+        self.psi = rng.uniform(-np.pi, np.pi, size=(500, 4))
+
+    def test_1D_matches_numpy(self):
+        histogram = circular.PeriodicHistogram(n_bins=36)
+        histogram.update(self.phi)
+        np.testing.assert_array_equal(histogram.counts, np.histogram(self.phi, bins=histogram.edges)[0])
+        self.assertAlmostEqual((histogram.density() * 2 * np.pi / 36).sum(), 1)
+
+    def test_1D_wraps_angles(self):
+        shifted, histogram = circular.PeriodicHistogram(n_bins=36), circular.PeriodicHistogram(n_bins=36)
+        histogram.update(self.phi)
+        shifted.update(np.mod(self.phi, 2 * np.pi))
+        np.testing.assert_array_equal(shifted.counts, histogram.counts)
+        edge = circular.PeriodicHistogram(n_bins=4)
+        edge.update([np.pi, -np.pi])
+        np.testing.assert_array_equal(edge.counts, [2, 0, 0, 0])
+
+    def test_2D_matches_numpy(self):
+        histogram = circular.PeriodicHistogram2D(n_bins=(24, 18))
+        histogram.update(self.phi, self.psi)
+        expected = np.histogram2d(self.phi.ravel(), self.psi.ravel(), bins=(histogram.edges_x, histogram.edges_y))[0]
+        np.testing.assert_array_equal(histogram.counts, expected)
+
+    def test_merge(self):
+        whole, first, second = [circular.PeriodicHistogram2D(n_bins=24) for _ in range(3)]
+        whole.update(self.phi, self.psi)
+        first.update(self.phi[:200], self.psi[:200])
+        second.update(self.phi[200:], self.psi[200:])
+        np.testing.assert_array_equal(first.merge(second).counts, whole.counts)
+        self.assertRaises(ValueError, whole.merge, circular.PeriodicHistogram2D(n_bins=12))
+        self.assertRaises(ValueError, circular.PeriodicHistogram(36).merge, circular.PeriodicHistogram(24))
+        self.assertRaises(ValueError, whole.update, self.phi, self.psi[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+import numpy as np
+import unittest
+from pymbar.timeseries import detectEquilibration
+import KB_python.statistical_analysis.error_estimation as error_estimation
+
+
+def ar1_series(n, phi, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size=n)
+    series = np.empty(n)
+    series[0] = noise[0]
+    for i in range(1, n):
+        series[i] = phi * series[i - 1] + noise[i]
+    return series
+
+
+def reference_acf(series, nlags):
+    ''' Biased autocorrelation estimate by direct summation, as statsmodels.tsa.stattools.acf computes it '''
+    centered = series - series.mean()
+    n_obs = centered.size
+    autocovariance = np.array([(centered[:n_obs - k] * centered[k:]).sum() / n_obs for k in range(nlags + 1)])
+    return autocovariance / autocovariance[0]
+
+
+class test_block_average_range(unittest.TestCase):
+
+    def test_matches_block_average(self):
+        for n_obs in (997, 1000, 2048):
+            data = ar1_series(n_obs, 0.8, seed=n_obs) + 50
+            block_range = np.arange(1, n_obs // 10)
+            for cutoff in (0.5, 0, 4, 1000):
+                expected = np.array([error_estimation.block_average(data, b, partial_block_cutoff_size=cutoff)
+                                     for b in block_range])
+                result = error_estimation.block_average_range(data, block_range, partial_block_cutoff_size=cutoff)
+                np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-12)
+
+    def test_small_batches_and_unordered_block_sizes(self):
+        data = ar1_series(3000, 0.5)
+        block_range = np.array([7, 1, 300, 2, 45, 3000, 5000])
+        expected = np.array([error_estimation.block_average(data, b) for b in block_range])
+        result = error_estimation.block_average_range(data, block_range, max_blocks_per_batch=100)
+        np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-12)
+
+    def test_bad_block_size(self):
+        self.assertRaises(ValueError, error_estimation.block_average_range, np.ones(10), np.arange(0, 3))
+
+
+class test_blocking_standard_errors(unittest.TestCase):
+
+    def test_levels(self):
+        data = ar1_series(1000, 0.3)
+        block_sizes, se, se_error = error_estimation.blocking_standard_errors(data)
+        np.testing.assert_array_equal(block_sizes, 2 ** np.arange(9))
+        self.assertAlmostEqual(se[0], data.std() / np.sqrt(999))
+        second_level = 0.5 * (data[::2] + data[1::2])
+        self.assertAlmostEqual(se[1], second_level.std() / np.sqrt(499))
+        np.testing.assert_allclose(se_error, se / np.sqrt(2 * (1000 / block_sizes // 1 - 1)), rtol=0.01)
+
+    def test_plateau_matches_ar1_error(self):
+        phi = 0.9
+        data = ar1_series(2 ** 17, phi, seed=3)
+        _, se, se_error = error_estimation.blocking_standard_errors(data)
+        # standard error of the mean of an AR(1) process, for unit noise
+        expected = np.sqrt(1 / (1 - phi ** 2) * (1 + phi) / (1 - phi) / data.size)
+        self.assertLess(se[0], expected / 2)
+        self.assertAlmostEqual(se[9], expected, delta=3 * se_error[9])
+
+
+class test_batched_acf(unittest.TestCase):
+
+    def setUp(self):
+        self.series = np.array([ar1_series(500, phi, seed=i) for i, phi in enumerate((0.0, 0.5, 0.9, 0.99))])
+
+    def test_matches_direct_sum(self):
+        acfs = error_estimation.batched_acf(self.series, 50)
+        self.assertEqual(acfs.shape, (4, 51))
+        for series, series_acf in zip(self.series, acfs):
+            np.testing.assert_allclose(series_acf, reference_acf(series, 50), atol=1e-10)
+        np.testing.assert_allclose(error_estimation.batched_acf(self.series[1], 50)[0], acfs[1])
+
+    def test_padded_series(self):
+        lengths = np.array([500, 300, 120, 40])
+        padded = self.series.copy()
+        padded[np.arange(500) >= lengths[:, np.newaxis]] = 1e6
+        acfs = error_estimation.batched_acf(padded, 60, lengths=lengths)
+        for series, length, series_acf in zip(self.series, lengths, acfs):
+            n_lags = min(60, length - 1)
+            np.testing.assert_allclose(series_acf[:n_lags + 1], reference_acf(series[:length], n_lags),
+                                       atol=1e-10)
+            self.assertTrue(np.all(np.isnan(series_acf[n_lags + 1:])))
+        self.assertRaises(ValueError, error_estimation.batched_acf, self.series, 10, lengths=[10, 10, 10, 501])
+
+    def test_empty_series(self):
+        self.assertRaises(ValueError, error_estimation.batched_acf, np.zeros(0), 10)
+        self.assertRaises(ValueError, error_estimation.batched_acf, np.zeros((3, 0)), 10)
+        self.assertRaises(ValueError, error_estimation.integrated_autocorrelation_time, np.zeros(0))
+        self.assertRaises(ValueError, error_estimation.integrated_autocorrelation_time, np.ones((2, 1)))
+
+    def test_decorrelation_lags(self):
+        acfs = np.array([[1, 0.5, -0.1, 0.2], [1, 0.9, 0.8, 0.7]])
+        np.testing.assert_array_equal(error_estimation.decorrelation_lags(acfs), [2, -1])
+        np.testing.assert_array_equal(error_estimation.decorrelation_lags(acfs, corr_thresh=0.85), [1, 2])
+
+    def test_integrated_autocorrelation_time(self):
+        phi = 0.8
+        long_series = np.array([ar1_series(2 ** 16, phi, seed=i) for i in range(3)])
+        tau_int, windows = error_estimation.integrated_autocorrelation_time(
+            error_estimation.batched_acf(long_series, 500))
+        np.testing.assert_allclose(tau_int, (1 + phi) / (1 - phi), rtol=0.15)
+        self.assertTrue(np.all(windows >= 5 * tau_int))
+        # too few lags to satisfy the window condition
+        _, windows = error_estimation.integrated_autocorrelation_time(error_estimation.batched_acf(long_series, 10))
+        np.testing.assert_array_equal(windows, -1)
+
+    def test_check_decorrelation_uses_acf(self):
+        data = self.series[2]
+        expected = reference_acf(data, 50)
+        np.testing.assert_allclose(error_estimation.check_decorrelation(data, plot=False, retval="decorr_plot"),
+                                   expected, atol=1e-10)
+        self.assertEqual(error_estimation.check_decorrelation(data, plot=False, retval="decorr_frame"),
+                         np.argmax(expected < 0))
+
+
+class test_detect_equilibration(unittest.TestCase):
+
+    def setUp(self):
+        # correlated series with an initial relaxation of varying length
+        self.series = [ar1_series(n, phi, seed=n) + 5 * np.exp(-np.arange(n) / relaxation)
+                       for n, phi, relaxation in ((400, 0.5, 30), (900, 0.9, 150), (1500, 0.7, 400), (600, 0.95, 5))]
+
+    def test_matches_pymbar(self):
+        for series in self.series:
+            t0, g, neff = error_estimation.detect_equilibration(series)
+            expected_t0, expected_g, expected_neff = detectEquilibration(series)
+            self.assertEqual(t0, expected_t0)
+            self.assertAlmostEqual(g / expected_g, 1, delta=1e-6)
+            self.assertAlmostEqual(neff / expected_neff, 1, delta=1e-6)
+
+    def test_slow_mode_matches_pymbar(self):
+        series = self.series[0]
+        t0, g, _ = error_estimation.detect_equilibration(series, fast=False)
+        expected_t0, expected_g, _ = detectEquilibration(series, fast=False)
+        self.assertEqual(t0, expected_t0)
+        self.assertAlmostEqual(g / expected_g, 1, delta=1e-6)
+
+    def test_coarse_grid(self):
+        series = self.series[1]
+        t0, g, neff = error_estimation.detect_equilibration(series, nskip=20)
+        full_t0, _, full_neff = error_estimation.detect_equilibration(series)
+        self.assertLessEqual(neff, full_neff)
+        self.assertGreater(neff, 0.9 * full_neff)
+        unrefined_t0, _, _ = error_estimation.detect_equilibration(series, nskip=20, refine=False)
+        self.assertEqual(unrefined_t0 % 20, 0)
+
+    def test_constant_series(self):
+        self.assertEqual(error_estimation.detect_equilibration(np.ones(100)), (0, 1, 1))
+        series = np.concatenate([ar1_series(100, 0.5), np.full(50, 2.0)])
+        t0, g, _ = error_estimation.detect_equilibration(series)
+        expected_t0, expected_g, _ = detectEquilibration(series)
+        self.assertEqual(t0, expected_t0)
+        self.assertAlmostEqual(g / expected_g, 1, delta=1e-6)
+
+    def test_assess_equilibration_methods(self):
+        series = self.series[2]
+        self.assertEqual(error_estimation.assess_equilibration(series, method="fast")[0],
+                         error_estimation.assess_equilibration(series)[0])
+        self.assertRaises(ValueError, error_estimation.assess_equilibration, series, method="slow")
+
+
+class test_analyze_group_of_time_series(unittest.TestCase):
+
+    def setUp(self):
+        self.series = [ar1_series(n, 0.8, seed=n) + 3 * np.exp(-np.arange(n) / 50) for n in (300, 450, 600, 350, 500)]
+
+    def assert_same_analysis(self, result, expected):
+        self.assertEqual(result.t0, expected.t0)
+        self.assertEqual(result.fract_of_series_used, expected.fract_of_series_used)
+        np.testing.assert_allclose(result.n_samples_effective, expected.n_samples_effective)
+        for profile, expected_profile in zip(result.block_average_profiles, expected.block_average_profiles):
+            np.testing.assert_allclose(profile, expected_profile)
+
+    def test_parallel_matches_serial(self):
+        serial = error_estimation.analyze_group_of_time_series(self.series)
+        parallel = error_estimation.analyze_group_of_time_series(self.series, workers=2, chunksize=2)
+        self.assertEqual(parallel.errors, {})
+        self.assert_same_analysis(parallel, serial)
+        self.assertEqual(serial.t0[0], error_estimation.assess_equilibration(self.series[0])[0])
+
+    def test_failing_series_is_reported(self):
+        series = self.series[:2] + [np.array([])] + self.series[2:]
+        for workers in (1, 2):
+            result = error_estimation.analyze_group_of_time_series(series, workers=workers, method="fast")
+            self.assertEqual(list(result.errors.keys()), [2])
+            self.assertIsNone(result.t0[2])
+            self.assertIsNone(result.block_average_profiles[2])
+            expected = error_estimation.analyze_group_of_time_series(self.series, method="fast")
+            result.t0.pop(2)
+            result.n_samples_effective.pop(2)
+            result.fract_of_series_used.pop(2)
+            result.block_average_profiles.pop(2)
+            self.assert_same_analysis(result, expected)
+
+    def test_reasonable_first_frame_skips_failed_series(self):
+        series = self.series[:2] + [np.array([])] + self.series[2:]
+        result = error_estimation.analyze_group_of_time_series(series, method="fast")
+        expected = error_estimation.analyze_group_of_time_series(self.series, method="fast")
+        self.assertEqual(result.get_reasonable_first_frame(cutoff=0.5), expected.get_reasonable_first_frame(cutoff=0.5))
+
+
+class test_online_blocking_estimator(unittest.TestCase):
+
+    def test_matches_blocking_standard_errors(self):
+        data = ar1_series(5000, 0.9) + 10
+        estimator = error_estimation.OnlineBlockingEstimator()
+        rng = np.random.default_rng(0)
+        start = 0
+        while start < data.size:
+            stop = start + rng.integers(1, 400)
+            estimator.update(data[start:stop])
+            start = stop
+            expected = error_estimation.blocking_standard_errors(data[:stop])
+            for result, expected_values in zip(estimator.standard_errors(), expected):
+                np.testing.assert_allclose(result, expected_values, rtol=1e-8)
+        self.assertEqual(estimator.n, 5000)
+        self.assertAlmostEqual(estimator.mean, data.mean())
+
+    def test_single_points_and_memory(self):
+        estimator = error_estimation.OnlineBlockingEstimator()
+        for value in ar1_series(1000, 0.5):
+            estimator.update(value)
+        self.assertEqual(len(estimator._counts), 10)
+        self.assertTrue(sum(value is not None for value in estimator._unpaired) <= 10)
+
+    def test_plateau(self):
+        phi = 0.9
+        estimator = error_estimation.OnlineBlockingEstimator()
+        estimator.update(ar1_series(300, 0.995))
+        is_converged, block_size, se = estimator.plateau()
+        self.assertFalse(is_converged)
+        self.assertIsNone(block_size)
+        # 300 points leave 5 levels with at least 10 blocks
+        self.assertEqual(se, estimator.standard_errors()[1][:5].max())
+        estimator = error_estimation.OnlineBlockingEstimator()
+        estimator.update(ar1_series(2 ** 17, phi, seed=3))
+        is_converged, block_size, se = estimator.plateau()
+        self.assertTrue(is_converged)
+        self.assertGreater(block_size, 8)
+        expected = np.sqrt(1 / (1 - phi ** 2) * (1 + phi) / (1 - phi) / estimator.n)
+        self.assertAlmostEqual(se, expected, delta=0.25 * expected)
+
+    def test_empty(self):
+        estimator = error_estimation.OnlineBlockingEstimator()
+        with self.assertRaises(Exception):
+            estimator.mean
+        is_converged, block_size, se = estimator.plateau()
+        self.assertFalse(is_converged)
+        self.assertTrue(np.isnan(se))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np  # noqa
 import KB_python.file_io as file_io
 
@@ -48,6 +52,143 @@ class test_load_xvg(unittest.TestCase):
     def test_xvg_column_mismatch_error(self):
         self.assertRaises(ValueError, file_io.load_xvg, file_prefix + '/data_1D.xvg', dims=3)
 
+    def test_particle_selection(self):
+        data, time = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3, return_time_data=True)
+        selected, selected_time = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3, return_time_data=True,
+                                                   particles=[7, 2, 3])
+        np.testing.assert_array_equal(selected, data[:, [7, 2, 3]])
+        np.testing.assert_array_equal(selected_time, time)
+
+    def test_particle_selection_by_index_group(self):
+        data = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3)
+        selected = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3, particles='data2',
+                                    index_file=file_prefix + '/gromacs_index.ndx')
+        np.testing.assert_array_equal(selected, data[:, 3:9])
+
+    def test_particle_selection_checks_row_width(self):
+        # a short and a long row that both still contain the selected columns
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for bad_row in ('3 1 2 3 4\n', '3 1 2 3 4 5 6 7 8\n'):
+                ragged = os.path.join(tmpdir, 'ragged.xvg')
+                with open(ragged, 'w') as fout:
+                    fout.write('@ header\n0 1 2 3 4 5 6\n1 1 2 3 4 5 6\n2 1 2 3 4 5 6\n' + bad_row)
+                with self.assertRaises(Exception) as context:
+                    file_io.load_xvg(ragged, dims=3, particles=[0])
+                self.assertIn("row 3", str(context.exception))
+                with self.assertRaises(Exception):
+                    list(file_io.iter_xvg(ragged, dims=3, particles=[0]))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_particle_selection_errors(self):
+        self.assertRaises(ValueError, file_io.load_xvg, file_prefix + '/data_3D.xvg', particles=[10])
+        self.assertRaises(ValueError, file_io.load_xvg, file_prefix + '/data_3D.xvg', particles='data1')
+
+
+class test_iter_xvg(unittest.TestCase):
+
+    def test_chunks_match_load_xvg(self):
+        data, time = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3, return_time_data=True)
+        chunks = list(file_io.iter_xvg(file_prefix + '/data_3D.xvg', dims=3, chunk_frames=4))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0][0].shape, (4, 10, 3))
+        self.assertEqual(chunks[1][0].shape, (2, 10, 3))
+        np.testing.assert_array_equal(np.concatenate([c[0] for c in chunks]), data)
+        np.testing.assert_array_equal(np.concatenate([c[1] for c in chunks]), time)
+
+    def test_comments(self):
+        chunks = list(file_io.iter_xvg(file_prefix + '/data_&comments.xvg', dims=3, comments=('#', '@', '&')))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0][0].shape, (6, 10, 3))
+
+    def test_column_mismatch_error(self):
+        with self.assertRaises(ValueError):
+            next(file_io.iter_xvg(file_prefix + '/data_1D.xvg', dims=3))
+
+    def test_particle_selection(self):
+        data = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3)
+        chunks = list(file_io.iter_xvg(file_prefix + '/data_3D.xvg', dims=3, chunk_frames=4, particles=[9, 0]))
+        np.testing.assert_array_equal(np.concatenate([c[0] for c in chunks]), data[:, [9, 0]])
+
+    def test_row_inconsistency_error(self):
+        with self.assertRaises(Exception):
+            list(file_io.iter_xvg(file_prefix + '/data_missing_column.xvg', dims=1, chunk_frames=2))
+
+
+class test_xvg_follower(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmpdir, 'growing.xvg')
+        with open(file_prefix + '/data_3D.xvg') as fin:
+            self.lines = fin.readlines()
+        self.n_header = sum(line[0] in '#@' for line in self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text):
+        with open(self.file, 'a') as fout:
+            fout.write(text)
+
+    def test_returns_only_new_complete_frames(self):
+        data, time = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3, return_time_data=True)
+        follower = file_io.XvgFollower(self.file, dims=3)
+        self.write(''.join(self.lines[:self.n_header - 3]))
+        coords, times = follower.poll()
+        self.assertEqual(coords.shape[0], 0)
+
+        # header and two frames, plus half of the third
+        third = self.lines[self.n_header + 2]
+        self.write(''.join(self.lines[self.n_header - 3:self.n_header + 2]) + third[:20])
+        coords, times = follower.poll()
+        np.testing.assert_array_equal(coords, data[:2])
+        np.testing.assert_array_equal(times, time[:2])
+        self.assertEqual(follower.poll()[0].shape, (0, 10, 3))
+
+        self.write(third[20:] + ''.join(self.lines[self.n_header + 3:]).rstrip('\n'))
+        coords, times = follower.poll()
+        np.testing.assert_array_equal(coords, data[2:5])
+        coords, times = follower.poll(final=True)
+        np.testing.assert_array_equal(coords, data[5:])
+        self.assertEqual(follower.n_frames, 6)
+
+    def test_particle_selection(self):
+        data = file_io.load_xvg(file_prefix + '/data_3D.xvg', dims=3)
+        follower = file_io.XvgFollower(self.file, dims=3, particles=[4, 1])
+        self.write(''.join(self.lines[:self.n_header]))
+        self.assertEqual(follower.poll()[0].shape[0], 0)
+        self.write(''.join(self.lines[self.n_header:]))
+        np.testing.assert_array_equal(follower.poll()[0], data[:, [4, 1]])
+
+
+class test_load_xvg_many(unittest.TestCase):
+    paths = [file_prefix + '/data_3D.xvg', file_prefix + '/fake_3D_data.xvg', file_prefix + '/missing_file.xvg']
+
+    def test_serial_and_parallel_agree(self):
+        serial, serial_errors = file_io.load_xvg_many(self.paths, dims=3, workers=1, verbose=False)
+        parallel, parallel_errors = file_io.load_xvg_many(self.paths, dims=3, workers=2, verbose=False)
+        for serial_data, parallel_data in zip(serial[:2], parallel[:2]):
+            np.testing.assert_array_equal(serial_data, parallel_data)
+        self.assertIsNone(parallel[2])
+        self.assertEqual(list(parallel_errors.keys()), [self.paths[2]])
+        self.assertEqual(serial_errors.keys(), parallel_errors.keys())
+
+    def test_stacked_output(self):
+        paths = [file_prefix + '/data_3D.xvg', file_prefix + '/data_&comments.xvg', file_prefix + '/missing_file.xvg']
+        (coords, times, lengths), errors = file_io.load_xvg_many(paths, dims=3, workers=2, stack=True,
+                                                                 comments=('#', '@', '&'), return_time_data=True,
+                                                                 verbose=False)
+        self.assertEqual(list(lengths), [6, 6, 0])
+        self.assertEqual(coords.shape, (3, 6, 10, 3))
+        self.assertTrue(np.all(np.isnan(coords[2])))
+        self.assertEqual(times.shape, (3, 6))
+
+    def test_mismatched_particles_cant_stack(self):
+        paths = [file_prefix + '/data_3D.xvg', file_prefix + '/fake_3D_data.xvg']
+        with self.assertRaises(ValueError):
+            file_io.load_xvg_many(paths, dims=3, workers=1, stack=True, verbose=False)
+
 
 class test_load_large_text_file(unittest.TestCase):
     def test_loads_data(self):
@@ -62,15 +203,138 @@ class test_load_large_text_file(unittest.TestCase):
         data = file_io.load_large_text_file(file_prefix + '/data_trailing_whitespace.xvg', verbose=False)
         self.assertEqual(data.shape, (3, 7))
 
+    def test_small_blocks_match_loadtxt(self):
+        # lines and the header are split across many reads
+        reference = np.loadtxt(file_prefix + '/data_3D.xvg', comments=('#', '@'))
+        for block_bytes in (7, 100, 1000):
+            data = file_io.load_large_text_file(file_prefix + '/data_3D.xvg', verbose=False, block_bytes=block_bytes)
+            np.testing.assert_array_equal(data, reference)
+
+    def test_reports_inconsistent_row(self):
+        with self.assertRaises(Exception) as context:
+            file_io.load_large_text_file(file_prefix + '/data_missing_column.xvg', verbose=False, block_bytes=20)
+        self.assertIn("row 2", str(context.exception))
+
+
+class test_cache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmpdir, 'data_3D.xvg')
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        shutil.copy(file_prefix + '/data_3D.xvg', self.file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_second_load_is_memory_mapped(self):
+        data, time = file_io.load_xvg(self.file, dims=3, return_time_data=True, cache=self.cache_dir)
+        cached_data, cached_time = file_io.load_xvg(self.file, dims=3, return_time_data=True, cache=self.cache_dir)
+        self.assertIsInstance(cached_data.base, np.memmap)
+        np.testing.assert_array_equal(data, cached_data)
+        np.testing.assert_array_equal(time, cached_time)
+
+    def test_default_cache_directory(self):
+        file_io.load_large_text_file(self.file, verbose=False, cache=True)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmpdir, '.xvg_cache'))), 1)
+
+    def test_options_and_modification_invalidate(self):
+        file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        data_1d = file_io.load_xvg(self.file, dims=1, cache=self.cache_dir)
+        self.assertEqual(data_1d.shape, (6, 30, 1))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        with open(self.file, 'a') as fout:
+            fout.write('120' + '\t1' * 30 + '\n')
+        os.utime(self.file, ns=(0, os.stat(self.file).st_mtime_ns + 10 ** 9))
+        data = file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        self.assertEqual(data.shape[0], 7)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)   # sidecars of the old file were dropped
+
+    def test_clear_and_evict(self):
+        file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        file_io.load_xvg(self.file, dims=1, cache=self.cache_dir)
+        self.assertEqual(file_io.evict_cache(self.cache_dir, max_bytes=1), 2)
+        file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        self.assertEqual(file_io.clear_cache(self.file, cache_dir=self.cache_dir), 1)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_sidecar_evicted_during_load(self):
+        data = file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        utime = os.utime
+
+        def utime_then_evict(path, *args, **kwargs):
+            # another session evicts the sidecar just after this one found it
+            utime(path, *args, **kwargs)
+            file_io.evict_cache(self.cache_dir, max_bytes=0)
+
+        with mock.patch.object(file_io.os, 'utime', utime_then_evict):
+            reloaded = file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        np.testing.assert_array_equal(reloaded, data)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)   # rewritten by the reload
+
+    def test_concurrent_evictions(self):
+        file_io.load_xvg(self.file, dims=3, cache=self.cache_dir)
+        file_io.load_xvg(self.file, dims=1, cache=self.cache_dir)
+        stat = os.stat
+        evicted = []
+
+        def stat_then_evict(path, *args, **kwargs):
+            # a second eviction runs to completion once the first has listed the directory
+            result = stat(path, *args, **kwargs)
+            if not evicted:
+                evicted.append(None)
+                evicted.append(file_io.evict_cache(self.cache_dir, max_bytes=1))
+            return result
+
+        with mock.patch.object(file_io.os, 'stat', stat_then_evict):
+            self.assertEqual(file_io.evict_cache(self.cache_dir, max_bytes=1), 0)
+        self.assertEqual(evicted[1], 2)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
 
 class test_load_gromacs_index(unittest.TestCase):
     def test_load_index(self):
         indices = file_io.load_gromacs_index('test_ref_data/file_io/gromacs_index.ndx')
-        self.assertEqual(indices['data1'], [0, 1, 2] )   # index is one less than found in index file
-        self.assertEqual(indices['data2'], [3, 4, 5, 6, 7, 8])
-        self.assertEqual(indices['data3'], [9])
+        self.assertEqual(indices['data1'].tolist(), [0, 1, 2] )   # index is one less than found in index file
+        self.assertEqual(indices['data2'].tolist(), [3, 4, 5, 6, 7, 8])
+        self.assertEqual(indices['data3'].tolist(), [9])
+        self.assertEqual(indices['data1'].dtype, np.int32)
         self.assertNotIn( 'data4', indices.keys())   # data4 is empty, don't make a key
 
+    def test_cached_index(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            indices = file_io.load_gromacs_index('test_ref_data/file_io/gromacs_index.ndx', cache=tmpdir)
+            cached = file_io.load_gromacs_index('test_ref_data/file_io/gromacs_index.ndx', cache=tmpdir)
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+            self.assertEqual(list(cached.keys()), list(indices.keys()))
+            for name in indices:
+                np.testing.assert_array_equal(cached[name], indices[name])
+
+            # group names that are also keyword arguments of np.savez
+            index_file = os.path.join(tmpdir, 'named.ndx')
+            with open(index_file, 'w') as fout:
+                fout.write('[ file ]\n1 2 3\n[ allow_pickle ]\n4 5\n[ arr_0 ]\n6\n')
+            indices = file_io.load_gromacs_index(index_file, cache=tmpdir)
+            cached = file_io.load_gromacs_index(index_file, cache=tmpdir)
+            self.assertEqual(list(cached.keys()), ['file', 'allow_pickle', 'arr_0'])
+            for name in indices:
+                np.testing.assert_array_equal(cached[name], indices[name])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class test_index_algebra(unittest.TestCase):
+    def test_union(self):
+        self.assertEqual(file_io.index_union([3, 1], np.array([1, 5]), [0]).tolist(), [0, 1, 3, 5])
+
+    def test_intersection(self):
+        self.assertEqual(file_io.index_intersection([3, 1, 2], [2, 3, 7], [3, 2]).tolist(), [2, 3])
+
+    def test_difference(self):
+        self.assertEqual(file_io.index_difference([4, 1, 2, 3], [3], [1, 9]).tolist(), [2, 4])
+        self.assertEqual(file_io.index_difference([4, 1, 4]).tolist(), [1, 4])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import unittest
+
+'''
+    Importing the analysis modules has to stay cheap for short batch jobs - no plotting stack, no heavy optional
+    dependencies, no output. Each check runs in a fresh interpreter so that nothing is already imported.
+'''
+
+CORE_MODULES = ['KB_python.instrumentation',
+                'KB_python.file_io',
+                'KB_python.trajectory_io',
+                'KB_python.trajectory_store',
+                'KB_python.coordinate_manipulation.periodic',
+                'KB_python.coordinate_manipulation.angles',
+                'KB_python.coordinate_manipulation.transformations',
+                'KB_python.coordinate_manipulation.neighbors',
+                'KB_python.coordinate_manipulation.rdf',
+                'KB_python.coordinate_manipulation.density',
+                'KB_python.statistical_analysis.error_estimation',
+                'KB_python.statistical_analysis.circular',
+                'KB_python.plotting.savefig_options']
+
+HEAVY_MODULES = ['matplotlib', 'pymbar', 'statsmodels', 'scipy']
+
+# seconds for importing every core module on top of numpy. Generous for slow shared filesystems, but well under the
+# seconds that matplotlib and pymbar used to add
+IMPORT_BUDGET = 1.0
+
+IMPORT_SCRIPT = '''
+import sys, time
+import numpy
+start = time.perf_counter()
+for module in {modules}:
+    __import__(module)
+elapsed = time.perf_counter() - start
+print(repr((elapsed, [name for name in {heavy} if name in sys.modules])))
+'''
+
+
+def run_fresh(script):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True, env=env)
+
+
+class test_core_imports(unittest.TestCase):
+
+    def test_no_heavy_imports_and_within_budget(self):
+        output = run_fresh(IMPORT_SCRIPT.format(modules=CORE_MODULES, heavy=HEAVY_MODULES)).stdout
+        elapsed, heavy_loaded = eval(output.strip().splitlines()[-1])
+        self.assertEqual(heavy_loaded, [])
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_imports_are_silent(self):
+        result = run_fresh("import " + ", ".join(CORE_MODULES))
+        self.assertEqual(result.stdout, '')
+        self.assertEqual(result.stderr, '')
+
+    def test_plotting_layer_loads_on_use(self):
+        script = ("import sys, os\n"
+                  "os.environ['MPLBACKEND'] = 'Agg'\n"
+                  "import numpy as np\n"
+                  "import KB_python.statistical_analysis.error_estimation as error_estimation\n"
+                  "error_estimation.check_decorrelation(np.sin(np.arange(500) / 7.0), plot=True)\n"
+                  "print('matplotlib' in sys.modules)\n")
+        self.assertEqual(run_fresh(script).stdout.strip(), 'True')
+
+
+if __name__ == '__main__':
+    unittest.main()
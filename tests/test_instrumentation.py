@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import time
+import unittest
+import numpy as np
+import KB_python.instrumentation as instrumentation
+import KB_python.file_io as file_io
+import KB_python.coordinate_manipulation.periodic as periodic
+import KB_python.statistical_analysis.error_estimation as error_estimation
+
+file_prefix = './test_ref_data/file_io'
+
+
+class test_instrumentation(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.registry.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.registry.reset()
+
+    def test_nothing_recorded_when_disabled(self):
+        file_io.load_xvg(file_prefix + '/data_3D.xvg')
+        with instrumentation.stage('test.stage') as current:
+            current.add(frames=10)
+        self.assertEqual(instrumentation.registry.stages(), [])
+
+    def test_entry_points_record_throughput(self):
+        instrumentation.enable()
+        path = file_prefix + '/data_3D.xvg'
+        data = file_io.load_xvg(path)
+        file_io.load_xvg(path, return_time_data=True)
+        periodic.calc_vectors(data, data[:, ::-1].copy(), np.full((data.shape[0], 3), 10.0))
+        error_estimation.block_average_range(np.arange(100.0), np.arange(1, 10))
+
+        load = instrumentation.registry.get('file_io.load_xvg')
+        self.assertEqual(load.calls, 2)
+        self.assertEqual(load.bytes, 2 * os.path.getsize(path))
+        self.assertEqual(load.frames, 2 * data.shape[0])
+        self.assertAlmostEqual(load.mb_per_s, load.bytes / 1e6 / load.seconds)
+        self.assertEqual(instrumentation.registry.get('periodic.calc_vectors').frames, data.shape[0])
+        self.assertEqual(instrumentation.registry.get('error_estimation.block_average_range').items, 100)
+        self.assertEqual([stats.name for stats in instrumentation.registry.stages('file_io.')], ['file_io.load_xvg'])
+
+    def test_metrics_never_fail_a_call(self):
+        instrumentation.enable()
+        path = file_prefix + '/data_3D.xvg'
+        with open(path) as fin:
+            data = file_io.load_xvg(io.StringIO(fin.read()))
+        np.testing.assert_array_equal(data, file_io.load_xvg(path))
+
+        @instrumentation.instrument(name='test.failing_metric', items=lambda call: call['result'].size)
+        def failing(x):
+            return x
+
+        self.assertEqual(failing(1), 1)
+        load = instrumentation.registry.get('file_io.load_xvg')
+        self.assertEqual(load.bytes, os.path.getsize(path))
+        self.assertEqual(load.frames, 2 * data.shape[0])
+        self.assertEqual(instrumentation.registry.get('test.failing_metric').items, 0)
+
+    def test_stage_and_exports(self):
+        instrumentation.enable()
+        with instrumentation.stage('test.outer', nbytes=2 * 10 ** 6) as current:
+            time.sleep(0.01)
+            current.add(frames=5)
+        stats = instrumentation.registry.get('test.outer')
+        self.assertGreaterEqual(stats.seconds, 0.01)
+        self.assertEqual(stats.frames, 5)
+        self.assertIsNone(stats.peak_bytes)
+
+        exported = json.loads(instrumentation.registry.to_json())
+        self.assertEqual(exported['stages']['test.outer']['bytes'], 2 * 10 ** 6)
+        summary = instrumentation.registry.summary().splitlines()
+        self.assertEqual(len(summary), 2)
+        self.assertTrue(summary[1].startswith('test.outer'))
+
+    def test_peak_memory_of_nested_stages(self):
+        instrumentation.enable(track_memory=True)
+        with instrumentation.stage('test.outer'):
+            with instrumentation.stage('test.inner'):
+                big = np.ones(2 ** 20)   # 8 MB
+                del big
+            small = np.ones(2 ** 17)     # 1 MB, allocated after the inner peak was reset
+            del small
+        inner = instrumentation.registry.get('test.inner').peak_bytes
+        outer = instrumentation.registry.get('test.outer').peak_bytes
+        self.assertGreaterEqual(inner, 8 * 2 ** 20)
+        self.assertLess(inner, 9 * 2 ** 20)
+        # the outer stage keeps the inner stage's peak
+        self.assertGreaterEqual(outer, inner)
+        instrumentation.disable()
+        self.assertFalse(instrumentation.is_enabled())
+
+    def test_disabled_overhead(self):
+        @instrumentation.instrument(items=lambda call: call['x'])
+        def wrapped(x):
+            return x
+
+        def plain(x):
+            return x
+
+        def best_time(func):
+            best = np.inf
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(10000):
+                    func(1)
+                best = min(best, time.perf_counter() - start)
+            return best / 10000
+
+        # a flag check and one extra call - well under a microsecond, against milliseconds for the wrapped functions
+        self.assertLess(best_time(wrapped) - best_time(plain), 2e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import KB_python.trajectory_io as trajectory_io
+
+file_prefix = './test_ref_data/trajectory_io'
+
+
+def expected_coords():
+    ''' Formula the reference trajectories were written from - 4 frames, 30 particles in groups of 3 '''
+    frame = np.arange(4)[:, None, None]
+    atom = np.arange(30)[None, :, None]
+    dim = np.arange(3)[None, None, :]
+    return (2.5 + 2 * np.sin(0.37 * (atom // 3) + 0.05 * frame + dim) + (atom % 3) * 0.08 + 0.01 * dim).astype(
+            np.float32)
+
+
+class test_trr(unittest.TestCase):
+    def test_reads_frames(self):
+        coords, times, boxdims = trajectory_io.load_trajectory(file_prefix + '/traj.trr')
+        self.assertEqual(coords.shape, (4, 30, 3))
+        np.testing.assert_array_equal(coords, expected_coords())
+        np.testing.assert_allclose(times, [0, 10, 20, 30])
+        np.testing.assert_allclose(boxdims[:, 0], [5.0, 5.1, 5.2, 5.3], rtol=1e-6)
+        self.assertEqual(boxdims.shape, (4, 3))
+
+    def test_random_access(self):
+        trajectory = trajectory_io.XdrTrajectory(file_prefix + '/traj.trr')
+        self.assertEqual(len(trajectory), 4)
+        self.assertEqual(trajectory.n_particles, 30)
+        coords, times, _ = trajectory.read(2, 4)
+        np.testing.assert_array_equal(coords, expected_coords()[2:4])
+        np.testing.assert_allclose(times, [20, 30])
+
+
+class test_xtc(unittest.TestCase):
+    def test_reads_frames(self):
+        coords, times, boxdims = trajectory_io.load_trajectory(file_prefix + '/traj.xtc')
+        self.assertEqual(coords.shape, (4, 30, 3))
+        np.testing.assert_allclose(coords, expected_coords(), atol=6e-4)   # xtc precision is 0.001 nm
+        np.testing.assert_allclose(times, [0, 10, 20, 30])
+        np.testing.assert_allclose(boxdims[:, 2], [5.0, 5.1, 5.2, 5.3], rtol=1e-6)
+
+    def test_chunks_match_full_read(self):
+        coords, times, boxdims = trajectory_io.load_trajectory(file_prefix + '/traj.xtc')
+        chunks = list(trajectory_io.iter_trajectory(file_prefix + '/traj.xtc', chunk_frames=3))
+        self.assertEqual([chunk[0].shape[0] for chunk in chunks], [3, 1])
+        np.testing.assert_array_equal(np.concatenate([chunk[0] for chunk in chunks]), coords)
+        np.testing.assert_array_equal(np.concatenate([chunk[2] for chunk in chunks]), boxdims)
+
+    def test_truncated_file_and_offset_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            truncated = os.path.join(tmpdir, 'truncated.xtc')
+            with open(file_prefix + '/traj.xtc', 'rb') as fin, open(truncated, 'wb') as fout:
+                fout.write(fin.read()[:-10])
+            trajectory = trajectory_io.XdrTrajectory(truncated, cache=tmpdir)
+            self.assertEqual(len(trajectory), 3)
+            cached = trajectory_io.XdrTrajectory(truncated, cache=tmpdir)
+            np.testing.assert_array_equal(cached.offsets, trajectory.offsets)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_not_a_trajectory(self):
+        self.assertRaises(ValueError, trajectory_io.XdrTrajectory, './test_ref_data/file_io/data_1D.xvg')
+
+
+if __name__ == '__main__':
+    unittest.main()
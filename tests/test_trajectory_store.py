@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import KB_python.file_io as file_io
+import KB_python.trajectory_io as trajectory_io
+import KB_python.trajectory_store as trajectory_store
+import KB_python.coordinate_manipulation.angles as angles
+import KB_python.coordinate_manipulation.periodic as periodic
+
+file_prefix = './test_ref_data'
+
+
+class test_trajectory_store(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.coords = rng.uniform(0, 5, (23, 12, 3))
+        self.boxdims = np.tile([5.0, 5.0, 5.0], (23, 1))
+        self.times = np.arange(23) * 2.0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        path = os.path.join(self.tmpdir, 'traj.kbs')
+        store = trajectory_store.write_store(path, self.coords, self.times, self.boxdims, dtype=np.float64,
+                                             block_frames=5)
+        self.assertEqual(len(store), 23)
+        self.assertEqual(store.frame_shape, (12, 3))
+        coords, times, boxdims = store.read()
+        np.testing.assert_array_equal(coords, self.coords)
+        np.testing.assert_array_equal(times, self.times)
+        np.testing.assert_array_equal(boxdims, self.boxdims)
+        coords, times, _ = store.read(3, 20, 4)
+        np.testing.assert_array_equal(coords, self.coords[3:20:4])
+        np.testing.assert_array_equal(times, self.times[3:20:4])
+        # blocks plus the header, with the last block padded
+        record_bytes = 5 * (8 + 8 * 36 + 8 * 3)
+        self.assertEqual(os.path.getsize(path), trajectory_store.HEADER_BYTES + 5 * record_bytes)
+
+    def test_float32_chunks_are_memory_map_views(self):
+        path = os.path.join(self.tmpdir, 'traj.kbs')
+        trajectory_store.write_store(path, self.coords, boxdims=[5.0, 5.0, 5.0], block_frames=10)
+        with trajectory_store.TrajectoryStore(path) as store:
+            self.assertEqual(store.dtype, np.float32)
+            chunks = list(store.iter_chunks())
+            self.assertEqual([chunk[0].shape[0] for chunk in chunks], [10, 10, 3])
+            self.assertTrue(all(isinstance(chunk[0], np.memmap) for chunk in chunks))
+            np.testing.assert_array_equal(chunks[2][1], [20, 21, 22])   # frame numbers when no times are given
+            # chunks crossing blocks are copied, but come out the same
+            coords = np.concatenate([chunk[0] for chunk in store.iter_chunks(7, start=2)])
+            np.testing.assert_array_equal(coords, self.coords[2:].astype(np.float32))
+
+    def test_from_xvg_and_trajectory(self):
+        xvg_file = file_prefix + '/file_io/data_3D.xvg'
+        store = trajectory_store.xvg_to_store(xvg_file, os.path.join(self.tmpdir, 'xvg.kbs'), boxdims=[4, 4, 4],
+                                              dtype=np.float64, chunk_frames=4, block_frames=3)
+        coords, times = file_io.load_xvg(xvg_file, return_time_data=True)
+        stored_coords, stored_times, boxdims = store.read()
+        np.testing.assert_array_equal(stored_coords, coords)
+        np.testing.assert_array_equal(stored_times, times)
+        self.assertTrue(np.all(boxdims == 4))
+
+        trr_file = file_prefix + '/trajectory_io/traj.trr'
+        store = trajectory_store.trajectory_to_store(trr_file, os.path.join(self.tmpdir, 'trr.kbs'), chunk_frames=3)
+        for stored, expected in zip(store.read(), trajectory_io.load_trajectory(trr_file)):
+            np.testing.assert_allclose(stored, expected, rtol=1e-6)
+
+    def test_map_frames(self):
+        store = trajectory_store.write_store(os.path.join(self.tmpdir, 'traj.kbs'), self.coords, self.times,
+                                             self.boxdims, dtype=np.float64, block_frames=4)
+        triples = np.array([[0, 1, 2], [3, 4, 5], [9, 10, 11]])
+        out = trajectory_store.map_frames(lambda coords, boxdims: angles.compute_angles(coords, triples,
+                                                                                         boxdims=boxdims),
+                                          store, os.path.join(self.tmpdir, 'angles.kbs'))
+        self.assertFalse(out.has_boxdims)
+        result, times, _ = out.read()
+        np.testing.assert_allclose(result, angles.compute_angles(self.coords, triples, boxdims=self.boxdims))
+        np.testing.assert_array_equal(times, self.times)
+
+        vectors = trajectory_store.map_frames(lambda coords, boxdims: periodic.calc_vectors(coords[:, :6],
+                                              coords[:, 6:], boxdims), store, chunk_frames=5)
+        np.testing.assert_allclose(vectors, periodic.calc_vectors(self.coords[:, :6], self.coords[:, 6:],
+                                                                  self.boxdims))
+
+    def test_failed_writes_leave_nothing(self):
+        path = os.path.join(self.tmpdir, 'out.kbs')
+        store = trajectory_store.write_store(os.path.join(self.tmpdir, 'traj.kbs'), self.coords, block_frames=4)
+        with self.assertRaises(ValueError):
+            trajectory_store.map_frames(lambda coords, boxdims: coords[:1], store, path)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['traj.kbs'])
+        with self.assertRaises(ValueError):
+            trajectory_store.TrajectoryStore(file_prefix + '/file_io/data_3D.xvg')
+
+
+if __name__ == '__main__':
+    unittest.main()
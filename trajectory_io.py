@@ -0,0 +1,289 @@
+import os
+
+import numpy as np
+
+from . import file_io
+from . import instrumentation
+
+'''
+    Readers for gromacs binary trajectories (.trr, uncompressed, and .xtc, compressed), so coordinates don't have to be
+    exported to xvg text first. Both are XDR (big endian) formats, read here with plain numpy. Coordinates come out in
+    the same n_frames * n_particles * n_dims layout as file_io.xvg_2_coords, with boxdims as n_frames * 3 box lengths,
+    ready for periodic.calc_vectors. Only the diagonal of the box is returned, so triclinic boxes are not supported.
+
+    Frames are located by a quick scan of the frame headers, after which any range of frames can be read without
+    decoding the frames before it. TRR frames are read straight into numpy arrays. XTC frames have to be unpacked bit by
+    bit, which is done in python and is much slower per frame than TRR.
+'''
+
+TRR_MAGIC = 1993
+XTC_MAGIC = 1995
+
+# xtc compression tables, from the gromacs xdrfile library
+_XTC_MAGICINTS = (0, 0, 0, 0, 0, 0, 0, 0, 0, 8, 10, 12, 16, 20, 25, 32, 40, 50, 64, 80, 101, 128, 161, 203, 256, 322, 406,
+                  512, 645, 812, 1024, 1290, 1625, 2048, 2580, 3250, 4096, 5060, 6501, 8192, 10321, 13003, 16384, 20642,
+                  26007, 32768, 41285, 52015, 65536, 82570, 104031, 131072, 165140, 208063, 262144, 330280, 416127,
+                  524287, 660561, 832255, 1048576, 1321122, 1664510, 2097152, 2642245, 3329021, 4194304, 5284491,
+                  6658042, 8388607, 10568983, 13316085, 16777216)
+_XTC_FIRSTIDX = 9
+_XTC_HEADER_BYTES = 92    # frame header, box, precision and compression parameters before the compressed data
+
+# trr header - magic, version string length, xdr string length, version string, then 13 ints and 2 reals
+_TRR_VERSION_BYTES = 24
+_TRR_SIZE_NAMES = ('ir_size', 'e_size', 'box_size', 'vir_size', 'pres_size', 'top_size', 'sym_size', 'x_size', 'v_size',
+                   'f_size', 'natoms', 'step', 'nre')
+
+
+class XdrTrajectory:
+    ''' Random access reader for a gromacs .trr or .xtc file.
+
+        Parameters
+            file  - path to the trajectory. The format is taken from the magic number of the first frame
+            cache - False, True or a cache directory. Stores the frame offset index in a sidecar so later opens skip
+                    the header scan, see file_io.load_xvg
+
+        Attributes
+            offsets     - n_frames array of byte offsets of each frame
+            n_frames    - number of frames
+            n_particles - number of particles per frame
+    '''
+
+    def __init__(self, file, cache=False):
+        self.file = file
+        with open(file, 'rb') as fin:
+            magic, natoms = np.frombuffer(fin.read(8), dtype='>i4')
+            if magic == TRR_MAGIC:
+                self.format = 'trr'
+                fin.seek(0)
+                natoms = _read_trr_header(fin)[0]['natoms']
+            elif magic == XTC_MAGIC:
+                self.format = 'xtc'
+            else:
+                raise ValueError("{} is not a trr or xtc file, magic number {}".format(file, magic))
+        self.offsets = file_io._cached_load(file, cache, ('xdr_offsets',), self._scan_offsets)
+        self.n_frames = self.offsets.size
+        self.n_particles = int(natoms)
+
+    def __len__(self):
+        return self.n_frames
+
+    def _scan_offsets(self):
+        ''' Walks the frame headers, using the sizes stored in each to jump to the next '''
+        file_size = os.path.getsize(self.file)
+        offsets = []
+        offset = 0
+        with open(self.file, 'rb') as fin:
+            while offset < file_size:
+                fin.seek(offset)
+                if self.format == 'trr':
+                    header, header_bytes, _ = _read_trr_header(fin)
+                    frame_bytes = header_bytes + sum(header[name] for name in _TRR_SIZE_NAMES[:10])
+                else:
+                    frame_bytes = _xtc_frame_bytes(fin.read(_XTC_HEADER_BYTES))
+                if offset + frame_bytes > file_size:
+                    break    # truncated last frame, e.g. from a crashed run
+                offsets.append(offset)
+                offset += frame_bytes
+        return np.array(offsets, dtype=np.int64)
+
+    @instrumentation.instrument(frames=lambda call: call['result'][0].shape[0])
+    def read(self, start=0, stop=None, stride=1):
+        ''' Reads frames start:stop:stride
+
+            Returns
+                coords  - n_frames * n_particles * 3 array, in nm
+                times   - n_frames array of times, in ps
+                boxdims - n_frames * 3 array of box lengths
+        '''
+        frame_offsets = self.offsets[start:stop:stride]
+        n_frames = frame_offsets.size
+        coords = None
+        times = np.zeros(n_frames)
+        boxdims = np.zeros((n_frames, 3))
+        with open(self.file, 'rb') as fin:
+            for index, offset in enumerate(frame_offsets):
+                fin.seek(offset)
+                if self.format == 'trr':
+                    frame_coords, times[index], box = _read_trr_frame(fin)
+                else:
+                    frame_coords, times[index], box = _read_xtc_frame(fin)
+                if coords is None:
+                    coords = np.zeros((n_frames, self.n_particles, 3), dtype=frame_coords.dtype)
+                coords[index] = frame_coords
+                boxdims[index] = np.diag(box)
+        if coords is None:
+            coords = np.zeros((0, self.n_particles, 3), dtype=np.float32)
+        return coords, times, boxdims
+
+    def iter_chunks(self, chunk_frames=1000, start=0, stop=None):
+        ''' Yields (coords, times, boxdims) for frames start:stop, chunk_frames at a time, see read '''
+        start, stop, _ = slice(start, stop).indices(self.n_frames)
+        for chunk_start in range(start, stop, chunk_frames):
+            yield self.read(chunk_start, min(chunk_start + chunk_frames, stop))
+
+
+def load_trajectory(file, start=0, stop=None, stride=1):
+    ''' Loads frames from a .trr or .xtc file. Returns coords, times, boxdims - see XdrTrajectory.read '''
+    return XdrTrajectory(file).read(start, stop, stride)
+
+
+def iter_trajectory(file, chunk_frames=1000, start=0, stop=None, cache=False):
+    ''' Streams a .trr or .xtc file in chunks of chunk_frames frames, yielding (coords, times, boxdims) '''
+    return XdrTrajectory(file, cache=cache).iter_chunks(chunk_frames, start, stop)
+
+
+# ----------------------------------------------
+# trr
+# ----------------------------------------------
+def _read_trr_header(fin):
+    ''' Returns (dictionary of header sizes, header length in bytes, real dtype) for the frame at the file position '''
+    version = np.frombuffer(fin.read(_TRR_VERSION_BYTES), dtype='>i4')
+    if version[0] != TRR_MAGIC:
+        raise ValueError("bad trr frame magic number {}".format(version[0]))
+    sizes = np.frombuffer(fin.read(4 * len(_TRR_SIZE_NAMES)), dtype='>i4')
+    header = dict(zip(_TRR_SIZE_NAMES, sizes.tolist()))
+
+    # single or double precision, from whichever block is present
+    if header['box_size']:
+        real_bytes = header['box_size'] // 9
+    elif header['natoms']:
+        real_bytes = max(header['x_size'], header['v_size'], header['f_size']) // (3 * header['natoms'])
+    else:
+        real_bytes = 4
+    real = np.dtype('>f4') if real_bytes == 4 else np.dtype('>f8')
+    header['time'], header['lambda'] = np.frombuffer(fin.read(2 * real.itemsize), dtype=real)
+    return header, _TRR_VERSION_BYTES + 4 * len(_TRR_SIZE_NAMES) + 2 * real.itemsize, real
+
+
+def _read_trr_frame(fin):
+    header, _, real = _read_trr_header(fin)
+    if not header['x_size']:
+        raise ValueError("trr frame at step {} contains no coordinates".format(header['step']))
+    fin.seek(header['ir_size'] + header['e_size'], os.SEEK_CUR)
+    box = np.zeros((3, 3))
+    if header['box_size']:
+        box = np.frombuffer(fin.read(header['box_size']), dtype=real).reshape(3, 3)
+    fin.seek(header['vir_size'] + header['pres_size'] + header['top_size'] + header['sym_size'], os.SEEK_CUR)
+    coords = np.frombuffer(fin.read(header['x_size']), dtype=real).reshape(header['natoms'], 3)
+    return coords.astype(real.newbyteorder('=')), header['time'], box
+
+
+# ----------------------------------------------
+# xtc
+# ----------------------------------------------
+def _xtc_frame_bytes(header):
+    ''' Length of an xtc frame, from its first _XTC_HEADER_BYTES bytes '''
+    natoms = int(np.frombuffer(header[4:8], dtype='>i4')[0])
+    if natoms <= 9:
+        return 56 + 12 * natoms   # small frames are stored uncompressed
+    n_bytes = int(np.frombuffer(header[88:92], dtype='>i4')[0])
+    return _XTC_HEADER_BYTES + 4 * ((n_bytes + 3) // 4)
+
+
+def _read_xtc_frame(fin):
+    header = fin.read(56)
+    natoms, step = np.frombuffer(header[4:12], dtype='>i4')
+    time = float(np.frombuffer(header[12:16], dtype='>f4')[0])
+    box = np.frombuffer(header[16:52], dtype='>f4').reshape(3, 3).astype(float)
+    if natoms <= 9:
+        coords = np.frombuffer(fin.read(12 * natoms), dtype='>f4').reshape(natoms, 3)
+        return coords.astype(np.float32), time, box
+
+    parameters = fin.read(_XTC_HEADER_BYTES - 56)
+    precision = np.frombuffer(parameters[0:4], dtype='>f4')[0]
+    minint = np.frombuffer(parameters[4:16], dtype='>i4').tolist()
+    maxint = np.frombuffer(parameters[16:28], dtype='>i4').tolist()
+    smallidx, n_bytes = np.frombuffer(parameters[28:36], dtype='>i4').tolist()
+    ints = _xtc_decompress(fin.read(n_bytes), int(natoms), minint, maxint, smallidx)
+    coords = ints.astype(np.float32) * np.float32(1.0 / precision)
+    return coords, time, box
+
+
+class _BitReader:
+    ''' Reads big endian bit fields from a byte string, the way the xtc compressor packs them '''
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0    # in bits
+
+    def bits(self, n_bits):
+        start = self.position
+        self.position = end = start + n_bits
+        value = int.from_bytes(self.data[start >> 3:(end + 7) >> 3], 'big')
+        return (value >> (-end & 7)) & ((1 << n_bits) - 1)
+
+    def ints(self, n_bits, sizes):
+        ''' Unpacks 3 integers that were packed together as one n_bits wide mixed radix number '''
+        n_full_bytes, n_last_bits = divmod(n_bits, 8)
+        if not n_last_bits:
+            n_full_bytes, n_last_bits = n_full_bytes - 1, 8
+        packed = 0
+        for byte in range(n_full_bytes):   # least significant byte first
+            packed |= self.bits(8) << (8 * byte)
+        packed |= self.bits(n_last_bits) << (8 * n_full_bytes)
+        packed, z = divmod(packed, sizes[2])
+        x, y = divmod(packed, sizes[1])
+        return x, y, z
+
+
+def _xtc_decompress(data, natoms, minint, maxint, smallidx):
+    ''' Port of xdrfile_decompress_coord_float from the gromacs xdrfile library. Returns natoms * 3 integer array '''
+    magicints = _XTC_MAGICINTS
+    sizeint = [maxint[d] - minint[d] + 1 for d in range(3)]
+    if any(size > 0xffffff for size in sizeint):
+        bitsizeint = [min(size.bit_length(), 32) for size in sizeint]
+        bitsize = 0     # too large to pack together, each coordinate stored separately
+    else:
+        bitsize = (sizeint[0] * sizeint[1] * sizeint[2]).bit_length()
+
+    smaller = magicints[max(_XTC_FIRSTIDX, smallidx - 1)] // 2
+    smallnum = magicints[smallidx] // 2
+    sizesmall = [magicints[smallidx]] * 3
+
+    reader = _BitReader(data)
+    output = np.zeros((natoms, 3), dtype=np.int64)
+    atom = 0
+    run = 0
+    while atom < natoms:
+        if bitsize == 0:
+            coord = [reader.bits(bitsizeint[d]) for d in range(3)]
+        else:
+            coord = list(reader.ints(bitsize, sizeint))
+        coord = [coord[d] + minint[d] for d in range(3)]
+
+        is_smaller = 0
+        if reader.bits(1):
+            run = reader.bits(5)
+            is_smaller = run % 3
+            run -= is_smaller
+            is_smaller -= 1
+
+        if run > 0:
+            previous = coord
+            for k in range(0, run, 3):
+                small = reader.ints(smallidx, sizesmall)
+                coord = [previous[d] + small[d] - smallnum for d in range(3)]
+                if k == 0:
+                    # the first two atoms of a run are swapped by the compressor, for better compression of water
+                    output[atom] = coord
+                    coord = previous
+                    atom += 1
+                else:
+                    previous = coord
+                output[atom] = coord
+                atom += 1
+                if k == 0:
+                    previous = output[atom - 2].tolist()
+        else:
+            output[atom] = coord
+            atom += 1
+
+        smallidx += is_smaller
+        if is_smaller < 0:
+            smallnum = smaller
+            smaller = magicints[smallidx - 1] // 2 if smallidx > _XTC_FIRSTIDX else 0
+        elif is_smaller > 0:
+            smaller = smallnum
+            smallnum = magicints[smallidx] // 2
+        sizesmall = [magicints[smallidx]] * 3
+    return output
@@ -0,0 +1,363 @@
+import json
+import os
+
+import numpy as np
+
+from . import file_io
+from . import instrumentation
+from . import trajectory_io
+
+'''
+    On-disk trajectory store for data larger than memory. A store file is a fixed size header followed by blocks of
+    block_frames frames, each block holding the times, coordinates and (optionally) box dimensions of its frames next to
+    each other, so a block is one contiguous read. The blocks are opened with np.memmap - reading a chunk of frames that
+    lies within one block returns a view of the file without copying, and only the pages actually touched are loaded.
+
+    Stores can be written from in-memory arrays (any file_io or trajectory_io loader output, write_store), streamed
+    straight from an xvg or gromacs trajectory (xvg_to_store, trajectory_to_store), or built chunk by chunk with
+    TrajectoryStoreWriter. map_frames runs an analysis (calc_vectors, compute_angles, superpose) over a store a chunk
+    at a time and writes the results to another store, so memory use is set by the chunk size, not the trajectory.
+
+    Frames don't have to be coordinates - a store holds any n_frames * frame_shape array, eg n_frames * n_angles from
+    compute_angles, with its times.
+
+    File layout
+        header - HEADER_BYTES bytes, MAGIC then a json dictionary padded with spaces
+        blocks - n_blocks records of (times float64 * block_frames, data * block_frames * frame_shape,
+                 boxdims * block_frames * box_dims if the store has box dimensions). The last block is padded to
+                 block_frames frames
+'''
+
+MAGIC = b'KBTSTORE'
+VERSION = 1
+HEADER_BYTES = 4096
+
+# target size of a block when block_frames isn't given
+BLOCK_BYTES = 2 ** 26
+
+
+class TrajectoryStore:
+    ''' Read access to a store file. Mirrors trajectory_io.XdrTrajectory - read and iter_chunks return
+        (coords, times, boxdims) with boxdims None when the store has no box dimensions.
+
+        Parameters
+            path - store file
+            mode - 'r' for read only, 'r+' to allow modifying frames in place through the views from iter_chunks
+
+        Attributes
+            n_frames     - number of frames
+            frame_shape  - shape of one frame, (n_particles, dims) for coordinates
+            n_particles  - frame_shape[0]
+            dtype        - dtype of the frame data and box dimensions
+            block_frames - frames per block on disk
+            has_boxdims  - whether box dimensions are stored
+    '''
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        with open(path, 'rb') as fin:
+            header = fin.read(HEADER_BYTES)
+        if not header.startswith(MAGIC):
+            raise ValueError("{} is not a trajectory store".format(path))
+        header = json.loads(header[len(MAGIC):].decode())
+        if header['version'] > VERSION:
+            raise ValueError("{} was written by a newer version ({}) of trajectory_store".format(path,
+                                                                                              header['version']))
+        self.n_frames = header['n_frames']
+        self.frame_shape = tuple(header['frame_shape'])
+        self.n_particles = self.frame_shape[0] if self.frame_shape else 1
+        self.dtype = np.dtype(header['dtype'])
+        self.block_frames = header['block_frames']
+        self.has_boxdims = header['has_boxdims']
+        self.box_dims = header['box_dims']
+        self._record = _record_dtype(self.frame_shape, self.dtype, self.block_frames, self.has_boxdims, self.box_dims)
+        n_blocks = -(-self.n_frames // self.block_frames)
+        if n_blocks:
+            self._blocks = np.memmap(path, dtype=self._record, mode=mode, offset=HEADER_BYTES, shape=(n_blocks,))
+        else:
+            self._blocks = np.zeros(0, dtype=self._record)
+
+    def __len__(self):
+        return self.n_frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        ''' Releases the memory map. Views returned earlier stay valid until they are deleted '''
+        if isinstance(self._blocks, np.memmap):
+            self._blocks.flush()
+        self._blocks = np.zeros(0, dtype=self._record)
+        self.n_frames = 0
+
+    def read(self, start=0, stop=None, stride=1):
+        ''' Copies frames start:stop:stride into memory, returns (coords, times, boxdims) '''
+        frames = np.arange(self.n_frames)[start:stop:stride]
+        blocks, offsets = np.divmod(frames, self.block_frames)
+        boxdims = self._blocks['boxdims'][blocks, offsets] if self.has_boxdims else None
+        return self._blocks['data'][blocks, offsets], self._blocks['times'][blocks, offsets], boxdims
+
+    def iter_chunks(self, chunk_frames=None, start=0, stop=None):
+        ''' Yields (coords, times, boxdims) for frames start:stop, chunk_frames at a time. Chunks within one block -
+            every chunk when chunk_frames divides block_frames, the default - are memory mapped views of the file,
+            anything else is copied with read.
+        '''
+        chunk_frames = chunk_frames or self.block_frames
+        start, stop, _ = slice(start, stop).indices(self.n_frames)
+        mapped_block, record = None, None
+        for chunk_start in range(start, stop, chunk_frames):
+            n_chunk = min(chunk_frames, stop - chunk_start)
+            block, offset = divmod(chunk_start, self.block_frames)
+            if offset + n_chunk <= self.block_frames:
+                # each block gets a map of its own, unmapped once its chunks are dropped - pages touched through one
+                # map of the whole file would stay in the process's resident memory until the end of the pass
+                if not block == mapped_block:
+                    mapped_block = block
+                    record = np.memmap(self.path, dtype=self._record, mode=self.mode, shape=(1,),
+                                       offset=HEADER_BYTES + block * self._record.itemsize)
+                frames = slice(offset, offset + n_chunk)
+                boxdims = record['boxdims'][0, frames] if self.has_boxdims else None
+                yield record['data'][0, frames], record['times'][0, frames], boxdims
+            else:
+                yield self.read(chunk_start, chunk_start + n_chunk)
+
+
+class TrajectoryStoreWriter:
+    ''' Writes a store a chunk of frames at a time, holding at most one block in memory. The file is written under a
+        temporary name and only moved into place by close, so an interrupted run never leaves a partial store.
+
+            with TrajectoryStoreWriter('traj.kbs', (n_particles, 3)) as writer:
+                for coords, times, boxdims in trajectory_io.iter_trajectory('traj.xtc'):
+                    writer.append(coords, times, boxdims)
+
+        Parameters
+            path         - store file to write
+            frame_shape  - shape of one frame, eg (n_particles, 3)
+            dtype        - dtype to store frames and box dimensions in. float32 halves the size of float64 data
+            block_frames - frames per block. Defaults to about BLOCK_BYTES per block
+            has_boxdims  - whether box dimensions are stored with the frames
+            box_dims     - number of box dimensions per frame
+    '''
+
+    def __init__(self, path, frame_shape, dtype=np.float32, block_frames=None, has_boxdims=True, box_dims=3):
+        self.path = path
+        self.frame_shape = tuple(int(size) for size in frame_shape)
+        self.dtype = np.dtype(dtype)
+        if block_frames is None:
+            frame_bytes = self.dtype.itemsize * (int(np.prod(self.frame_shape)) + box_dims * has_boxdims) + 8
+            block_frames = max(1, BLOCK_BYTES // frame_bytes)
+        self.block_frames = int(block_frames)
+        self.has_boxdims = has_boxdims
+        self.box_dims = box_dims
+        self.n_frames = 0
+        self._block = np.zeros(1, dtype=_record_dtype(self.frame_shape, self.dtype, self.block_frames, has_boxdims,
+                                                      box_dims))[0]
+        self._filled = 0
+        self._tmp_path = path + '.tmp'
+        self._fout = open(self._tmp_path, 'wb')
+        self._fout.write(self._header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def append(self, coords, times=None, boxdims=None):
+        ''' Adds frames to the end of the store.
+
+            Parameters
+                coords  - n_frames * frame_shape array
+                times   - optional n_frames array of times. Defaults to the frame numbers
+                boxdims - n_frames * box_dims array, or a single box_dims vector for every frame. Required when the
+                          store has box dimensions
+        '''
+        coords = np.asarray(coords)
+        if not coords.shape[1:] == self.frame_shape:
+            raise ValueError("frames of shape {} don't match the store's frame shape {}".format(coords.shape[1:],
+                                                                                              self.frame_shape))
+        n_new = coords.shape[0]
+        if times is None:
+            times = np.arange(self.n_frames, self.n_frames + n_new, dtype=float)
+        if self.has_boxdims:
+            if boxdims is None:
+                raise ValueError("this store holds box dimensions, but none were given")
+            boxdims = np.broadcast_to(boxdims, (n_new, self.box_dims))
+
+        position = 0
+        while position < n_new:
+            n_copy = min(n_new - position, self.block_frames - self._filled)
+            target = slice(self._filled, self._filled + n_copy)
+            self._block['data'][target] = coords[position:position + n_copy]
+            self._block['times'][target] = times[position:position + n_copy]
+            if self.has_boxdims:
+                self._block['boxdims'][target] = boxdims[position:position + n_copy]
+            self._filled += n_copy
+            position += n_copy
+            if self._filled == self.block_frames:
+                self._write_block()
+        self.n_frames += n_new
+
+    def close(self):
+        ''' Writes the last, padded block and the final header, and moves the store into place. Returns the path '''
+        if self._filled:
+            self._block['data'][self._filled:] = 0
+            self._block['times'][self._filled:] = 0
+            if self.has_boxdims:
+                self._block['boxdims'][self._filled:] = 0
+            self._write_block()
+        self._fout.seek(0)
+        self._fout.write(self._header())
+        self._fout.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        ''' Stops writing and removes the partial store '''
+        self._fout.close()
+        os.remove(self._tmp_path)
+
+    def _write_block(self):
+        self._fout.write(self._block.tobytes())
+        self._filled = 0
+
+    def _header(self):
+        header = MAGIC + json.dumps({'version': VERSION, 'n_frames': self.n_frames, 'frame_shape': self.frame_shape,
+                                     'dtype': self.dtype.str, 'block_frames': self.block_frames,
+                                     'has_boxdims': self.has_boxdims, 'box_dims': self.box_dims}).encode()
+        return header.ljust(HEADER_BYTES)
+
+
+def _record_dtype(frame_shape, dtype, block_frames, has_boxdims, box_dims):
+    ''' One block on disk. Aligned, with times first, so every field of every block is aligned in the memory map '''
+    fields = [('times', np.float64, (block_frames,)), ('data', dtype, (block_frames,) + tuple(frame_shape))]
+    if has_boxdims:
+        fields.append(('boxdims', dtype, (block_frames, box_dims)))
+    return np.dtype(fields, align=True)
+
+
+def write_store(path, coords, times=None, boxdims=None, dtype=np.float32, block_frames=None):
+    ''' Writes in-memory frames, eg from file_io.load_xvg or trajectory_io.load_trajectory, to a store.
+
+        Parameters
+            path         - store file to write
+            coords       - n_frames * frame_shape array
+            times        - optional n_frames array of times
+            boxdims      - optional n_frames * 3 array, or a single 3 vector, of box dimensions
+            dtype        - stored dtype, see TrajectoryStoreWriter
+            block_frames - see TrajectoryStoreWriter
+        Returns
+            store        - the new TrajectoryStore, opened read only
+    '''
+    box_dims = 3 if boxdims is None else np.shape(boxdims)[-1]
+    with TrajectoryStoreWriter(path, coords.shape[1:], dtype=dtype, block_frames=block_frames,
+                               has_boxdims=boxdims is not None, box_dims=box_dims) as writer:
+        writer.append(coords, times, boxdims)
+    return TrajectoryStore(path)
+
+
+def xvg_to_store(xvg_file, path, dims=3, boxdims=None, dtype=np.float32, block_frames=None, chunk_frames=10000,
+                 particles=None, index_file=None):
+    ''' Streams an xvg file into a store with file_io.iter_xvg, so the xvg never has to fit in memory. xvg files have no
+        box dimensions - pass a constant box as boxdims if the store will be used with periodic functions.
+
+        Parameters
+            xvg_file     - path to xvg file
+            path         - store file to write
+            dims         - see file_io.load_xvg
+            boxdims      - optional box dimensions, a dims vector for every frame
+            chunk_frames - frames parsed at a time
+            particles    - optional particle selection, see file_io.load_xvg
+            index_file   - see file_io.load_xvg
+            dtype, block_frames - see TrajectoryStoreWriter
+        Returns
+            store        - the new TrajectoryStore, opened read only
+    '''
+    writer = None
+    for coords, times in file_io.iter_xvg(xvg_file, dims=dims, chunk_frames=chunk_frames, particles=particles,
+                                          index_file=index_file):
+        if writer is None:
+            writer = TrajectoryStoreWriter(path, coords.shape[1:], dtype=dtype, block_frames=block_frames,
+                                           has_boxdims=boxdims is not None, box_dims=dims)
+        writer.append(coords, times, boxdims)
+    if writer is None:
+        raise Exception("no frames found in {}".format(xvg_file))
+    writer.close()
+    return TrajectoryStore(path)
+
+
+def trajectory_to_store(trajectory_file, path, dtype=np.float32, block_frames=None, chunk_frames=1000):
+    ''' Streams a gromacs .trr or .xtc file into a store, with its times and box dimensions. See xvg_to_store '''
+    trajectory = trajectory_io.XdrTrajectory(trajectory_file)
+    with TrajectoryStoreWriter(path, (trajectory.n_particles, 3), dtype=dtype, block_frames=block_frames) as writer:
+        for coords, times, boxdims in trajectory.iter_chunks(chunk_frames):
+            writer.append(coords, times, boxdims)
+    return TrajectoryStore(path)
+
+
+def map_frames(func, store, out=None, chunk_frames=None, dtype=None, block_frames=None):
+    ''' Runs func over a store a chunk of frames at a time, as func(coords, boxdims) with boxdims None for stores
+        without box dimensions. func must return an array with one entry per frame of the chunk, eg
+
+            map_frames(lambda coords, boxdims: angles.compute_angles(coords, triples, boxdims=boxdims), store, out)
+            map_frames(lambda coords, boxdims: periodic.calc_vectors(coords[:, heads], coords[:, tails], boxdims),
+                       store, out)
+            map_frames(lambda coords, boxdims: transformations.superpose(coords, reference)[0], store, out)
+
+        Functions that need something from the whole trajectory (eg superpose's default first frame reference, or its
+        rmsf) have to be given it, as each chunk is processed on its own. Chunks are read only views of the store.
+
+        Parameters
+            func         - function of (coords, boxdims) returning a n_chunk_frames * result_shape array
+            store        - TrajectoryStore or path to one
+            out          - path of a store to write the results to, with the times of the input frames. If None, the
+                           results are returned as one in-memory array
+            chunk_frames - frames per call. Defaults to the store's block size, so chunks are never copied
+            dtype        - dtype of the output store. Defaults to the dtype of the results
+            block_frames - block size of the output store, see TrajectoryStoreWriter
+        Returns
+            results      - TrajectoryStore of the results opened read only, or an array if out is None
+    '''
+    if not isinstance(store, TrajectoryStore):
+        store = TrajectoryStore(store)
+    if not store.n_frames:
+        raise ValueError("store {} has no frames".format(store.path))
+
+    writer = None
+    results = None
+    position = 0
+    try:
+        with instrumentation.stage('trajectory_store.map_frames', frames=store.n_frames):
+            for coords, times, boxdims in store.iter_chunks(chunk_frames):
+                result = np.asarray(func(coords, boxdims))
+                if not result.shape[:1] == coords.shape[:1]:
+                    raise ValueError("func returned shape {} for a chunk of {} frames".format(result.shape,
+                                                                                            coords.shape[0]))
+                if out is None:
+                    if results is None:
+                        results = np.empty((store.n_frames,) + result.shape[1:], dtype=dtype or result.dtype)
+                    results[position:position + result.shape[0]] = result
+                else:
+                    if writer is None:
+                        writer = TrajectoryStoreWriter(out, result.shape[1:], dtype=dtype or result.dtype,
+                                                       block_frames=block_frames, has_boxdims=False)
+                    writer.append(result, times)
+                position += result.shape[0]
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if out is None:
+        return results
+    writer.close()
+    return TrajectoryStore(out)